@@ -0,0 +1,104 @@
+# aggregates.py - Materialised dashboard aggregates, computed once per data version
+
+import json
+import os
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Mapping, Optional, Tuple
+
+if TYPE_CHECKING:
+    import numpy as np
+    from analytics_engine import AnalyticsEngine
+
+# Bump when the persisted layout changes so stale files are recomputed
+AGGREGATES_SCHEMA = 1
+
+
+def aggregates_path(db_path: str) -> str:
+    """Aggregates are persisted next to the database file"""
+    return os.path.splitext(db_path)[0] + ".aggregates.json"
+
+
+class AggregateTables:
+    """Every aggregate the dashboard charts need, ready to plot"""
+
+    def __init__(self, version: str,
+                 age_counts: Dict[int, int],
+                 ethnicity_counts: Dict[str, int],
+                 postcode_counts: Dict[str, int],
+                 pair_counts: List[Tuple[Any, Any, int]],
+                 correlation: Dict[str, Dict[str, int]]):
+        self.version = version
+        self.age_counts = age_counts
+        self.ethnicity_counts = ethnicity_counts
+        self.postcode_counts = postcode_counts
+        self.pair_counts = pair_counts
+        self.correlation = correlation
+
+    @classmethod
+    def from_engine(cls, version: str, engine: "AnalyticsEngine",
+                    rows: Optional["np.ndarray"] = None) -> "AggregateTables":
+        """Aggregate every case, or only the case rows given"""
+        return cls(
+            version=version,
+            age_counts=engine.age_counts(rows),
+            ethnicity_counts=engine.ethnicity_counts(rows),
+            postcode_counts=engine.postcode_counts(rows),
+            pair_counts=engine.pair_counts(rows),
+            correlation=engine.correlation(rows),
+        )
+
+    def to_json(self) -> Dict[str, Any]:
+        """JSON-safe form (lists of pairs keep key types and order)"""
+        return {
+            "schema": AGGREGATES_SCHEMA,
+            "version": self.version,
+            "age_counts": [[age, count] for age, count in self.age_counts.items()],
+            "ethnicity_counts": [[name, count] for name, count in self.ethnicity_counts.items()],
+            "postcode_counts": [[pc, count] for pc, count in self.postcode_counts.items()],
+            "pair_counts": [list(row) for row in self.pair_counts],
+            "correlation": self.correlation,
+        }
+
+    @classmethod
+    def from_json(cls, payload: Mapping[str, Any]) -> "AggregateTables":
+        return cls(
+            version=payload["version"],
+            age_counts={int(age): count for age, count in payload["age_counts"]},
+            ethnicity_counts={name: count for name, count in payload["ethnicity_counts"]},
+            postcode_counts={pc: count for pc, count in payload["postcode_counts"]},
+            pair_counts=[tuple(row) for row in payload["pair_counts"]],
+            correlation=payload["correlation"],
+        )
+
+
+def load_persisted(path: str, version: str) -> Optional[AggregateTables]:
+    """Read persisted aggregates if they belong to this data version"""
+    try:
+        with open(path, "r") as f:
+            payload = json.load(f)
+        if payload.get("schema") == AGGREGATES_SCHEMA and payload.get("version") == version:
+            return AggregateTables.from_json(payload)
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    return None
+
+
+def persist(path: str, tables: AggregateTables) -> None:
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    try:
+        with open(tmp_path, "w") as f:
+            json.dump(tables.to_json(), f)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"Failed to persist aggregates: {e}")
+
+
+def load_or_compute(db_path: str, version: str,
+                    compute: Callable[[], AggregateTables]) -> AggregateTables:
+    """Use the persisted aggregates for this version, or compute and persist them"""
+    path = aggregates_path(db_path)
+    tables = load_persisted(path, version)
+    if tables is None:
+        tables = compute()
+        if version:
+            persist(path, tables)
+    return tables
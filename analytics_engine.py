@@ -0,0 +1,302 @@
+# analytics_engine.py - Vectorised cleaning and aggregation of victim/case data with pandas
+
+from collections.abc import Mapping
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from case_filters import EXACT_FILTERS, CaseFilter, filter_key
+from case_values import (MAX_AGE, MIN_AGE, MIN_POSTCODE_LENGTH, WHOLE_NUMBER, NoneType,
+                         first_record, is_mapping, iter_records, label_value)
+from config import Fields
+from dataset_metadata import case_ref
+
+
+def factorize(raw: pd.Series, exact: bool = True) -> Tuple[np.ndarray, List[Any]]:
+    """Integer code per row plus the distinct values, in first-seen order.
+
+    With exact=True, equal values of different types (1, 1.0, True) stay
+    distinct, as they do once converted with str(); otherwise they are merged
+    the way dict keys are.
+    """
+    values = raw.to_numpy(dtype=object)
+    if not exact or len(values) == 0:
+        codes, uniques = pd.factorize(values, use_na_sentinel=False)
+        return codes, list(uniques)
+
+    kinds = raw.map(type).to_numpy()
+    codes = np.empty(len(values), dtype=np.int64)
+    uniques: List[Any] = []
+    for kind in pd.unique(kinds):
+        mask = kinds == kind
+        if kind is NoneType:
+            # pandas would fold None into NaN
+            kind_codes, kind_uniques = np.zeros(int(mask.sum()), dtype=np.int64), [None]
+        else:
+            kind_codes, kind_uniques = pd.factorize(values[mask], use_na_sentinel=False)
+        codes[mask] = kind_codes + len(uniques)
+        uniques.extend(kind_uniques)
+
+    # Renumber so codes follow first appearance across all types
+    _, first_rows = np.unique(codes, return_index=True)
+    order = np.argsort(first_rows, kind="stable")
+    renumber = np.empty(len(order), dtype=np.int64)
+    renumber[order] = np.arange(len(order))
+    return renumber[codes], [uniques[i] for i in order]
+
+
+def clean_text(raw: pd.Series, upper: bool = False, min_length: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+    """Stripped string form of every non-blank value, cleaning each distinct value once.
+
+    Returns the cleaned values and the row position each one came from.
+    """
+    codes, uniques = factorize(raw)
+    distinct = pd.Series(uniques, dtype=object)
+    text = distinct.map(str).str.strip()
+    if upper:
+        text = text.str.upper()
+    keep = (distinct.map(type) != NoneType) & (text.str.len() >= min_length)
+    rows = np.flatnonzero(keep.to_numpy()[codes])
+    return text.to_numpy(dtype=object)[codes[rows]], rows
+
+
+def clean_ages(raw: pd.Series) -> Tuple[np.ndarray, np.ndarray]:
+    """Ages as int16, keeping the values int() accepts that fall in the age range.
+
+    Returns the ages and the row position each one came from.
+    """
+    kinds = raw.map(type)
+    # Numbers are truncated the way int() does; strings must be whole numbers
+    numbers = np.trunc(pd.to_numeric(raw[kinds.isin((int, float, bool))], errors="coerce"))
+    text = raw[kinds == str].str.strip()
+    whole = pd.to_numeric(text[text.str.fullmatch(WHOLE_NUMBER.pattern)], errors="coerce")
+    ages = pd.concat([numbers, whole]).sort_index()
+    ages = ages[(ages >= MIN_AGE) & (ages <= MAX_AGE)]
+    return ages.to_numpy(dtype=np.int16), ages.index.to_numpy(dtype=np.int64)
+
+
+def value_counts(values: np.ndarray) -> Dict[Any, int]:
+    """Number of occurrences of each value, in first-seen order"""
+    if len(values) == 0:
+        return {}
+    codes, uniques = pd.factorize(values, use_na_sentinel=False)
+    return dict(zip(uniques.tolist(), np.bincount(codes).tolist()))
+
+
+def pair_totals(left: np.ndarray, right: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Distinct (left, right) code pairs in first-seen order, with their row counts"""
+    width = int(right.max(initial=0)) + 1
+    codes, uniques = pd.factorize(left * width + right)
+    return uniques // width, uniques % width, np.bincount(codes, minlength=len(uniques))
+
+
+def concat_ranges(starts: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    """Indices start..start+length-1 for every (start, length), concatenated"""
+    ends = np.cumsum(lengths)
+    return np.repeat(starts - ends + lengths, lengths) + np.arange(ends[-1] if len(ends) else 0)
+
+
+class CaseColumn:
+    """Cleaned victim values grouped by case (CSR layout), so a case subset is sliced, not scanned"""
+
+    def __init__(self, values: np.ndarray, case_rows: np.ndarray, case_count: int):
+        self.values = values
+        # values[offsets[r]:offsets[r + 1]] belong to case row r
+        self.offsets = np.searchsorted(case_rows, np.arange(case_count + 1))
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def take(self, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Values for the given case rows (all values when rows is None)"""
+        if rows is None:
+            return self.values
+        starts = self.offsets[rows]
+        return self.values[concat_ranges(starts, self.offsets[rows + 1] - starts)]
+
+
+class CaseIndex:
+    """Secondary indexes over case fields: exact-match row buckets and a sorted offence-date index"""
+
+    def __init__(self, cases: pd.DataFrame):
+        self.case_count = len(cases)
+        self.buckets: Dict[str, Dict[str, np.ndarray]] = {}
+        self.choices: Dict[str, List[str]] = {}
+        for name in EXACT_FILTERS:
+            self.buckets[name], self.choices[name] = self._bucket(cases[name])
+
+        dates = pd.to_datetime(cases["offence_date"], errors="coerce").to_numpy()
+        known = np.flatnonzero(~np.isnat(dates))
+        self.date_rows = known[np.argsort(dates[known], kind="stable")]
+        self.sorted_dates = dates[self.date_rows]
+
+    @staticmethod
+    def _bucket(raw: pd.Series) -> Tuple[Dict[str, np.ndarray], List[str]]:
+        """Sorted case rows per normalised value, plus a display form of each value"""
+        codes, uniques = factorize(raw)
+        keys, key_codes = {}, []
+        display = {}
+        for value in uniques:
+            key = filter_key(value)
+            key_codes.append(keys.setdefault(key, len(keys)))
+            display.setdefault(key, str(value).strip())
+        if not keys:
+            return {}, []
+        row_keys = np.asarray(key_codes, dtype=np.int64)[codes]
+        order = np.argsort(row_keys, kind="stable")
+        splits = np.cumsum(np.bincount(row_keys, minlength=len(keys)))[:-1]
+        buckets = dict(zip(keys, np.split(order, splits)))
+        buckets.pop("", None)
+        return buckets, sorted((display[key] for key in buckets), key=str.casefold)
+
+    def select(self, case_filter: CaseFilter) -> np.ndarray:
+        """Sorted rows of the cases matching every part of the filter"""
+        candidates = [self.buckets[name].get(key, np.empty(0, dtype=np.int64))
+                      for name, key in case_filter.exact_matches().items()]
+        if case_filter.date_from or case_filter.date_to:
+            lo, hi = 0, len(self.sorted_dates)
+            if case_filter.date_from:
+                lo = np.searchsorted(self.sorted_dates, np.datetime64(case_filter.date_from), side="left")
+            if case_filter.date_to:
+                # Inclusive of the whole last day
+                end = np.datetime64(case_filter.date_to) + np.timedelta64(1, "D")
+                hi = np.searchsorted(self.sorted_dates, end, side="left")
+            candidates.append(np.sort(self.date_rows[lo:hi]))
+        if not candidates:
+            return np.arange(self.case_count)
+        # Intersect smallest first so a selective filter bounds the work
+        candidates.sort(key=len)
+        rows = candidates[0]
+        for other in candidates[1:]:
+            rows = np.intersect1d(rows, other, assume_unique=True)
+        return rows
+
+
+class AnalyticsEngine:
+    """Victim and case tables loaded into DataFrames once, with every cleaned column precomputed.
+
+    The victims frame has one row per victim record and the cases frame one row
+    per case, holding the raw database values; cleaning and grouping run as
+    vectorised pandas/NumPy operations over those columns. Every aggregate
+    takes optional case rows (from select()) to restrict it to matching cases.
+    """
+
+    def __init__(self, victims: pd.DataFrame, cases: pd.DataFrame):
+        self.victims = victims
+        self.cases = cases
+        case_count = len(cases)
+        victim_case = victims["case_row"].to_numpy(dtype=np.int64)
+        self.victim_offsets = np.searchsorted(victim_case, np.arange(case_count + 1))
+
+        ages, rows = clean_ages(victims["age"])
+        self.ages = CaseColumn(ages, victim_case[rows], case_count)
+        ethnicities, rows = clean_text(victims["ethnicity"])
+        self.ethnicities = CaseColumn(ethnicities, victim_case[rows], case_count)
+        postcodes, rows = clean_text(victims["postcode"], upper=True, min_length=MIN_POSTCODE_LENGTH)
+        self.postcodes = CaseColumn(postcodes, victim_case[rows], case_count)
+        self.index = CaseIndex(cases)
+        # Code per case of its Beaconport Ref (-1 when missing); a ref imported twice is one case
+        self.ref_codes, refs = pd.factorize(cases["ref"].to_numpy(dtype=object), use_na_sentinel=True)
+        self.ref_count = len(refs)
+
+    @classmethod
+    def build(cls, data: Mapping[str, Any]) -> "AnalyticsEngine":
+        """Flatten a database snapshot into victim and case frames"""
+        cases = list(data.get("cases", {}).values())
+        victim_pairs = [(row, victim) for row, case in enumerate(cases)
+                        for victim in iter_records(case, "victim_details")]
+        victim_case = [row for row, _ in victim_pairs]
+        victim_records = [victim for _, victim in victim_pairs]
+        main_records = [case.get("main") if is_mapping(case.get("main")) else None for case in cases]
+        case_records = [first_record(case, "case_data") for case in cases]
+        offence_records = [first_record(case, "offence_details") for case in cases]
+
+        def column(records: List[Optional[Mapping]], field: str) -> List[Any]:
+            return [record.get(field) if record else None for record in records]
+
+        victims = pd.DataFrame({"case_row": victim_case,
+                                "age": column(victim_records, Fields.VICTIM_AGE),
+                                "ethnicity": column(victim_records, Fields.VICTIM_ETHNICITY),
+                                "postcode": column(victim_records, Fields.VICTIM_POSTCODE)},
+                               dtype=object).astype({"case_row": np.int64})
+        case_frame = pd.DataFrame({"ref": [case_ref(case) for case in cases],
+                                   "digital": column(case_records, Fields.DIGITAL_OPPORTUNITIES),
+                                   "finalisation": column(offence_records, Fields.CRIME_FINALISATION),
+                                   "force_code": column(main_records, Fields.FORCE_CODE),
+                                   "allocated_to": column(main_records, Fields.ALLOCATED_TO),
+                                   "offence_type": column(offence_records, Fields.OFFENCE_TYPE),
+                                   "offence_date": column(offence_records, Fields.OFFENCE_DATE)},
+                                  dtype=object)
+        return cls(victims, case_frame)
+
+    def select(self, case_filter: Optional[CaseFilter]) -> Optional[np.ndarray]:
+        """Case rows matching the filter, or None for every case"""
+        if case_filter is None or case_filter.is_empty():
+            return None
+        return self.index.select(case_filter)
+
+    def case_count(self, rows: Optional[np.ndarray] = None) -> int:
+        """Number of distinct Beaconport Refs in the given cases, as counted for the whole dataset"""
+        if rows is None:
+            return self.ref_count
+        codes = self.ref_codes[rows]
+        return len(np.unique(codes[codes >= 0]))
+
+    def victim_count(self, rows: Optional[np.ndarray] = None) -> int:
+        """Number of victim records in the given cases"""
+        if rows is None:
+            return len(self.victims)
+        return int((self.victim_offsets[rows + 1] - self.victim_offsets[rows]).sum())
+
+    def age_counts(self, rows: Optional[np.ndarray] = None) -> Dict[int, int]:
+        """Number of victims at each age, in age order"""
+        ages, counts = np.unique(self.ages.take(rows), return_counts=True)
+        return dict(zip(ages.tolist(), counts.tolist()))
+
+    def ethnicity_counts(self, rows: Optional[np.ndarray] = None) -> Dict[str, int]:
+        return value_counts(self.ethnicities.take(rows))
+
+    def postcode_counts(self, rows: Optional[np.ndarray] = None) -> Dict[str, int]:
+        return value_counts(self.postcodes.take(rows))
+
+    def _both_present(self, rows: Optional[np.ndarray] = None) -> pd.DataFrame:
+        """Cases where both the digital and finalisation values exist"""
+        cases = self._cases(rows)
+        both = (cases["digital"].map(type) != NoneType) & (cases["finalisation"].map(type) != NoneType)
+        return cases[both]
+
+    def _cases(self, rows: Optional[np.ndarray]) -> pd.DataFrame:
+        return self.cases if rows is None else self.cases.iloc[rows]
+
+    def digital_vs_finalisation_pairs(self) -> Sequence[Tuple[Any, Any]]:
+        """(digital, finalisation) pairs for cases where both values exist"""
+        both = self._both_present()
+        return tuple(zip(both["digital"].tolist(), both["finalisation"].tolist()))
+
+    def pair_counts(self, rows: Optional[np.ndarray] = None) -> List[Tuple[Any, Any, int]]:
+        """(digital, finalisation, case_count) for each distinct pair, in first-seen order"""
+        both = self._both_present(rows)
+        digital_codes, digital_values = factorize(both["digital"], exact=False)
+        final_codes, final_values = factorize(both["finalisation"], exact=False)
+        digital, finalisation, counts = pair_totals(digital_codes, final_codes)
+        return [(digital_values[d], final_values[f], count)
+                for d, f, count in zip(digital.tolist(), finalisation.tolist(), counts.tolist())]
+
+    def correlation(self, rows: Optional[np.ndarray] = None) -> Dict[str, Dict[str, int]]:
+        """{finalisation: {digital: count}} over every case, with missing values as ''"""
+        def label_codes(raw: pd.Series) -> Tuple[np.ndarray, List[str]]:
+            # Label each distinct raw value once, then merge values that share a label
+            codes, uniques = factorize(raw)
+            labels = [label_value(value) for value in uniques]
+            label_codes, distinct_labels = pd.factorize(np.array(labels, dtype=object))
+            return label_codes[codes], list(distinct_labels)
+
+        cases = self._cases(rows)
+        final_codes, final_labels = label_codes(cases["finalisation"])
+        digital_codes, digital_labels = label_codes(cases["digital"])
+        finalisation, digital, counts = pair_totals(final_codes, digital_codes)
+        correlation: Dict[str, Dict[str, int]] = {}
+        for f, d, count in zip(finalisation.tolist(), digital.tolist(), counts.tolist()):
+            correlation.setdefault(final_labels[f], {})[digital_labels[d]] = count
+        return correlation
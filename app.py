@@ -1,12 +1,25 @@
 # app.py - Beaconport Data Application
 
+import multiprocessing
+import threading
 import time
-from flask import Flask, render_template, request, redirect, send_file, url_for, flash
+from urllib.parse import urlencode
+from flask import Flask, jsonify, render_template, request, redirect, send_file, url_for, flash
 
 # Import our services and utilities
 from database_service import DatabaseService
-from chart_service import ChartService
-from utils import safe_chart_route, run_excel_import, format_flash_message, get_app_stats
+from case_filters import CaseFilter, filtered_title
+from chart_cache import CHART_REGISTRY, chart_cache, make_cache_key
+from chart_data import build_chart_data
+from chart_warmup import chart_warmup
+from config import EXCEL_FILE, WARM_UP_ON_START
+from geocode_service import get_geocode_service
+from render_pool import render_chart, render_pool
+from metrics import PROMETHEUS_CONTENT_TYPE
+from profiling import (PROFILING_AVAILABLE, SORT_KEYS, admin_allowed, profile_requested,
+                       profile_store, profiled_route)
+from utils import (safe_chart_route, cached_chart, import_runner, validate_excel_file,
+                   format_flash_message, get_app_stats, get_metrics_text, instrumented_route, warm_up)
 
 # Initialize Flask app
 app = Flask(__name__)
@@ -15,94 +28,227 @@ app.secret_key = "beaconport-secret"  # In production, use environment variable
 # Initialize services
 db_service = DatabaseService()
 
+# Heavy libraries load on first use unless asked for up front. Render-pool workers
+# re-import this module, so only the top-level process warms up.
+if WARM_UP_ON_START and multiprocessing.parent_process() is None:
+    threading.Thread(target=warm_up, args=(db_service,), name="warm-up", daemon=True).start()
+
 
 @app.route("/", methods=["GET", "POST"])
+@instrumented_route
 def index():
     """Main page with data import functionality"""
     if request.method == "POST":
-        success, message = run_excel_import()
-        flash(format_flash_message(success, message))
-        return redirect(url_for("index"))
+        incremental = request.form.get("mode") == "incremental"
+        is_valid, validation_msg = validate_excel_file()
+        if not is_valid:
+            flash(format_flash_message(False, validation_msg))
+            return redirect(url_for("index"))
+        # Imports run in the background; the page polls /api/import/<job_id>
+        # The import itself is profiled when asked for, on the background thread it runs on
+        profile = PROFILING_AVAILABLE and profile_requested(request.values)
+        job, created = import_runner.submit(EXCEL_FILE, incremental=incremental, profile=profile)
+        if created:
+            flash(format_flash_message(True, "Import started"))
+        else:
+            flash(format_flash_message(False, "An import is already running"))
+        return redirect(url_for("index", job=job.id))
     
     # Get application statistics
     stats = get_app_stats(db_service)
     
-    return render_template("index.html", **stats)
+    return render_template("index.html", job_id=request.args.get("job"), **stats)
+
+
+def chart_page_context() -> dict:
+    """Template variables shared by the chart pages, including the active case filter"""
+    try:
+        case_filter = CaseFilter.from_args(request.args)
+        filter_error = None
+    except ValueError as e:
+        case_filter, filter_error = CaseFilter(), str(e)
+    return {
+        "data_version": db_service.get_data_version(),
+        "case_filter": case_filter,
+        "filter_error": filter_error,
+        "filter_query": urlencode(case_filter.to_params()),
+        "filter_options": db_service.get_filter_options(),
+        # ?render=client draws the charts in the browser from /api/charts/<kind>
+        "client_render": request.args.get("render") == "client",
+    }
 
 
 @app.route("/victim_data")
+@instrumented_route
 def victim_ages():
     """Page displaying victim analysis charts"""
-    return render_template("victim_data.html", now=time.time())
+    return render_template("victim_data.html", **chart_page_context())
 
 
 @app.route("/digital_vs_finalisation")
+@instrumented_route
 def digital_vs_finalisation():
     """Page displaying digital opportunities analysis"""
-    return render_template("digital_vs_finalisation.html", now=time.time())
+    return render_template("digital_vs_finalisation.html", **chart_page_context())
 
 
-# Chart generation routes with error handling
+# Chart generation routes with error handling and rendered-PNG caching
 @app.route("/victim_ages_chart.png")
+@instrumented_route
+@profiled_route
 @safe_chart_route
-def victim_ages_chart():
+@cached_chart("victim_ages",
+              title="Distribution of Victim Ages Across All Cases",
+              xlabel="Age (Years)",
+              ylabel="Number of Victims")
+def victim_ages_chart(title, xlabel, ylabel, case_filter=None, profile=None):
     """Generate victim ages histogram"""
-    ages = db_service.get_victim_ages()
-    chart_buffer = ChartService.create_histogram(
-        ages,
-        "Distribution of Victim Ages Across All Cases",
-        "Age (Years)",
-        "Number of Victims"
-    )
-    return send_file(chart_buffer, mimetype='image/png')
+    age_counts = db_service.get_age_counts(case_filter)
+    return render_chart("create_histogram_from_counts", age_counts, filtered_title(title, case_filter),
+                        xlabel, ylabel, profile=profile)
 
 
 @app.route("/victim_ethnicity_chart.png")
+@instrumented_route
+@profiled_route
 @safe_chart_route
-def victim_ethnicity_chart():
+@cached_chart("victim_ethnicity",
+              title="Victim Ethnicity Distribution",
+              xlabel="Ethnicity",
+              ylabel="Number of Victims")
+def victim_ethnicity_chart(title, xlabel, ylabel, case_filter=None, profile=None):
     """Generate victim ethnicity bar chart"""
-    ethnicities = db_service.get_victim_ethnicities()
-    chart_buffer = ChartService.create_bar_chart(
-        ethnicities,
-        "Victim Ethnicity Distribution",
-        "Ethnicity",
-        "Number of Victims"
-    )
-    return send_file(chart_buffer, mimetype='image/png')
+    ethnicity_counts = db_service.get_ethnicity_counts(case_filter)
+    return render_chart("create_bar_chart_from_counts", ethnicity_counts, filtered_title(title, case_filter),
+                        xlabel, ylabel, profile=profile)
 
 
 @app.route("/victim_postcode_map.png")
+@instrumented_route
+@profiled_route
 @safe_chart_route
-def victim_postcode_map():
+@cached_chart("victim_postcode_map", profile='map',
+              title="Victim Home Postcodes at Time of Offence")
+def victim_postcode_map(title, case_filter=None, profile=None):
     """Generate geographic visualization of victim postcodes"""
-    postcodes = db_service.get_victim_postcodes()
-    chart_buffer = ChartService.create_postcode_map(postcodes)
-    return send_file(chart_buffer, mimetype='image/png')
+    postcode_counts = db_service.get_postcode_counts(case_filter)
+    # Geocode here so lookups share this process's postcode cache and rate limiter
+    points = get_geocode_service().locate_counts(postcode_counts)
+    return render_chart("create_postcode_map_from_points", *points,
+                        title=filtered_title(title, case_filter), profile=profile)
 
 
 @app.route("/digital_vs_finalisation_chart.png")
+@instrumented_route
+@profiled_route
 @safe_chart_route
-def digital_vs_finalisation_chart():
+@cached_chart("digital_vs_finalisation",
+              title="Digital Opportunities vs Crime Finalisation Code",
+              xlabel="Digital Opportunities Present",
+              ylabel="Crime Finalisation Code")
+def digital_vs_finalisation_chart(title, xlabel, ylabel, case_filter=None, profile=None):
     """Generate scatter plot of digital opportunities vs crime finalisation"""
-    pairs = db_service.get_digital_vs_finalisation_pairs()
-    chart_buffer = ChartService.create_scatter_plot(
-        pairs,
-        "Digital Opportunities vs Crime Finalisation Code",
-        "Digital Opportunities Present",
-        "Crime Finalisation Code"
-    )
-    return send_file(chart_buffer, mimetype='image/png')
+    pair_counts = db_service.get_digital_vs_finalisation_counts(case_filter)
+    return render_chart("create_scatter_plot_from_counts", pair_counts, filtered_title(title, case_filter),
+                        xlabel, ylabel, profile=profile)
+
+
+@app.route("/api/charts/<kind>")
+@instrumented_route
+def api_chart_data(kind):
+    """API endpoint for a chart's aggregated series (plus a Vega-Lite spec with ?spec=1)"""
+    registration = CHART_REGISTRY.get(kind)
+    if registration is None:
+        return {"error": f"Unknown chart '{kind}'"}, 404
+    try:
+        case_filter = CaseFilter.from_args(request.args)
+    except ValueError as e:
+        return {"error": str(e)}, 400
+    include_spec = request.args.get("spec") in ("1", "true")
+
+    etag = make_cache_key(db_service.get_data_version(), f"{kind}.json",
+                          {**case_filter.to_params(), "spec": include_spec})
+    if request.if_none_match.contains(etag):
+        response = app.make_response(('', 304))
+    else:
+        response = jsonify(build_chart_data(kind, db_service, case_filter, registration.params, include_spec))
+    response.set_etag(etag)
+    return response
+
+
+@app.route("/api/import/<job_id>")
+@instrumented_route
+def import_status(job_id):
+    """API endpoint for the progress of a background import"""
+    job = import_runner.get(job_id)
+    if job is None:
+        return {"error": "Unknown import job"}, 404
+    return job.to_dict()
 
 
 # Additional analysis routes
+@app.route("/api/aggregates")
+@instrumented_route
+def api_aggregates():
+    """API endpoint for the chart aggregates, optionally filtered by case fields"""
+    try:
+        case_filter = CaseFilter.from_args(request.args)
+    except ValueError as e:
+        return {"error": str(e)}, 400
+    return db_service.get_filtered_aggregates(case_filter).to_json()
+
+
 @app.route("/api/stats")
+@instrumented_route
 def api_stats():
-    """API endpoint for application statistics"""
-    stats = get_app_stats(db_service)
+    """API endpoint for application statistics, optionally filtered by case fields"""
+    try:
+        case_filter = CaseFilter.from_args(request.args)
+    except ValueError as e:
+        return {"error": str(e)}, 400
+    stats = get_app_stats(db_service, case_filter)
+    stats['filter'] = case_filter.to_params()
+    stats['snapshot'] = db_service.get_snapshot_stats()
+    stats['chart_cache'] = chart_cache.stats()
+    stats['warmup'] = chart_warmup.stats()
+    stats['render_pool'] = render_pool.stats()
     return stats
 
 
+@app.route("/api/metrics")
+@instrumented_route
+def api_metrics():
+    """Request latency, hot-path stage timings and cache counters in Prometheus text format"""
+    return get_metrics_text(db_service), 200, {"Content-Type": PROMETHEUS_CONTENT_TYPE}
+
+
+@app.route("/admin/profiles")
+@instrumented_route
+def admin_profiles():
+    """Stored cProfile captures of chart renders and imports (only when profiling is set up)"""
+    if not admin_allowed(request.args, request.remote_addr):
+        return {"error": "Not found"}, 404
+    return render_template("profiles.html", profiles=profile_store.list(), token=request.args.get("token"))
+
+
+@app.route("/admin/profiles/<profile_id>")
+@instrumented_route
+def admin_profile(profile_id):
+    """Top-N summary of one stored profile (?sort=, ?top=), or the raw .prof with ?download=1"""
+    record = profile_store.get(profile_id) if admin_allowed(request.args, request.remote_addr) else None
+    if record is None:
+        return {"error": "Not found"}, 404
+    if request.args.get("download") == "1":
+        return send_file(profile_store.stats_path(profile_id), mimetype="application/octet-stream",
+                         as_attachment=True, download_name=f"{profile_id}.prof")
+    sort = request.args.get("sort", "cumulative")
+    summary = profile_store.summary(profile_id, sort, request.args.get("top", type=int))
+    return render_template("profiles.html", profiles=[record], summary=summary, sort=sort,
+                           sort_keys=SORT_KEYS, token=request.args.get("token"))
+
+
 @app.route("/health")
+@instrumented_route
 def health_check():
     """Simple health check endpoint"""
     return {"status": "healthy", "timestamp": time.time()}
@@ -0,0 +1,117 @@
+# benchmarks/startup.py - Import-time and first-request latency of the web app
+#
+#   python benchmarks/startup.py [--runs 5] [--top 20] [--module app] [--requests] [--json out.json]
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Libraries the app is meant to load only on first use
+HEAVY_MODULES = ("pandas", "numpy", "matplotlib", "cartopy", "geopy", "openpyxl")
+
+# Run in a fresh interpreter: time the first hit on each URL and report what got imported
+FIRST_REQUESTS = """
+import json, sys, time
+from app import app
+client = app.test_client()
+timings = {}
+for url in sys.argv[1:]:
+    start = time.perf_counter()
+    status = client.get(url).status_code
+    timings[url] = {"status": status, "seconds": round(time.perf_counter() - start, 4),
+                    "loaded": [m for m in %r if m in sys.modules]}
+print(json.dumps(timings))
+""" % (HEAVY_MODULES,)
+
+
+def run_python(args: List[str]) -> subprocess.CompletedProcess:
+    env = {**os.environ, "PYTHONPATH": ROOT, "BEACONPORT_WARM_UP": ""}
+    return subprocess.run([sys.executable, *args], cwd=ROOT, env=env,
+                          capture_output=True, text=True, check=True)
+
+
+def parse_importtime(stderr: str) -> List[Dict[str, Any]]:
+    """Rows of `-X importtime` output as {module, self_us, cumulative_us}"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append({"module": name.strip(), "self_us": int(self_us), "cumulative_us": int(cumulative_us)})
+    return rows
+
+
+def import_profile(module: str) -> Dict[str, Any]:
+    rows = parse_importtime(run_python(["-X", "importtime", "-c", f"import {module}"]).stderr)
+    top_level = next((row for row in rows if row["module"] == module), None)
+    return {
+        "total_ms": round(top_level["cumulative_us"] / 1000, 1) if top_level else None,
+        "modules": rows,
+        "heavy_loaded": sorted({row["module"].split(".")[0] for row in rows} & set(HEAVY_MODULES)),
+    }
+
+
+def cold_start_seconds(module: str, runs: int) -> List[float]:
+    """Wall time of a fresh interpreter importing module, once per run"""
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        run_python(["-c", f"import {module}"])
+        timings.append(round(time.perf_counter() - start, 4))
+    return timings
+
+
+def first_requests(urls: List[str]) -> Dict[str, Any]:
+    return json.loads(run_python(["-c", FIRST_REQUESTS, *urls]).stdout.strip().splitlines()[-1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Measure how long the app takes to import and serve its first requests")
+    parser.add_argument("--module", default="app", help="module to import (default: app)")
+    parser.add_argument("--runs", type=int, default=5, help="cold-start runs to time")
+    parser.add_argument("--top", type=int, default=20, help="modules to list by cumulative import time")
+    parser.add_argument("--requests", action="store_true",
+                        help="also time the first /health, index and chart requests")
+    parser.add_argument("--json", help="write the full results to this file")
+    args = parser.parse_args()
+
+    profile = import_profile(args.module)
+    cold = cold_start_seconds(args.module, args.runs)
+    results: Dict[str, Any] = {
+        "module": args.module,
+        "python": sys.version.split()[0],
+        "import_ms": profile["total_ms"],
+        "heavy_loaded_at_import": profile["heavy_loaded"],
+        "cold_start_seconds": {"runs": cold, "median": statistics.median(cold)},
+        "importtime": profile["modules"],
+    }
+
+    print(f"import {args.module}: {profile['total_ms']} ms (-X importtime), "
+          f"interpreter cold start median {results['cold_start_seconds']['median']:.3f}s over {args.runs} runs")
+    print(f"Heavy libraries loaded at import: {', '.join(profile['heavy_loaded']) or 'none'}")
+    print(f"\n{'cumulative ms':>14} {'self ms':>9}  module")
+    for row in sorted(profile["modules"], key=lambda r: r["cumulative_us"], reverse=True)[:args.top]:
+        print(f"{row['cumulative_us'] / 1000:>14.1f} {row['self_us'] / 1000:>9.1f}  {row['module']}")
+
+    if args.requests:
+        results["first_requests"] = first_requests(
+            ["/health", "/", "/victim_data", "/victim_ages_chart.png", "/victim_postcode_map.png"])
+        print(f"\n{'seconds':>8} status  url (heavy libraries loaded so far)")
+        for url, timing in results["first_requests"].items():
+            print(f"{timing['seconds']:>8.3f} {timing['status']:>6}  {url} ({', '.join(timing['loaded']) or 'none'})")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nWrote {args.json}")
+
+
+if __name__ == "__main__":
+    main()
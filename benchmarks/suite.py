@@ -0,0 +1,363 @@
+# benchmarks/suite.py - Import, getter, chart render and route latency on a synthetic dataset
+#
+#   python benchmarks/suite.py [--scale 1k|10k|100k] [--runs 5] [--backend json|sqlite]
+#                              [--render-processes N] [--json out.json] [--compare baseline.json]
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from synthetic_workbook import SCALES, generate, resolve_scale
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DB_EXTENSIONS = {"json": ".json", "sqlite": ".sqlite3"}
+# Filter applied to the filtered getter, chart and route timings (values the generator always uses)
+BENCH_FILTER = {"force_code": "36", "offence_type": "Rape"}
+# A timing is reported as a regression when it is this many times slower than the baseline
+DEFAULT_THRESHOLD = 1.25
+# ...and its median is at least this long (sub-millisecond timings are mostly noise)
+MIN_REGRESSION_SECONDS = 0.001
+# Run settings that must match for a comparison to mean anything
+COMPARABLE_META = ("cases", "seed", "backend")
+
+
+def summarise(seconds: List[float], **extra) -> Dict[str, Any]:
+    return {"runs": [round(s, 6) for s in seconds], "median": round(statistics.median(seconds), 6),
+            "min": round(min(seconds), 6), "max": round(max(seconds), 6), **extra}
+
+
+def measure(fn: Callable[[], Any], runs: int, before: Optional[Callable[[], Any]] = None) -> Dict[str, Any]:
+    """Time fn once per run; before (untimed) runs ahead of each call, e.g. to drop caches"""
+    seconds = []
+    for _ in range(runs):
+        if before is not None:
+            before()
+        start = time.perf_counter()
+        fn()
+        seconds.append(time.perf_counter() - start)
+    return summarise(seconds)
+
+
+def attempt(fn: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+    """Run one timed item; if it fails the error is recorded as its result and the run carries on"""
+    try:
+        return fn()
+    except Exception as e:
+        return {"error": f"{type(e).__name__}: {e}"}
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def prepare_dataset(workdir: str, cases: int, seed: int, regenerate: bool):
+    """Generate the workbook for (cases, seed), or reuse the one from an earlier run"""
+    path = os.path.join(workdir, f"synthetic-{cases}-seed{seed}.xlsx")
+    table = os.path.splitext(path)[0] + "-postcodes.csv"
+    if not regenerate and os.path.exists(path) and os.path.exists(table):
+        return path, table, None
+    start = time.perf_counter()
+    generate(path, cases, seed)
+    return path, table, time.perf_counter() - start
+
+
+def configure_app(db_path: str, postcode_table: str, workdir: str) -> None:
+    """Point the app modules at the benchmark database and an offline geocoder.
+
+    Runs before anything imports config-dependent modules: the database path is
+    read from the environment, and the geocoder is limited to the generated
+    postcode table with its own cache, so no lookups leave the machine.
+    """
+    os.environ["BEACONPORT_DB_PATH"] = db_path
+    os.environ["BEACONPORT_WARM_UP"] = ""
+    sys.path.insert(0, ROOT)
+    from config import GEO_CONFIG
+    GEO_CONFIG.update({
+        'lookup_table': postcode_table,
+        'remote_backend': None,
+        'cache_db_path': os.path.join(workdir, "bench_postcode_cache.sqlite3"),
+        'legacy_cache_path': None,
+    })
+    if os.path.exists(GEO_CONFIG['cache_db_path']):
+        os.remove(GEO_CONFIG['cache_db_path'])
+
+
+def bench_import(workbook: str, db_path: str, runs: int) -> Dict[str, Any]:
+    from import_excel import import_excel_to_db
+    seconds = []
+    summary: Dict[str, Any] = {}
+    for _ in range(runs):
+        start = time.perf_counter()
+        # The importer prints its summary; it is returned as well, so keep the output clean
+        with contextlib.redirect_stdout(io.StringIO()):
+            summary = import_excel_to_db(workbook, db_path)
+        seconds.append(time.perf_counter() - start)
+    return summarise(seconds, cases=summary["cases_inserted"], sheets=summary["sheets_read"])
+
+
+def bench_getters(db_path: str, runs: int) -> Dict[str, Dict[str, Any]]:
+    """Each DatabaseService getter cold (snapshot reloaded, derived data rebuilt) and warm"""
+    from case_filters import CaseFilter
+    from database_service import DatabaseService
+    from db_snapshot import get_snapshot
+    db_service = DatabaseService(db_path)
+    snapshot = get_snapshot(db_path)
+    case_filter = CaseFilter.from_args(BENCH_FILTER)
+    getters = {
+        "get_data": db_service.get_data,
+        "get_case_count": db_service.get_case_count,
+        "get_victim_count": db_service.get_victim_count,
+        "get_dataset_counts": db_service.get_dataset_counts,
+        "get_filter_options": db_service.get_filter_options,
+        "get_engine": db_service.get_engine,
+        "get_aggregates": db_service.get_aggregates,
+        "get_age_counts": db_service.get_age_counts,
+        "get_ethnicity_counts": db_service.get_ethnicity_counts,
+        "get_postcode_counts": db_service.get_postcode_counts,
+        "get_digital_vs_finalisation_counts": db_service.get_digital_vs_finalisation_counts,
+        "get_filtered_counts[filter]": lambda: db_service.get_filtered_counts(case_filter),
+        "get_filtered_aggregates[filter]": lambda: db_service.get_filtered_aggregates(case_filter),
+        "get_age_counts[filter]": lambda: db_service.get_age_counts(case_filter),
+        "get_postcode_counts[filter]": lambda: db_service.get_postcode_counts(case_filter),
+    }
+    results = {}
+    for name, getter in getters.items():
+        results[f"{name} (cold)"] = attempt(lambda: measure(getter, runs, before=snapshot.invalidate))
+
+        def warm():
+            getter()
+            return measure(getter, runs)
+
+        results[f"{name} (warm)"] = attempt(warm)
+    return results
+
+
+def bench_geocoding(db_path: str, runs: int) -> Dict[str, Dict[str, Any]]:
+    from database_service import DatabaseService
+    from geocode_service import get_geocode_service
+    postcode_counts = DatabaseService(db_path).get_postcode_counts()
+    service = get_geocode_service()
+    # The first pass resolves every postcode from the local table and fills the cache
+    results = {"locate_counts (uncached)": attempt(lambda: measure(lambda: service.locate_counts(postcode_counts), 1))}
+    results["locate_counts (cached)"] = attempt(lambda: measure(lambda: service.locate_counts(postcode_counts), runs))
+    return results
+
+
+def bench_charts(db_path: str, runs: int) -> Dict[str, Dict[str, Any]]:
+    """Each ChartService render in this process, after an untimed render builds its figure template"""
+    from chart_service import ChartService
+    from database_service import DatabaseService
+    from geocode_service import get_geocode_service
+    db_service = DatabaseService(db_path)
+    located = attempt(lambda: {"points": get_geocode_service().locate_counts(db_service.get_postcode_counts())})
+    renders = {
+        "create_histogram_from_counts": lambda: ChartService.create_histogram_from_counts(
+            db_service.get_age_counts(), "Victim ages", "Age", "Victims"),
+        "create_bar_chart_from_counts": lambda: ChartService.create_bar_chart_from_counts(
+            db_service.get_ethnicity_counts(), "Victim ethnicity", "Ethnicity", "Victims"),
+        "create_scatter_plot_from_counts": lambda: ChartService.create_scatter_plot_from_counts(
+            db_service.get_digital_vs_finalisation_counts(), "Digital vs finalisation", "Digital", "Code"),
+        "create_postcode_map_from_points": lambda: ChartService.create_postcode_map_from_points(
+            *located["points"], "Victim postcodes"),
+        "create_error_chart": lambda: ChartService.create_error_chart("Benchmark"),
+    }
+    results = {}
+    for name, render in renders.items():
+        if name == "create_postcode_map_from_points" and "error" in located:
+            results[name] = located  # the map has no points to draw
+            continue
+
+        def timed():
+            png_bytes = len(render().getvalue())
+            return {**measure(render, runs), "png_bytes": png_bytes}
+
+        results[name] = attempt(timed)
+    return results
+
+
+def route_urls() -> List[str]:
+    from urllib.parse import urlencode
+    query = urlencode(BENCH_FILTER)
+    return [
+        "/health",
+        "/",
+        "/victim_data",
+        "/digital_vs_finalisation",
+        "/victim_ages_chart.png",
+        "/victim_ethnicity_chart.png",
+        "/victim_postcode_map.png",
+        "/digital_vs_finalisation_chart.png",
+        f"/victim_ages_chart.png?{query}",
+        f"/victim_postcode_map.png?{query}",
+        "/api/charts/victim_ages",
+        "/api/charts/victim_postcode_map?spec=1",
+        f"/api/charts/digital_vs_finalisation?{query}",
+        "/api/aggregates",
+        f"/api/aggregates?{query}",
+        "/api/stats",
+    ]
+
+
+def bench_routes(runs: int, render_processes: Optional[int]) -> Dict[str, Dict[str, Any]]:
+    """End-to-end latency through Flask's test client.
+
+    Cold requests follow a snapshot reload and an emptied chart cache, so chart
+    routes render; warm requests are answered from the caches. Conditional
+    requests (304) are not timed: the client sends no ETag.
+    """
+    from app import app, db_service
+    from chart_cache import chart_cache
+    from db_snapshot import get_snapshot
+    from render_pool import render_pool
+    if render_processes is not None:
+        render_pool.processes = render_processes
+    client = app.test_client()
+    snapshot = get_snapshot(db_service.db_path)
+
+    def drop_caches():
+        snapshot.invalidate()
+        chart_cache.clear()
+
+    results = {}
+    for url in route_urls():
+        statuses = set()
+
+        def request():
+            response = client.get(url)
+            statuses.add(response.status_code)
+            response.close()
+
+        results[f"GET {url} (cold)"] = attempt(lambda: measure(request, runs, before=drop_caches))
+        results[f"GET {url} (warm)"] = attempt(lambda: {**measure(request, runs), "status": sorted(statuses)})
+    results["render_pool"] = render_pool.stats()
+    render_pool.shutdown()
+    return results
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[Dict[str, Any]]:
+    """Median timings present in both runs, with their ratio to the baseline"""
+    rows = []
+    for group, timings in results["timings"].items():
+        old_group = baseline.get("timings", {}).get(group, {})
+        for name, timing in timings.items():
+            old = old_group.get(name)
+            if not isinstance(timing, dict) or "median" not in timing or not old or not old.get("median"):
+                continue
+            ratio = timing["median"] / old["median"]
+            rows.append({"group": group, "name": name, "baseline": old["median"], "median": timing["median"],
+                         "ratio": round(ratio, 3),
+                         "regression": ratio > threshold and timing["median"] >= MIN_REGRESSION_SECONDS})
+    return rows
+
+
+def print_timings(timings: Dict[str, Dict[str, Any]]) -> None:
+    for group, rows in timings.items():
+        print(f"\n{group}\n{'median ms':>11} {'min ms':>9} {'max ms':>9}  name")
+        for name, timing in rows.items():
+            if "median" in timing:
+                print(f"{timing['median'] * 1000:>11.2f} {timing['min'] * 1000:>9.2f} "
+                      f"{timing['max'] * 1000:>9.2f}  {name}")
+            elif "error" in timing:
+                print(f"{'failed':>11} {'':>9} {'':>9}  {name}: {timing['error']}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark import, data access, charts and routes on synthetic data")
+    parser.add_argument("--scale", default="1k", help=f"{', '.join(SCALES)} or a number of cases (default: 1k)")
+    parser.add_argument("--seed", type=int, default=1, help="generator seed (default: 1)")
+    parser.add_argument("--runs", type=int, default=5, help="timed runs per getter, chart and route")
+    parser.add_argument("--import-runs", type=int, default=1, help="timed imports of the workbook")
+    parser.add_argument("--backend", choices=sorted(DB_EXTENSIONS), default="json", help="database backend")
+    parser.add_argument("--render-processes", type=int,
+                        help="render pool size for the route timings (default: RENDER_POOL in config)")
+    parser.add_argument("--workdir", default=os.path.join(tempfile.gettempdir(), "beaconport-bench"),
+                        help="where the workbook and database are kept between runs")
+    parser.add_argument("--regenerate", action="store_true", help="rewrite the workbook even if it exists")
+    parser.add_argument("--skip", action="append", default=[],
+                        choices=["import", "getters", "geocoding", "charts", "routes"], help="groups to leave out")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--compare", help="results file from an earlier run to compare medians against")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help=f"slowdown ratio reported as a regression (default: {DEFAULT_THRESHOLD})")
+    args = parser.parse_args()
+
+    cases = resolve_scale(args.scale)
+    os.makedirs(args.workdir, exist_ok=True)
+    workbook, postcode_table, generate_seconds = prepare_dataset(args.workdir, cases, args.seed, args.regenerate)
+    db_path = os.path.join(args.workdir, f"synthetic-{cases}-seed{args.seed}{DB_EXTENSIONS[args.backend]}")
+    configure_app(db_path, postcode_table, args.workdir)
+
+    timings: Dict[str, Dict[str, Any]] = {}
+    if generate_seconds is not None:
+        timings["generate"] = {"workbook": summarise([generate_seconds])}
+    if "import" not in args.skip or not os.path.exists(db_path):
+        timings["import"] = {"import_excel_to_db": bench_import(workbook, db_path, args.import_runs)}
+    if "getters" not in args.skip:
+        timings["getters"] = bench_getters(db_path, args.runs)
+    if "geocoding" not in args.skip:
+        timings["geocoding"] = bench_geocoding(db_path, args.runs)
+    if "charts" not in args.skip:
+        timings["charts"] = bench_charts(db_path, args.runs)
+    if "routes" not in args.skip:
+        timings["routes"] = bench_routes(args.runs, args.render_processes)
+
+    results: Dict[str, Any] = {
+        "meta": {
+            "scale": args.scale,
+            "cases": cases,
+            "seed": args.seed,
+            "backend": args.backend,
+            "runs": args.runs,
+            "commit": git_commit(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        },
+        "timings": timings,
+    }
+    print(f"{cases} cases ({args.backend}), {args.runs} runs each, commit {results['meta']['commit']}")
+    print_timings(timings)
+    failed = [name for rows in timings.values() for name, timing in rows.items() if "error" in timing]
+    if failed:
+        print(f"\n{len(failed)} item(s) failed and were not timed: {', '.join(failed)}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        mismatched = [key for key in COMPARABLE_META
+                      if baseline.get("meta", {}).get(key) != results["meta"][key]]
+        if mismatched:
+            print(f"\nWarning: {args.compare} was run with a different {', '.join(mismatched)}")
+        rows = compare(results, baseline, args.threshold)
+        results["comparison"] = {"baseline": args.compare, "threshold": args.threshold, "rows": rows}
+        regressions = [row for row in rows if row["regression"]]
+        print(f"\nCompared with {args.compare} (commit {baseline.get('meta', {}).get('commit')}): "
+              f"{len(regressions)} of {len(rows)} timings more than {args.threshold}x slower")
+        for row in regressions:
+            print(f"{row['ratio']:>7.2f}x  {row['group']}: {row['name']} "
+                  f"({row['baseline'] * 1000:.2f} -> {row['median'] * 1000:.2f} ms)")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nWrote {args.json}")
+    if args.compare and any(row["regression"] for row in results["comparison"]["rows"]):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
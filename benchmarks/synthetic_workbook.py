@@ -0,0 +1,237 @@
+# benchmarks/synthetic_workbook.py - Synthetic capture workbooks with the real sheet layout
+#
+#   python benchmarks/synthetic_workbook.py --scale 10k [--seed 1] [--out synthetic.xlsx]
+
+import argparse
+import csv
+import os
+import random
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, NamedTuple, Tuple
+
+# Named dataset sizes (number of cases on the main sheet)
+SCALES = {"1k": 1_000, "10k": 10_000, "100k": 100_000}
+
+# Sheet names and headers exactly as they appear in "Beaconport Capture.xlsx",
+# typos and stray whitespace included, so the importer sees the same columns
+MAIN_SHEET = "Beaconport Main"
+OFFENCE_SHEET = "Offence Details"
+CASE_DATA_SHEET = "Case Data"
+VICTIM_SHEET = "Victim Details"
+SUSPECT_SHEET = "Suspect Details"
+HEADERS = {
+    MAIN_SHEET: ("Beaconport Ref", "Allocated To", "Force Code", "Force Reference", "Panel Outcome", "Notes"),
+    OFFENCE_SHEET: ("Beaconport Ref", "Offence Date", "Reported Date", "Offence Type",
+                    "Home Office Offence Code ", "Home Office Code Category\xa0 ", "Offence Postcode",
+                    "Location Type", "MO (Freetext)", "ERO Decision (Freetext)", "MG3 Content (Freetext)",
+                    "Date Crime Finalised", "Crime Finalisation Code", "Date Case Finalised",
+                    "Case / Court Outcome"),
+    CASE_DATA_SHEET: ("Beaconport Ref", "Number of Victims", "Number of Suspects", "Number of Witnesses",
+                      "Victim(s) Account Taken", "Victim Medical Completed", "Victim Services Referal",
+                      "Witness Statements Taken", "Total Statements Taken", "Forensic Opportunities Present",
+                      "Forensic Submissions Completed", "CCTV Opportunities Present", "CCTV Collected",
+                      "CCTV Reviewed", "Digital Opportunities Present", "Digital Forensic Submissions Completed",
+                      "Special Mesures Considered"),
+    VICTIM_SHEET: ("Beaconport Ref", "Victim First Name", "Victim Midde Name(s)", "Victim Last Name",
+                   "VictimDoB", "Victim Age at Time of Offence", "Victim PNCID", "Victim CRO",
+                   "Victim Ethnicity", "Victim Immigration Status at Time of Offence",
+                   "Victim Care Status at Time of Offence", "Victim Home Postcode at Time of Offence "),
+    SUSPECT_SHEET: ("Beaconport Ref", "Suspect First Name", "Suspect Midde Name(s)", "Suspect Last Name",
+                    "SuspectDoB", "Suspect Age at Time of Offence", "Suspect PNCID", "Suspect CRO",
+                    "Suspect Ethnicity", "Suspect Knows Victim", "Suspect Immigration Status at Time of Offence",
+                    "Suspect Care Status at Time of Offence", "Suspect Home Postcode at Time of Offence "),
+}
+
+OFFICERS = ("Jack Bauer", "Jessica Fletcher", "Jane Tennison", "Jim Bergerac", "Vera Stanhope",
+            "Endeavour Morse", "Jules Maigret", "Sarah Lund")
+FORCE_CODES = tuple(range(30, 46))
+PANEL_OUTCOMES = ("Under review", "Reviewed - correct decision.", "Referred back to force",
+                  "Reviewed - further action required.")
+NOTES = ("Refer back to Force to do better.", "They did everything right!", "Awaiting file", None)
+# (offence type, Home Office offence code, Home Office code category)
+OFFENCES = (("Rape", "19D", "019/07"), ("Rape", "19C", "019/11"),
+            ("Sexual Assault", "17B", "017/02"), ("Assault by Penetration", "20A", "020/03"),
+            ("Sexual Activity with a Child", "22B", "022/01"))
+LOCATION_TYPES = ("Private", "Public", "Online", "Vehicle", "Licensed Premises")
+MO_TEXT = ("Offender known to victim", "Offender met victim online", "Attack in a public place",
+           "Offence took place after a night out")
+ERO_TEXT = ("Victim did not support prosecution.", "NFA'd due to lack of evidence",
+            "Charged following review", "No CCTV, no witnesses.")
+MG3_TEXT = ("No MG3", "MG3 submitted", "MG3 returned for further work")
+FINALISATION_CODES = (1, 2, 10, 14, 15, 16, 18, 20)
+COURT_OUTCOMES = ("Nil", "NIL", "Guilty", "Not guilty", "Discontinued", None)
+FIRST_NAMES = ("Natalie", "Mary", "James", "Fred", "Amira", "Oliver", "Chloe", "Tomasz", "Priya",
+               "Liam", "Grace", "Kwame", "Sophie", "Ben", "Aisha", "Harry")
+MIDDLE_NAMES = ("Elizabeth", "Jon", "Marie", "Lee", None, None, None)
+LAST_NAMES = ("Jones", "James", "Smith", "Purves", "Khan", "Nowak", "Patel", "Brown", "Taylor",
+              "Wilson", "Okafor", "Evans", "Walker", "Wright")
+ETHNICITIES = ("W1", "W1", "W1", "W2", "W9", "A1", "A2", "B1", "B2", "M1", "O1", "NS")
+IMMIGRATION = ("UK Citizen", "UK Citizen", "UK Citizen", "EU Settled Status", "Asylum Seeker", "Visa Holder")
+CARE_STATUS = ("Not in care", "Not in care", "Not in care", "In care", "Care leaver")
+KNOWS_VICTIM = ("Yes", "No")
+# Values the importer treats as missing, mixed into optional cells
+MISSING = (None, "N/A", "")
+
+# Postcode areas with an approximate centre (lon, lat) and a spread in degrees
+POSTCODE_AREAS = (("NR", 1.30, 52.63, 0.25), ("IP", 1.15, 52.06, 0.2), ("CB", 0.12, 52.20, 0.15),
+                  ("CO", 0.90, 51.89, 0.15), ("PE", -0.24, 52.57, 0.3), ("LN", -0.54, 53.23, 0.2),
+                  ("CM", 0.47, 51.73, 0.15), ("LU", -0.42, 51.88, 0.1), ("SG", -0.20, 51.90, 0.15),
+                  ("MK", -0.76, 52.04, 0.12))
+UNIT_LETTERS = "ABDEFGHJLNPQRSTUWXYZ"
+
+
+class SyntheticDataset(NamedTuple):
+    """Files written for one generated dataset"""
+    workbook: str
+    postcode_table: str
+    cases: int
+    seed: int
+    rows: Dict[str, int]
+
+
+def resolve_scale(scale: str) -> int:
+    """Case count for a named scale ("1k", "10k", "100k") or a plain number"""
+    if scale in SCALES:
+        return SCALES[scale]
+    cases = int(scale)
+    if cases <= 0:
+        raise ValueError(f"Scale must be positive, got {scale}")
+    return cases
+
+
+def postcode_universe(rng: random.Random, cases: int) -> Dict[str, Tuple[float, float]]:
+    """Distinct postcodes with coordinates, about one per two cases (at least 50)"""
+    size = max(50, cases // 2)
+    postcodes: Dict[str, Tuple[float, float]] = {}
+    while len(postcodes) < size:
+        area, lon, lat, spread = rng.choice(POSTCODE_AREAS)
+        district = rng.randint(1, 30)
+        sector = rng.randint(0, 9)
+        unit = rng.choice(UNIT_LETTERS) + rng.choice(UNIT_LETTERS)
+        # Districts and sectors cluster, so the sector/district fallbacks land near the postcode
+        district_rng = random.Random(f"{area}{district}")
+        sector_rng = random.Random(f"{area}{district} {sector}")
+        postcodes[f"{area}{district} {sector}{unit}"] = (
+            round(lon + district_rng.uniform(-spread, spread) + sector_rng.uniform(-0.02, 0.02)
+                  + rng.uniform(-0.005, 0.005), 6),
+            round(lat + district_rng.uniform(-spread, spread) / 2 + sector_rng.uniform(-0.01, 0.01)
+                  + rng.uniform(-0.003, 0.003), 6),
+        )
+    return postcodes
+
+
+def maybe_missing(rng: random.Random, value: Any, rate: float = 0.03) -> Any:
+    return rng.choice(MISSING) if rng.random() < rate else value
+
+
+def person_row(rng: random.Random, ref: str, offence_date: datetime, postcode: str,
+               victim: bool) -> List[Any]:
+    age = rng.randint(8, 75) if victim else rng.randint(14, 80)
+    dob = offence_date - timedelta(days=age * 365 + rng.randint(0, 364))
+    pncid = f"{rng.randint(10, 99)}/{rng.randint(10000, 99999)}/{rng.choice(UNIT_LETTERS)}"
+    row = [ref, rng.choice(FIRST_NAMES), rng.choice(MIDDLE_NAMES), rng.choice(LAST_NAMES), dob,
+           maybe_missing(rng, age), maybe_missing(rng, pncid, 0.3), maybe_missing(rng, pncid[:-2], 0.3),
+           maybe_missing(rng, rng.choice(ETHNICITIES))]
+    if not victim:
+        row.append(rng.choice(KNOWS_VICTIM))
+    # Postcodes are written in the inconsistent spacing/case seen in real captures
+    spelt = rng.choice((postcode, postcode.lower(), postcode.replace(" ", "")))
+    row += [rng.choice(IMMIGRATION), rng.choice(CARE_STATUS), maybe_missing(rng, spelt)]
+    return row
+
+
+def generate_rows(cases: int, seed: int, postcodes: List[str]):
+    """Yield (sheet name, row) for every row of the workbook, case by case"""
+    rng = random.Random(seed)
+    for i in range(1, cases + 1):
+        year = 2020 + i % 6
+        ref = f"BPORT/{i:03d}/{year}"
+        force = rng.choice(FORCE_CODES)
+        offence_date = datetime(2010, 1, 1) + timedelta(days=rng.randint(0, 14 * 365))
+        reported = offence_date + timedelta(days=rng.choice((0, 1, 3, 30, 365, 1500)))
+        crime_finalised = reported + timedelta(days=rng.randint(5, 400))
+        offence_type, ho_code, ho_category = rng.choice(OFFENCES)
+        victims = rng.choices((1, 2, 3), weights=(70, 22, 8))[0]
+        suspects = rng.choices((1, 2, 3), weights=(75, 18, 7))[0]
+        witnesses = rng.randint(0, 4)
+        digital = int(rng.random() < 0.55)
+        cctv = int(rng.random() < 0.4)
+        forensic = int(rng.random() < 0.35)
+        accounts = rng.randint(0, victims)
+
+        yield MAIN_SHEET, [ref, rng.choice(OFFICERS), force,
+                           f"{force}/{rng.randint(10000, 99999)}/{offence_date.year % 100:02d}",
+                           rng.choice(PANEL_OUTCOMES), rng.choice(NOTES)]
+        yield OFFENCE_SHEET, [ref, offence_date, reported, offence_type, ho_code, ho_category,
+                              rng.choice(postcodes), rng.choice(LOCATION_TYPES), rng.choice(MO_TEXT),
+                              rng.choice(ERO_TEXT), rng.choice(MG3_TEXT), crime_finalised,
+                              maybe_missing(rng, rng.choice(FINALISATION_CODES)),
+                              crime_finalised + timedelta(days=rng.randint(0, 900)),
+                              rng.choice(COURT_OUTCOMES)]
+        yield CASE_DATA_SHEET, [ref, victims, suspects, witnesses, accounts, rng.randint(0, victims),
+                                rng.randint(0, victims), rng.randint(0, witnesses), accounts + witnesses,
+                                forensic, forensic * rng.randint(0, 1), cctv, cctv * rng.randint(0, 1),
+                                cctv * rng.randint(0, 1), maybe_missing(rng, digital),
+                                digital * rng.randint(0, 1), rng.randint(0, 1)]
+        for _ in range(victims):
+            yield VICTIM_SHEET, person_row(rng, ref, offence_date, rng.choice(postcodes), victim=True)
+        for _ in range(suspects):
+            yield SUSPECT_SHEET, person_row(rng, ref, offence_date, rng.choice(postcodes), victim=False)
+
+
+def write_postcode_table(path: str, postcodes: Dict[str, Tuple[float, float]], seed: int,
+                         coverage: float = 0.9) -> int:
+    """Write the offline lookup CSV for most of the postcodes; the rest exercise the fallbacks"""
+    rng = random.Random(seed + 2)
+    written = 0
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(("pcds", "lat", "long"))
+        for postcode, (lon, lat) in postcodes.items():
+            if rng.random() < coverage:
+                writer.writerow((postcode, lat, lon))
+                written += 1
+    return written
+
+
+def generate(path: str, cases: int, seed: int = 1) -> SyntheticDataset:
+    """Write a workbook of cases (plus <name>-postcodes.csv) and return what was written"""
+    # openpyxl is only needed when a workbook is actually generated
+    import openpyxl
+    wb = openpyxl.Workbook(write_only=True)
+    sheets = {name: wb.create_sheet(name) for name in HEADERS}
+    for name, header in HEADERS.items():
+        sheets[name].append(header)
+    postcodes = postcode_universe(random.Random(seed + 1), cases)
+    rows = {name: 0 for name in HEADERS}
+    for name, row in generate_rows(cases, seed, list(postcodes)):
+        sheets[name].append(row)
+        rows[name] += 1
+    tmp_path = f"{path}.tmp-{os.getpid()}.xlsx"
+    wb.save(tmp_path)
+    os.replace(tmp_path, path)
+
+    table = os.path.splitext(path)[0] + "-postcodes.csv"
+    write_postcode_table(table, postcodes, seed)
+    return SyntheticDataset(path, table, cases, seed, rows)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Write a synthetic Beaconport capture workbook")
+    parser.add_argument("--scale", default="1k", help=f"{', '.join(SCALES)} or a number of cases")
+    parser.add_argument("--seed", type=int, default=1, help="random seed (same seed, same workbook)")
+    parser.add_argument("--out", help="workbook path (default: synthetic-<cases>.xlsx)")
+    args = parser.parse_args()
+
+    cases = resolve_scale(args.scale)
+    path = args.out or f"synthetic-{cases}.xlsx"
+    start = time.perf_counter()
+    dataset = generate(path, cases, args.seed)
+    print(f"Wrote {dataset.workbook} and {dataset.postcode_table} in {time.perf_counter() - start:.1f}s")
+    for name, count in dataset.rows.items():
+        print(f"{count:>10}  {name}")
+
+
+if __name__ == "__main__":
+    main()
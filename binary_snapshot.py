@@ -0,0 +1,101 @@
+# binary_snapshot.py - Pickle-protocol-5 copy of the case database for fast cold starts
+
+import copyreg
+import io
+import json
+import mmap
+import os
+import pickle
+import struct
+import zlib
+from types import MappingProxyType
+from typing import Any, Mapping, Optional, Sequence, Tuple
+
+MAGIC = b"BPSNAP\x00\x01"
+# Bump when the payload layout changes so older snapshots are ignored
+SNAPSHOT_SCHEMA = 1
+# MAGIC, then the length of the JSON header that follows
+PREFIX = struct.Struct("<8sI")
+
+
+def frozen_mapping(items: dict) -> Mapping:
+    """Rebuild a read-only mapping while unpickling"""
+    return MappingProxyType(items)
+
+
+def reduce_mapping(mapping: Mapping):
+    return frozen_mapping, (dict(mapping),)
+
+
+# Lets the already-frozen snapshot data be pickled, so loading needs no separate freeze pass
+DISPATCH_TABLE = {**copyreg.dispatch_table, MappingProxyType: reduce_mapping}
+
+
+def snapshot_path(db_path: str) -> str:
+    """The binary snapshot lives next to the database file"""
+    return f"{db_path}.snapshot"
+
+
+def file_signature(st: os.stat_result) -> Tuple[int, int, int]:
+    """Same (mtime_ns, size, inode) signature DatabaseSnapshot uses to spot a rewritten file"""
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+def write_snapshot(db_path: str, data: Mapping[str, Any], version: str,
+                   source_signature: Sequence[int]) -> bool:
+    """Write frozen data as a binary snapshot tagged with the source file it was read from"""
+    buffer = io.BytesIO()
+    pickler = pickle.Pickler(buffer, protocol=5)
+    pickler.dispatch_table = DISPATCH_TABLE
+    pickler.dump(data)
+    payload = buffer.getbuffer()
+    header = json.dumps({
+        "schema": SNAPSHOT_SCHEMA,
+        "source_signature": list(source_signature),
+        "version": version,
+        "payload_bytes": len(payload),
+        "payload_crc32": zlib.crc32(payload),
+    }).encode("utf-8")
+    path = snapshot_path(db_path)
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(PREFIX.pack(MAGIC, len(header)))
+            f.write(header)
+            f.write(payload)
+        os.replace(tmp_path, path)
+        return True
+    except OSError as e:
+        print(f"Failed to write binary snapshot: {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return False
+
+
+def load_snapshot(db_path: str, source_signature: Sequence[int]) -> Optional[Tuple[Mapping[str, Any], str]]:
+    """Return (frozen data, version) from the binary snapshot, or None if it is missing, stale or corrupt.
+
+    The file is memory-mapped and unpickled straight from the mapping, so the
+    raw bytes are shared through the page cache rather than copied per process.
+    Snapshots are only ever written by this app, next to its own database.
+    """
+    path = snapshot_path(db_path)
+    try:
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            magic, header_len = PREFIX.unpack_from(mapped, 0)
+            if magic != MAGIC:
+                return None
+            start = PREFIX.size + header_len
+            header = json.loads(mapped[PREFIX.size:start])
+            if (header.get("schema") != SNAPSHOT_SCHEMA
+                    or header.get("source_signature") != list(source_signature)):
+                return None
+            with memoryview(mapped)[start:start + header["payload_bytes"]] as payload:
+                if (len(payload) != header["payload_bytes"]
+                        or zlib.crc32(payload) != header["payload_crc32"]):
+                    print(f"Binary snapshot {path} failed its checksum; falling back to the database file")
+                    return None
+                data = pickle.loads(payload)
+            return data, header["version"]
+    except (OSError, ValueError, KeyError, struct.error, pickle.UnpicklingError, EOFError):
+        return None
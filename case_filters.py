@@ -0,0 +1,88 @@
+# case_filters.py - Case filters parsed from chart and stats query parameters
+
+from datetime import date
+from typing import Any, Dict, Mapping, NamedTuple, Optional
+
+from config import Fields
+
+# Query parameter -> case field matched exactly (case-insensitive)
+EXACT_FILTERS = {
+    "force_code": Fields.FORCE_CODE,
+    "offence_type": Fields.OFFENCE_TYPE,
+    "allocated_to": Fields.ALLOCATED_TO,
+}
+# Query parameters bounding the offence date (inclusive, YYYY-MM-DD)
+DATE_FILTERS = ("date_from", "date_to")
+
+
+def filter_key(value: Any) -> str:
+    """Normalised form used to match a stored field value against a query value"""
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip().casefold()
+
+
+def parse_date(name: str, value: Optional[str]) -> Optional[date]:
+    if value is None or not value.strip():
+        return None
+    try:
+        return date.fromisoformat(value.strip())
+    except ValueError:
+        raise ValueError(f"{name} must be a date in YYYY-MM-DD format, got '{value}'")
+
+
+class CaseFilter(NamedTuple):
+    """Restricts charts and stats to the cases matching every given field"""
+    force_code: Optional[str] = None
+    offence_type: Optional[str] = None
+    allocated_to: Optional[str] = None
+    date_from: Optional[date] = None
+    date_to: Optional[date] = None
+
+    @classmethod
+    def from_args(cls, args: Mapping[str, str]) -> "CaseFilter":
+        """Build a filter from request args; raises ValueError for malformed dates"""
+        exact = {name: args.get(name, "").strip() or None for name in EXACT_FILTERS}
+        date_from = parse_date("date_from", args.get("date_from"))
+        date_to = parse_date("date_to", args.get("date_to"))
+        if date_from and date_to and date_from > date_to:
+            raise ValueError("date_from must not be after date_to")
+        return cls(date_from=date_from, date_to=date_to, **exact)
+
+    def is_empty(self) -> bool:
+        return not any(self)
+
+    def exact_matches(self) -> Dict[str, str]:
+        """{query parameter: normalised value} for each exact-match filter in use"""
+        return {name: filter_key(getattr(self, name))
+                for name in EXACT_FILTERS if getattr(self, name) is not None}
+
+    def to_params(self) -> Dict[str, str]:
+        """Query parameters for this filter, with blanks dropped and dates in ISO form"""
+        params = {name: getattr(self, name) for name in EXACT_FILTERS if getattr(self, name) is not None}
+        for name in DATE_FILTERS:
+            value = getattr(self, name)
+            if value is not None:
+                params[name] = value.isoformat()
+        return params
+
+    def describe(self) -> str:
+        """Human-readable summary for chart titles"""
+        parts = [f"{EXACT_FILTERS[name]}: {getattr(self, name)}"
+                 for name in EXACT_FILTERS if getattr(self, name) is not None]
+        if self.date_from and self.date_to:
+            parts.append(f"Offence Date: {self.date_from} to {self.date_to}")
+        elif self.date_from:
+            parts.append(f"Offence Date: from {self.date_from}")
+        elif self.date_to:
+            parts.append(f"Offence Date: up to {self.date_to}")
+        return "; ".join(parts)
+
+
+def filtered_title(title: str, case_filter: Optional[CaseFilter]) -> str:
+    """Append the filter summary to a chart title"""
+    if case_filter is None or case_filter.is_empty():
+        return title
+    return f"{title}\n({case_filter.describe()})"
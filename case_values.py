@@ -0,0 +1,70 @@
+# case_values.py - Scalar cleaning helpers for case records (no pandas needed)
+
+import re
+from collections.abc import Mapping
+from types import MappingProxyType
+from typing import Any, Optional
+
+# Reasonable victim age range (inclusive)
+MIN_AGE = 0
+MAX_AGE = 120
+# Shortest string accepted as a postcode
+MIN_POSTCODE_LENGTH = 4
+
+# Strings int() accepts as a whole number
+WHOLE_NUMBER = re.compile(r"[+-]?\d+")
+
+NoneType = type(None)
+CONCRETE_MAPPINGS = (dict, MappingProxyType)
+
+
+def is_mapping(value: Any) -> bool:
+    # Concrete types first: the abstract Mapping check is slow at six-figure row counts
+    return isinstance(value, CONCRETE_MAPPINGS) or isinstance(value, Mapping)
+
+
+def first_record(case: Mapping, sheet_key: str) -> Optional[Mapping]:
+    """Return the first record of a linked sheet for a case, if there is one"""
+    records = case.get(sheet_key, [])
+    if records and is_mapping(records[0]):
+        return records[0]
+    return None
+
+
+def iter_records(case: Mapping, sheet_key: str):
+    """Yield every record of a linked sheet for a case"""
+    records = case.get(sheet_key, [])
+    if not isinstance(records, (list, tuple)):
+        records = [records] if records else []
+    for item in records:
+        if is_mapping(item):
+            yield item
+
+
+def clean_text_value(value: Any, upper: bool = False, min_length: int = 1) -> Optional[str]:
+    """Scalar form of clean_text, for writers that see one row at a time"""
+    if value is None:
+        return None
+    text = str(value).strip()
+    if upper:
+        text = text.upper()
+    return text if len(text) >= min_length else None
+
+
+def clean_age_value(value: Any) -> Optional[int]:
+    """Scalar form of clean_ages, for writers that see one row at a time"""
+    if isinstance(value, (int, float)):
+        try:
+            age = int(value)
+        except (ValueError, OverflowError):
+            return None
+    elif isinstance(value, str) and WHOLE_NUMBER.fullmatch(value.strip()):
+        age = int(value.strip())
+    else:
+        return None
+    return age if MIN_AGE <= age <= MAX_AGE else None
+
+
+def label_value(value: Any) -> str:
+    """Text label used by the correlation table ('' for a missing value)"""
+    return "" if value is None else str(value).strip()
@@ -0,0 +1,122 @@
+# chart_cache.py - Byte-bounded LRU cache of rendered chart PNGs
+
+import hashlib
+import io
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, NamedTuple, Optional
+
+from chart_figures import OutputProfile
+from config import CHART_CACHE_MAX_BYTES
+from singleflight import SingleFlight
+
+
+class CachedChart(NamedTuple):
+    png: bytes
+    etag: str
+    created_at: float
+
+
+def make_cache_key(data_version: str, kind: str, params: Dict[str, Any]) -> str:
+    """Hash the data version, chart kind and chart parameters into a cache key"""
+    payload = json.dumps([data_version, kind, params], sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+class ChartRegistration(NamedTuple):
+    """A chart route registered through utils.cached_chart"""
+    kind: str
+    render: Callable[..., io.BytesIO]
+    profile: OutputProfile
+    params: Dict[str, Any]
+
+    def cache_key(self, data_version: str, query: Optional[Dict[str, Any]] = None) -> str:
+        return make_cache_key(data_version, self.kind,
+                              {**self.profile._asdict(), **self.params, **(query or {})})
+
+    def render_png(self, **kwargs) -> bytes:
+        return self.render(**kwargs, profile=self.profile, **self.params).getvalue()
+
+
+# Every cached chart route in the app, keyed by chart kind
+CHART_REGISTRY: Dict[str, ChartRegistration] = {}
+
+
+class ChartCache:
+    """Thread-safe LRU cache of PNG bytes, bounded by total size rather than entry count"""
+
+    def __init__(self, max_bytes: int = CHART_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, CachedChart]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Concurrent misses for one key share a single render
+        self._renders = SingleFlight()
+
+    def get(self, key: str) -> Optional[CachedChart]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key: str, png: bytes) -> CachedChart:
+        entry = CachedChart(png=png, etag=key, created_at=time.time())
+        if len(png) > self.max_bytes:
+            # Too big to ever fit; hand it back without caching
+            return entry
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.current_bytes -= len(previous.png)
+            self._entries[key] = entry
+            self.current_bytes += len(png)
+            while self.current_bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.current_bytes -= len(evicted.png)
+                self.evictions += 1
+        return entry
+
+    def get_or_render(self, key: str, render: Callable[[], bytes]) -> CachedChart:
+        """Return the cached chart for key, rendering and storing it on a miss.
+
+        Requests that miss while the same key is already rendering wait for that
+        render instead of starting their own.
+        """
+        entry = self.get(key)
+        if entry is not None:
+            return entry
+        return self._renders.do(key, lambda: self._peek(key) or self.put(key, render()))
+
+    def _peek(self, key: str) -> Optional[CachedChart]:
+        """Entry stored by a render that finished just before this flight started (not counted)"""
+        with self._lock:
+            return self._entries.get(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "bytes": self.current_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "coalesced": self._renders.coalesced,
+        }
+
+
+# Shared cache used by all chart routes in this process
+chart_cache = ChartCache()
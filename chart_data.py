@@ -0,0 +1,119 @@
+# chart_data.py - JSON series and Vega-Lite specs for rendering the charts client-side
+
+from typing import Any, Dict, List, Optional, Tuple
+
+from case_filters import CaseFilter, filtered_title
+from config import CHART_STYLE, COLORS
+from geocode_service import get_geocode_service
+
+VEGA_LITE_SCHEMA = "https://vega.github.io/schema/vega-lite/v5.json"
+
+
+def json_value(value: Any) -> Any:
+    """Plain Python value for numpy scalars, so the series serialise as JSON"""
+    return value.item() if hasattr(value, "item") else value
+
+
+def histogram_series(value_counts: Dict[int, int]) -> List[Dict[str, Any]]:
+    """One bin per integer from the lowest to the highest value, zero-filled, as the PNG bins them"""
+    if not value_counts:
+        return []
+    low, high = int(min(value_counts)), int(max(value_counts))
+    return [{"value": value, "count": json_value(value_counts.get(value, 0))}
+            for value in range(low, high + 1)]
+
+
+def bar_series(category_counts: Dict[str, int]) -> List[Dict[str, Any]]:
+    return [{"category": json_value(category), "count": json_value(count)}
+            for category, count in category_counts.items()]
+
+
+def scatter_series(pair_counts: List[Tuple]) -> List[Dict[str, Any]]:
+    return [{"x": json_value(x), "y": json_value(y), "count": json_value(count)}
+            for x, y, count in pair_counts]
+
+
+def map_series(coords: List[Tuple[float, float]], point_weights: List[int]) -> List[Dict[str, Any]]:
+    return [{"lon": lon, "lat": lat, "count": json_value(count)}
+            for (lon, lat), count in zip(coords, point_weights)]
+
+
+def vega_lite_spec(chart_type: str, title: str, xlabel: str = "", ylabel: str = "") -> Dict[str, Any]:
+    """Vega-Lite spec drawing the series the way the matching PNG chart does.
+
+    The spec reads the named data source "series" rather than embedding the
+    values a second time; the client binds the payload's series to it.
+    """
+    spec: Dict[str, Any] = {
+        "$schema": VEGA_LITE_SCHEMA,
+        "title": {"text": title.split("\n"), "fontSize": CHART_STYLE['title_size']},
+        "width": "container",
+        "data": {"name": "series"},
+        "config": {"axis": {"titleFontSize": CHART_STYLE['label_size'],
+                            "labelFontSize": CHART_STYLE['tick_size']}},
+    }
+    if chart_type == "histogram":
+        spec["mark"] = {"type": "bar", "color": COLORS['histogram'], "opacity": CHART_STYLE['alpha'],
+                        "stroke": CHART_STYLE['edge_color'], "tooltip": True}
+        spec["encoding"] = {
+            "x": {"field": "value", "type": "ordinal", "title": xlabel},
+            "y": {"field": "count", "type": "quantitative", "title": ylabel},
+        }
+    elif chart_type == "bar":
+        spec["mark"] = {"type": "bar", "color": COLORS['primary'], "opacity": CHART_STYLE['alpha'],
+                        "stroke": CHART_STYLE['edge_color'], "tooltip": True}
+        spec["encoding"] = {
+            "x": {"field": "category", "type": "nominal", "sort": None, "title": xlabel},
+            "y": {"field": "count", "type": "quantitative", "title": ylabel},
+        }
+    elif chart_type == "scatter":
+        spec["mark"] = {"type": "circle", "color": COLORS['secondary'], "opacity": CHART_STYLE['alpha'],
+                        "stroke": CHART_STYLE['edge_color'], "tooltip": True}
+        spec["encoding"] = {
+            "x": {"field": "x", "type": "nominal", "title": xlabel},
+            "y": {"field": "y", "type": "nominal", "title": ylabel},
+            "size": {"field": "count", "type": "quantitative", "title": "Cases"},
+        }
+    elif chart_type == "map":
+        spec["height"] = 600
+        spec["projection"] = {"type": "mercator"}
+        spec["mark"] = {"type": "circle", "color": COLORS['map_points'], "opacity": 0.8, "tooltip": True}
+        spec["encoding"] = {
+            "longitude": {"field": "lon", "type": "quantitative"},
+            "latitude": {"field": "lat", "type": "quantitative"},
+            "size": {"field": "count", "type": "quantitative", "title": "Victims"},
+        }
+    else:
+        raise ValueError(f"Unknown chart type '{chart_type}'")
+    return spec
+
+
+def build_chart_data(kind: str, db_service, case_filter: CaseFilter, labels: Dict[str, str],
+                     include_spec: bool = False) -> Optional[Dict[str, Any]]:
+    """Aggregated series for the chart registered as kind, or None for an unknown chart.
+
+    labels are the title/xlabel/ylabel the PNG route is registered with, so both
+    renderings are captioned the same way.
+    """
+    title = filtered_title(labels.get("title", ""), case_filter)
+    xlabel, ylabel = labels.get("xlabel", ""), labels.get("ylabel", "")
+    payload: Dict[str, Any] = {"chart": kind, "filter": case_filter.to_params(),
+                               "title": title, "xlabel": xlabel, "ylabel": ylabel}
+    if kind == "victim_ages":
+        chart_type, values = "histogram", histogram_series(db_service.get_age_counts(case_filter))
+    elif kind == "victim_ethnicity":
+        chart_type, values = "bar", bar_series(db_service.get_ethnicity_counts(case_filter))
+    elif kind == "digital_vs_finalisation":
+        chart_type, values = "scatter", scatter_series(db_service.get_digital_vs_finalisation_counts(case_filter))
+    elif kind == "victim_postcode_map":
+        coords, point_weights, level_counts, total = get_geocode_service().locate_counts(
+            db_service.get_postcode_counts(case_filter))
+        chart_type, values = "map", map_series(coords, point_weights)
+        payload.update(total=total, mapped=sum(point_weights), resolved_by=level_counts)
+    else:
+        return None
+    payload["type"] = chart_type
+    payload["series"] = values
+    if include_spec:
+        payload["spec"] = vega_lite_spec(chart_type, title, xlabel, ylabel)
+    return payload
@@ -0,0 +1,94 @@
+# chart_figures.py - Pyplot-free figure templates and PNG output profiles for ChartService
+
+import io
+import threading
+from typing import TYPE_CHECKING, Any, Callable, Dict, NamedTuple, Optional, Tuple
+
+from config import CHART_PROFILES, CHART_STYLE
+from metrics import span
+
+if TYPE_CHECKING:
+    from matplotlib.axes import Axes
+
+
+class OutputProfile(NamedTuple):
+    """Size, resolution and PNG compression a chart is rendered with"""
+    size: Tuple[float, float]
+    dpi: int
+    compress_level: int  # zlib level 0-9: lower encodes faster, higher gives smaller files
+
+
+def output_profile(name: str) -> OutputProfile:
+    """Look up a named profile from CHART_PROFILES"""
+    settings = CHART_PROFILES[name]
+    return OutputProfile(tuple(settings['size']), settings['dpi'], settings['compress_level'])
+
+
+class FigureTemplate:
+    """A figure, canvas and axes kept between renders of one chart kind.
+
+    Figures are built on the object-oriented API (no pyplot registry), use
+    constrained layout so saving needs a single layout pass (or a fixed layout
+    laid out by setup), and are reset rather than rebuilt for each render.
+    """
+
+    def __init__(self, profile: OutputProfile,
+                 setup: Optional[Callable[["FigureTemplate"], Any]] = None):
+        # matplotlib is loaded with the first template, not when routes register their profiles
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.figure import Figure
+        self.profile = profile
+        self.figure = Figure(figsize=profile.size, dpi=profile.dpi,
+                             layout='constrained' if setup is None else None)
+        self.canvas = FigureCanvasAgg(self.figure)
+        # A fixed layout positions plain axes itself (a subplot can be snapped back to its grid)
+        self.ax = self.figure.add_subplot() if setup is None else self.figure.add_axes((0, 0, 1, 1))
+        # Shown only by renders that need it
+        self.colorbar = None
+        # Artists that survive reset(), e.g. the map's basemap image
+        self.static = setup(self) if setup is not None else None
+
+    def reset(self) -> "Axes":
+        """Clear the previous render's data, keeping the figure, canvas and static artists"""
+        if self.colorbar is not None:
+            self.colorbar.ax.set_visible(False)
+        if self.static is None:
+            self.ax.cla()
+        else:
+            for artist in (*self.ax.collections, *self.ax.patches, *self.ax.texts, *self.ax.lines):
+                artist.remove()
+        return self.ax
+
+    @span("png_encode")
+    def to_png(self) -> io.BytesIO:
+        """Draw and save the figure as PNG (timed together as the png_encode span)"""
+        buf = io.BytesIO()
+        self.figure.savefig(buf, format='png', dpi=self.profile.dpi,
+                            pil_kwargs={'compress_level': self.profile.compress_level})
+        buf.seek(0)
+        return buf
+
+
+def style_axes(ax: "Axes", title: str, xlabel: str, ylabel: str) -> None:
+    """Apply the shared CHART_STYLE title, label and tick styling"""
+    ax.set_title(title, fontsize=CHART_STYLE['title_size'], fontweight=CHART_STYLE['title_weight'])
+    ax.set_xlabel(xlabel, fontsize=CHART_STYLE['label_size'])
+    ax.set_ylabel(ylabel, fontsize=CHART_STYLE['label_size'])
+    ax.tick_params(labelsize=CHART_STYLE['tick_size'])
+
+
+# Templates are per thread, so concurrent renders never share a figure
+_local = threading.local()
+
+
+def get_template(kind: str, profile: OutputProfile,
+                 setup: Optional[Callable[[FigureTemplate], Any]] = None) -> FigureTemplate:
+    """This thread's template for (kind, profile), created on first use"""
+    templates: Dict[Tuple[str, OutputProfile], FigureTemplate] = getattr(_local, 'templates', None)
+    if templates is None:
+        templates = _local.templates = {}
+    key = (kind, profile)
+    template = templates.get(key)
+    if template is None:
+        template = templates[key] = FigureTemplate(profile, setup)
+    return template
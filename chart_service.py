@@ -1,50 +1,42 @@
 # chart_service.py - Service for generating charts and visualizations
 
 import io
-import time
+import threading
 from collections import Counter
-from typing import List, Tuple
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.cm import ScalarMappable
+from matplotlib.figure import Figure
 from matplotlib.ticker import MaxNLocator
 import cartopy.crs as ccrs
 import cartopy.feature as cfeature
-from geopy.geocoders import Nominatim
-from geopy.exc import GeocoderTimedOut, GeocoderUnavailable
 
-from config import CHART_SIZE, MAP_SIZE, CHART_DPI, CHART_STYLE, COLORS, GEO_CONFIG
+from chart_figures import FigureTemplate, OutputProfile, get_template, output_profile, style_axes
+from config import CHART_STYLE, COLORS, GEO_CONFIG
+from geocode_service import get_geocode_service
+
+# Map projection, and the rendered UK basemap keyed by (bounds, height in pixels)
+_MAP_PROJECTION = ccrs.Mercator()
+_basemaps = {}
+_basemap_lock = threading.Lock()
+
+DEFAULT_PROFILE = output_profile('chart')
+MAP_PROFILE = output_profile('map')
+# "No data" and error charts are smaller than the chart they stand in for
+MESSAGE_SIZE = (8, 4)
 
 
 class ChartService:
     """Service class for generating charts and visualizations"""
     
     @staticmethod
-    def create_chart_buffer() -> io.BytesIO:
-        """Create a BytesIO buffer for chart output"""
-        return io.BytesIO()
-    
-    @staticmethod
-    def setup_chart(figsize: Tuple[int, int] = CHART_SIZE) -> Tuple[plt.Figure, plt.Axes]:
-        """Set up a matplotlib figure and axis with consistent styling"""
-        plt.style.use('default')
-        fig, ax = plt.subplots(figsize=figsize, dpi=CHART_DPI)
-        return fig, ax
-    
-    @staticmethod
-    def save_and_close(buf: io.BytesIO, fig: plt.Figure) -> io.BytesIO:
-        """Save figure to buffer and clean up"""
-        plt.tight_layout()
-        fig.savefig(buf, format='png', bbox_inches='tight', dpi=CHART_DPI)
-        plt.close(fig)
-        buf.seek(0)
-        return buf
-    
-    @staticmethod
-    def create_no_data_chart(message: str = "No data available") -> io.BytesIO:
+    def create_no_data_chart(message: str = "No data available",
+                             profile: Optional[OutputProfile] = None) -> io.BytesIO:
         """Create a simple chart indicating no data is available"""
-        buf = ChartService.create_chart_buffer()
-        fig, ax = ChartService.setup_chart((8, 4))
+        profile = (profile or DEFAULT_PROFILE)._replace(size=MESSAGE_SIZE)
+        template = get_template('message', profile)
+        ax = template.reset()
         
         ax.text(0.5, 0.5, message, ha='center', va='center', 
                fontsize=16, color='gray')
@@ -52,39 +44,41 @@ class ChartService:
         ax.set_ylim(0, 1)
         ax.axis('off')
         
-        return ChartService.save_and_close(buf, fig)
+        return template.to_png()
     
     @staticmethod
-    def create_error_chart(error_msg: str) -> io.BytesIO:
+    def create_error_chart(error_msg: str, profile: Optional[OutputProfile] = None) -> io.BytesIO:
         """Create a chart showing an error message"""
-        return ChartService.create_no_data_chart(f"Error generating chart:\n{error_msg[:100]}...")
+        return ChartService.create_no_data_chart(f"Error generating chart:\n{error_msg[:100]}...", profile)
     
     @staticmethod
     def create_histogram(data: List[int], title: str, xlabel: str, ylabel: str) -> io.BytesIO:
         """Create a histogram chart"""
-        if not data:
-            return ChartService.create_no_data_chart()
+        return ChartService.create_histogram_from_counts(Counter(data), title, xlabel, ylabel)
+    
+    @staticmethod
+    def create_histogram_from_counts(value_counts: Dict[int, int], title: str, xlabel: str, ylabel: str,
+                                     profile: Optional[OutputProfile] = None) -> io.BytesIO:
+        """Create a histogram chart from precomputed {value: count} totals"""
+        if not value_counts:
+            return ChartService.create_no_data_chart(profile=profile)
         
-        buf = ChartService.create_chart_buffer()
-        fig, ax = ChartService.setup_chart()
+        template = get_template('histogram', profile or DEFAULT_PROFILE)
+        ax = template.reset()
         
         # Create bins for histogram
-        min_val, max_val = min(data), max(data)
+        min_val, max_val = min(value_counts), max(value_counts)
         bins = range(min_val, max_val + 2)
         
         counts, bin_edges, patches = ax.hist(
-            data, bins=bins, 
+            list(value_counts.keys()), bins=bins, 
+            weights=list(value_counts.values()),
             color=COLORS['histogram'], 
             alpha=CHART_STYLE['alpha'],
             edgecolor=CHART_STYLE['edge_color']
         )
         
-        # Styling
-        ax.set_title(title, fontsize=CHART_STYLE['title_size'], 
-                    fontweight=CHART_STYLE['title_weight'])
-        ax.set_xlabel(xlabel, fontsize=CHART_STYLE['label_size'])
-        ax.set_ylabel(ylabel, fontsize=CHART_STYLE['label_size'])
-        ax.tick_params(labelsize=CHART_STYLE['tick_size'])
+        style_axes(ax, title, xlabel, ylabel)
         
         # Force integer y-axis
         ax.yaxis.set_major_locator(MaxNLocator(integer=True))
@@ -102,21 +96,25 @@ class ChartService:
         
         ax.grid(True, alpha=CHART_STYLE['grid_alpha'])
         
-        return ChartService.save_and_close(buf, fig)
+        return template.to_png()
     
     @staticmethod
     def create_bar_chart(data: List[str], title: str, xlabel: str, ylabel: str) -> io.BytesIO:
         """Create a bar chart from categorical data"""
-        if not data:
-            return ChartService.create_no_data_chart()
+        return ChartService.create_bar_chart_from_counts(Counter(data), title, xlabel, ylabel)
+    
+    @staticmethod
+    def create_bar_chart_from_counts(category_counts: Dict[str, int], title: str, xlabel: str, ylabel: str,
+                                     profile: Optional[OutputProfile] = None) -> io.BytesIO:
+        """Create a bar chart from precomputed {category: count} totals"""
+        if not category_counts:
+            return ChartService.create_no_data_chart(profile=profile)
         
-        buf = ChartService.create_chart_buffer()
-        fig, ax = ChartService.setup_chart()
+        template = get_template('bar', profile or DEFAULT_PROFILE)
+        ax = template.reset()
         
-        # Count occurrences
-        counts = Counter(data)
-        categories = list(counts.keys())
-        values = list(counts.values())
+        categories = list(category_counts.keys())
+        values = list(category_counts.values())
         
         # Create bars
         bars = ax.bar(categories, values, 
@@ -124,16 +122,13 @@ class ChartService:
                      alpha=CHART_STYLE['alpha'],
                      edgecolor=CHART_STYLE['edge_color'])
         
-        # Styling
-        ax.set_title(title, fontsize=CHART_STYLE['title_size'], 
-                    fontweight=CHART_STYLE['title_weight'])
-        ax.set_xlabel(xlabel, fontsize=CHART_STYLE['label_size'])
-        ax.set_ylabel(ylabel, fontsize=CHART_STYLE['label_size'])
-        ax.tick_params(labelsize=CHART_STYLE['tick_size'])
+        style_axes(ax, title, xlabel, ylabel)
         
         # Rotate x-axis labels if needed
         if len(max(categories, key=len)) > 10:
-            plt.setp(ax.get_xticklabels(), rotation=45, ha='right')
+            ax.tick_params(axis='x', labelrotation=45)
+            for label in ax.get_xticklabels():
+                label.set_horizontalalignment('right')
         
         # Add value labels on bars
         for bar, value in zip(bars, values):
@@ -145,142 +140,225 @@ class ChartService:
         ax.yaxis.set_major_locator(MaxNLocator(integer=True))
         ax.grid(True, alpha=CHART_STYLE['grid_alpha'], axis='y')
         
-        return ChartService.save_and_close(buf, fig)
+        return template.to_png()
     
     @staticmethod
     def create_scatter_plot(pairs: List[Tuple], title: str, xlabel: str, ylabel: str) -> io.BytesIO:
         """Create a scatter plot from paired data"""
-        if not pairs:
-            return ChartService.create_no_data_chart()
+        pair_counts = [(x, y, count) for (x, y), count in Counter(pairs).items()]
+        return ChartService.create_scatter_plot_from_counts(pair_counts, title, xlabel, ylabel)
+    
+    @staticmethod
+    def create_scatter_plot_from_counts(pair_counts: List[Tuple], title: str, xlabel: str, ylabel: str,
+                                        profile: Optional[OutputProfile] = None) -> io.BytesIO:
+        """Create a scatter plot from precomputed (x, y, count) rows; marker area grows with count"""
+        if not pair_counts:
+            return ChartService.create_no_data_chart(profile=profile)
         
-        buf = ChartService.create_chart_buffer()
-        fig, ax = ChartService.setup_chart()
+        template = get_template('scatter', profile or DEFAULT_PROFILE)
+        ax = template.reset()
         
-        x_vals = [pair[0] for pair in pairs]
-        y_vals = [pair[1] for pair in pairs]
+        x_vals = [row[0] for row in pair_counts]
+        y_vals = [row[1] for row in pair_counts]
+        sizes = [60 * np.sqrt(row[2]) for row in pair_counts]
         
         # Create scatter plot
         ax.scatter(x_vals, y_vals, 
                   color=COLORS['secondary'], 
                   alpha=CHART_STYLE['alpha'],
-                  s=60, edgecolor=CHART_STYLE['edge_color'])
+                  s=sizes, edgecolor=CHART_STYLE['edge_color'])
         
-        # Styling
-        ax.set_title(title, fontsize=CHART_STYLE['title_size'], 
-                    fontweight=CHART_STYLE['title_weight'])
-        ax.set_xlabel(xlabel, fontsize=CHART_STYLE['label_size'])
-        ax.set_ylabel(ylabel, fontsize=CHART_STYLE['label_size'])
-        ax.tick_params(labelsize=CHART_STYLE['tick_size'])
+        style_axes(ax, title, xlabel, ylabel)
         
         ax.grid(True, alpha=CHART_STYLE['grid_alpha'])
         
-        return ChartService.save_and_close(buf, fig)
+        return template.to_png()
     
     @staticmethod
     def geocode_postcodes(postcodes: List[str]) -> Tuple[List[Tuple[float, float]], List[str]]:
-        """Geocode postcodes to coordinates with error handling and caching."""
-        import json
-        import os
-        cache_path = os.path.join(os.path.dirname(__file__), 'postcode_cache.json')
-        # Load cache
-        try:
-            with open(cache_path, 'r') as f:
-                cache = json.load(f)
-        except Exception:
-            cache = {}
-
-        geolocator = Nominatim(
-            user_agent=GEO_CONFIG['user_agent'],
-            timeout=GEO_CONFIG['timeout']
-        )
-
-        coords = []
-        failed_lookups = []
-        updated = False
-
-        for i, pc in enumerate(postcodes):
-            pc_key = pc.strip().upper()
-            if pc_key in cache:
-                lon, lat = cache[pc_key]
-                coords.append((lon, lat))
-                continue
-            try:
-                location = geolocator.geocode(f"{pc}, UK")
-                if location:
-                    lon, lat = location.longitude, location.latitude
-                    coords.append((lon, lat))
-                    cache[pc_key] = [lon, lat]
-                    updated = True
-                else:
-                    failed_lookups.append(pc)
-                # Rate limiting
-                if i < len(postcodes) - 1:
-                    time.sleep(GEO_CONFIG['rate_limit_delay'])
-            except (GeocoderTimedOut, GeocoderUnavailable) as e:
-                failed_lookups.append(pc)
-                print(f"Geocoding failed for {pc}: {e}")
-                continue
-            except Exception as e:
-                failed_lookups.append(pc)
-                print(f"Unexpected error geocoding {pc}: {e}")
-                continue
+        """Geocode postcodes to coordinates, resolving each distinct postcode once."""
+        return get_geocode_service().geocode(postcodes)
+    
+    @staticmethod
+    def plot_map_points(ax, x, y, extent, weights=None, colorbar=None):
+        """Draw projected points as a scatter, or as a fixed-size density layer when there are many.
 
-        if updated:
+        weights gives the number of victims at each point (1 each when omitted).
+        A density layer is keyed by colorbar (e.g. a template's), or by a new one.
+        Returns the colorbar used, or None for a plain scatter.
+        """
+        weights = np.ones(len(x)) if weights is None else np.asarray(weights, dtype=float)
+        mode = GEO_CONFIG['aggregation']
+        if mode == 'auto':
+            mode = 'hexbin' if weights.sum() > GEO_CONFIG['aggregate_threshold'] else 'points'
+        
+        if mode == 'hexbin':
+            layer = ax.hexbin(x, y, C=weights, reduce_C_function=np.sum,
+                              gridsize=GEO_CONFIG['bin_gridsize'], extent=extent,
+                              mincnt=1, cmap='Reds', alpha=0.8, zorder=5, edgecolors='none')
+        elif mode == 'grid':
+            counts, x_edges, y_edges = np.histogram2d(
+                x, y, bins=GEO_CONFIG['bin_gridsize'], range=[extent[:2], extent[2:]],
+                weights=weights)
+            layer = ax.pcolormesh(x_edges, y_edges, np.ma.masked_equal(counts.T, 0),
+                                  cmap='Reds', alpha=0.8, zorder=5)
+        else:
+            ax.scatter(x, y, 
+                      color=COLORS['map_points'], 
+                      s=50, alpha=0.8, 
+                      zorder=5, edgecolor='darkred')
+            return None
+        
+        # Binned layers draw a constant number of artists however many victims there are
+        if colorbar is None:
+            colorbar = ax.figure.colorbar(layer, ax=ax, shrink=0.6)
+            colorbar.set_label('Victims', fontsize=CHART_STYLE['label_size'])
+        else:
+            colorbar.update_normal(layer)
+            colorbar.ax.set_visible(True)
+        return colorbar
+    
+    @staticmethod
+    def render_basemap(bounds: Tuple[float, float, float, float], height_px: int,
+                       dpi: int = MAP_PROFILE.dpi) -> Tuple[np.ndarray, Tuple[float, ...]]:
+        """Draw the coastline/border/land/ocean basemap once; returns an RGBA image and its projected extent"""
+        west, east, south, north = bounds
+        corners = _MAP_PROJECTION.transform_points(ccrs.PlateCarree(),
+                                                   np.array([west, east]), np.array([south, north]))
+        aspect = (corners[1, 1] - corners[0, 1]) / (corners[1, 0] - corners[0, 0])
+        
+        # Off-screen Figure (no pyplot) sized to the projected aspect ratio
+        fig = Figure(figsize=(height_px / aspect / dpi, height_px / dpi), dpi=dpi)
+        canvas = FigureCanvasAgg(fig)
+        ax = fig.add_axes([0, 0, 1, 1], projection=_MAP_PROJECTION)
+        ax.set_extent(bounds, crs=ccrs.PlateCarree())
+        ax.add_feature(cfeature.COASTLINE, linewidth=0.8)
+        ax.add_feature(cfeature.BORDERS, linestyle=':', linewidth=0.6)
+        ax.add_feature(cfeature.LAND, facecolor='lightgray', alpha=0.3)
+        ax.add_feature(cfeature.OCEAN, facecolor='lightblue', alpha=0.3)
+        ax.set_axis_off()
+        canvas.draw()
+        
+        # Crop to the axes in case the equal-aspect adjustment left a margin
+        image = np.asarray(canvas.buffer_rgba())
+        x0, y0, x1, y1 = (int(round(v)) for v in ax.get_window_extent().extents)
+        height = image.shape[0]
+        image = image[height - y1:height - y0, x0:x1].copy()
+        return image, tuple(ax.get_extent())
+    
+    @staticmethod
+    def get_basemap(profile: OutputProfile = MAP_PROFILE) -> Tuple[np.ndarray, Tuple[float, ...]]:
+        """UK basemap for GEO_CONFIG['uk_bounds'], rendered once and cached in memory and on disk"""
+        bounds = tuple(float(v) for v in GEO_CONFIG['uk_bounds'])
+        # The map axes are limited by the figure height, so render at that resolution
+        height_px = int(profile.size[1] * profile.dpi)
+        key = (bounds, height_px)
+        with _basemap_lock:
+            if key in _basemaps:
+                return _basemaps[key]
+            
+            cache_path = GEO_CONFIG['basemap_cache']
+            basemap = None
             try:
-                with open(cache_path, 'w') as f:
-                    json.dump(cache, f)
-            except Exception as e:
-                print(f"Failed to update postcode cache: {e}")
-
-        if failed_lookups:
-            print(f"Failed to geocode {len(failed_lookups)}/{len(postcodes)} postcodes")
+                with np.load(cache_path) as cached:
+                    if tuple(cached['key']) == bounds + (height_px,):
+                        basemap = (cached['image'], tuple(cached['extent']))
+            except (OSError, KeyError, ValueError):
+                pass
+            
+            if basemap is None:
+                basemap = ChartService.render_basemap(bounds, height_px, profile.dpi)
+                try:
+                    np.savez_compressed(cache_path, key=np.array(bounds + (height_px,)),
+                                        image=basemap[0], extent=np.array(basemap[1]))
+                except OSError as e:
+                    print(f"Failed to save basemap cache: {e}")
+            
+            _basemaps[key] = basemap
+            return basemap
+    
+    @staticmethod
+    def setup_map_template(template: FigureTemplate, basemap: np.ndarray, extent: Tuple[float, ...]):
+        """Lay out a map template around the basemap and a (hidden) colorbar; returns the image artist.
 
-        return coords, failed_lookups
+        The layout is fixed, so only the point layer and title change between renders.
+        """
+        fig, ax = template.figure, template.ax
+        fig_width, fig_height = template.profile.size
+        # Leave room above for the three-line title and to the right for the colorbar
+        map_height = fig_height * 0.84
+        map_width = map_height * (extent[1] - extent[0]) / (extent[3] - extent[2])
+        if map_width > fig_width * 0.85:
+            map_height *= fig_width * 0.85 / map_width
+            map_width = fig_width * 0.85
+        left = (fig_width - map_width) / 2 / fig_width
+        bottom, width, height = 0.02, map_width / fig_width, map_height / fig_height
+        ax.set_position([left, bottom, width, height])
+        
+        image = ax.imshow(basemap, extent=extent, origin='upper', zorder=0)
+        ax.set_xlim(extent[0], extent[1])
+        ax.set_ylim(extent[2], extent[3])
+        ax.set_xticks([])
+        ax.set_yticks([])
+        
+        cax = fig.add_axes([left + width + 0.01, bottom + height * 0.2, 0.015, height * 0.6])
+        template.colorbar = fig.colorbar(ScalarMappable(cmap='Reds'), cax=cax)
+        template.colorbar.set_label('Victims', fontsize=CHART_STYLE['label_size'])
+        cax.set_visible(False)
+        return image
     
     @staticmethod
     def create_postcode_map(postcodes: List[str]) -> io.BytesIO:
         """Create a map visualization of postcodes"""
-        if not postcodes:
-            return ChartService.create_no_data_chart("No postcode data available")
-        
-        coords, failed_lookups = ChartService.geocode_postcodes(postcodes)
-        
-        buf = ChartService.create_chart_buffer()
-        
+        return ChartService.create_postcode_map_from_counts(Counter(postcodes))
+    
+    @staticmethod
+    def locate_postcode_counts(postcode_counts: Dict[str, int]) -> Tuple[List[Tuple[float, float]], List[int], Dict[str, int], int]:
+        """Geocode {postcode: victim count} totals; returns (coords, weights, victims per fallback level, total victims)"""
+        return get_geocode_service().locate_counts(postcode_counts)
+    
+    @staticmethod
+    def create_postcode_map_from_counts(postcode_counts: Dict[str, int],
+                                        title: str = "Victim Home Postcodes at Time of Offence",
+                                        profile: Optional[OutputProfile] = None) -> io.BytesIO:
+        """Create a map visualization from precomputed {postcode: victim count} totals"""
+        if not postcode_counts:
+            return ChartService.create_no_data_chart("No postcode data available", profile)
+        return ChartService.create_postcode_map_from_points(
+            *ChartService.locate_postcode_counts(postcode_counts), title=title, profile=profile)
+    
+    @staticmethod
+    def create_postcode_map_from_points(coords: List[Tuple[float, float]], point_weights: List[int],
+                                        level_counts: Dict[str, int], total: int,
+                                        title: str = "Victim Home Postcodes at Time of Offence",
+                                        profile: Optional[OutputProfile] = None) -> io.BytesIO:
+        """Create a map visualization from geocoded points (see locate_postcode_counts)"""
+        if not total:
+            return ChartService.create_no_data_chart("No postcode data available", profile)
         if not coords:
-            return ChartService.create_no_data_chart("No coordinates could be obtained from postcodes")
-        
-        # Create map
-        fig = plt.figure(figsize=MAP_SIZE, dpi=CHART_DPI)
-        ax = plt.axes(projection=ccrs.Mercator())
-        
-        # Set extent to UK
-        ax.set_extent(GEO_CONFIG['uk_bounds'], crs=ccrs.PlateCarree())
-        
-        # Add map features
-        ax.add_feature(cfeature.COASTLINE, linewidth=0.8)
-        ax.add_feature(cfeature.BORDERS, linestyle=':', linewidth=0.6)
-        ax.add_feature(cfeature.LAND, facecolor='lightgray', alpha=0.3)
-        ax.add_feature(cfeature.OCEAN, facecolor='lightblue', alpha=0.3)
-        
-        # Plot points
-        lons, lats = zip(*coords) if coords else ([], [])
-        ax.scatter(lons, lats, 
-                  color=COLORS['map_points'], 
-                  s=50, alpha=0.8, 
-                  transform=ccrs.PlateCarree(), 
-                  zorder=5, edgecolor='darkred')
+            return ChartService.create_no_data_chart("No coordinates could be obtained from postcodes", profile)
+        mapped = sum(point_weights)
+        profile = profile or MAP_PROFILE
+        
+        # Composite the points onto the cached basemap in projected (Mercator) coordinates.
+        # The basemap image stays on the template; only the point layer is redrawn.
+        basemap, extent = ChartService.get_basemap(profile)
+        template = get_template('postcode_map', profile,
+                                lambda template: ChartService.setup_map_template(template, basemap, extent))
+        ax = template.reset()
+        
+        lons, lats = (np.asarray(values, dtype=float) for values in zip(*coords))
+        projected = _MAP_PROJECTION.transform_points(ccrs.PlateCarree(), lons, lats)
+        ChartService.plot_map_points(ax, projected[:, 0], projected[:, 1], extent, point_weights,
+                                     template.colorbar)
         
         # Add title with stats
-        success_rate = len(coords) / len(postcodes) * 100 if postcodes else 0
-        ax.set_title(f"Victim Home Postcodes at Time of Offence\n"
-                    f"({len(coords)}/{len(postcodes)} postcodes mapped, {success_rate:.1f}%)",
+        success_rate = mapped / total * 100 if total else 0
+        levels = ", ".join(f"{level}: {count}" for level, count in level_counts.items())
+        ax.set_title(f"{title}\n"
+                    f"({mapped}/{total} postcodes mapped, {success_rate:.1f}%)\n"
+                    f"Resolved by {levels}",
                     fontsize=CHART_STYLE['title_size'], 
                     fontweight=CHART_STYLE['title_weight'])
         
-        plt.tight_layout()
-        fig.savefig(buf, format='png', bbox_inches='tight', dpi=CHART_DPI)
-        plt.close(fig)
-        buf.seek(0)
-        
-        return buf
\ No newline at end of file
+        return template.to_png()
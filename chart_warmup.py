@@ -0,0 +1,93 @@
+# chart_warmup.py - Background pre-rendering of every registered chart after an import
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Dict
+
+from chart_cache import CHART_REGISTRY, ChartRegistration, chart_cache
+from config import DB_PATH, WARMUP_WORKERS
+from db_snapshot import get_snapshot
+
+
+class ChartWarmup:
+    """Renders every chart in CHART_REGISTRY on a worker pool and stores the PNGs in the chart cache"""
+
+    def __init__(self, max_workers: int = WARMUP_WORKERS, db_path: str = DB_PATH):
+        self.max_workers = max_workers
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pending = False
+        self._status: Dict[str, Any] = {
+            'state': 'idle',
+            'data_version': None,
+            'started_at': None,
+            'finished_at': None,
+            'charts': {},
+        }
+
+    def start(self) -> None:
+        """Start a warm-up in the background (or queue one more if already running)"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                self._pending = True
+                return
+            self._thread = threading.Thread(target=self._run, name="chart-warmup", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            self.run_once()
+            with self._lock:
+                if not self._pending:
+                    return
+                self._pending = False
+
+    def run_once(self) -> Dict[str, Any]:
+        """Render all registered charts for the current data version and wait for them"""
+        version = get_snapshot(self.db_path).version
+        charts: Dict[str, Any] = {}
+        with self._lock:
+            self._status = {
+                'state': 'running',
+                'data_version': version,
+                'started_at': time.time(),
+                'finished_at': None,
+                'charts': charts,
+            }
+
+        with ThreadPoolExecutor(max_workers=self.max_workers,
+                                thread_name_prefix="chart-warmup") as pool:
+            futures = {pool.submit(self._render, registration, version): registration.kind
+                       for registration in list(CHART_REGISTRY.values())}
+            for future in as_completed(futures):
+                charts[futures[future]] = future.result()
+
+        with self._lock:
+            self._status['state'] = 'done'
+            self._status['finished_at'] = time.time()
+        return self.stats()
+
+    @staticmethod
+    def _render(registration: ChartRegistration, version: str) -> Dict[str, Any]:
+        start = time.perf_counter()
+        try:
+            # Shares the render with any page view already asking for this chart
+            png = chart_cache.get_or_render(registration.cache_key(version), registration.render_png).png
+            return {'status': 'ok',
+                    'seconds': round(time.perf_counter() - start, 3),
+                    'bytes': len(png)}
+        except Exception as e:
+            print(f"Chart warm-up failed for {registration.kind}: {e}")
+            return {'status': 'error',
+                    'seconds': round(time.perf_counter() - start, 3),
+                    'error': str(e)}
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self._status, 'charts': dict(self._status['charts'])}
+
+
+# Shared warm-up runner used after Excel imports
+chart_warmup = ChartWarmup()
@@ -2,22 +2,80 @@
 
 import os
 
-# Database configuration
-DB_PATH = os.path.join(os.path.dirname(__file__), "beaconport_db.json")
+# Database configuration: 'json' (TinyDB file) or 'sqlite' (normalised, indexed tables).
+# Copy existing data across with: python storage.py beaconport_db.json beaconport_db.sqlite3
+DB_BACKEND = os.environ.get("BEACONPORT_DB_BACKEND", "json")
+DB_PATHS = {
+    "json": os.path.join(os.path.dirname(__file__), "beaconport_db.json"),
+    "sqlite": os.path.join(os.path.dirname(__file__), "beaconport_db.sqlite3"),
+}
+# BEACONPORT_DB_PATH points the app at another database file (e.g. a benchmark dataset)
+DB_PATH = os.environ.get("BEACONPORT_DB_PATH") or DB_PATHS[DB_BACKEND]
+# Keep a pickle-protocol-5 copy of the database (<db>.snapshot) and load it instead of
+# re-parsing the database file whenever it is up to date
+BINARY_SNAPSHOT = True
 EXCEL_FILE = "Beaconport Capture.xlsx"
 
 # Chart configuration
 CHART_SIZE = (12, 7)
 MAP_SIZE = (14, 9)
 CHART_DPI = 180
+# Output profiles chart routes render with (see chart_figures.OutputProfile).
+# compress_level is the PNG zlib level: 1 encodes fastest, 9 gives the smallest files.
+CHART_PROFILES = {
+    'chart': {'size': CHART_SIZE, 'dpi': CHART_DPI, 'compress_level': 6},
+    'map': {'size': MAP_SIZE, 'dpi': CHART_DPI, 'compress_level': 6},
+}
+
+# Rendered chart cache (PNG bytes kept in memory, least recently used evicted first)
+CHART_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+# Load pandas, matplotlib/cartopy, the analytics engine and the render pool in the
+# background at startup instead of on the first chart request (BEACONPORT_WARM_UP=1)
+WARM_UP_ON_START = os.environ.get("BEACONPORT_WARM_UP", "") == "1"
+
+# Worker threads used to pre-render every chart after an Excel import
+WARMUP_WORKERS = 2
+
+# Worker processes that render charts (0 renders in the web process instead).
+# A render taking longer than timeout seconds has its worker killed and replaced.
+RENDER_POOL = {
+    'processes': min(4, os.cpu_count() or 1),
+    'timeout': 60,
+    'startup_timeout': 120,  # first render waits for the worker to import matplotlib/cartopy
+}
+
+# Request and stage timings served at /api/metrics (Prometheus text format)
+METRICS = {
+    'buckets': (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),  # seconds
+    'quantile_window': 1024,  # most recent observations per series behind p50/p95/p99
+    'server_timing': False,  # Server-Timing header on every response (else only with ?timing=1)
+}
+
+# Opt-in cProfile of the chart routes and Excel imports, listed at /admin/profiles.
+# 'enabled' profiles every call; with a token set, single requests can ask for it with
+# ?profile=<token>. With neither, the profiling wrappers are never installed.
+PROFILING = {
+    'enabled': os.environ.get("BEACONPORT_PROFILE", "") == "1",
+    'token': os.environ.get("BEACONPORT_PROFILE_TOKEN", ""),
+    'directory': os.path.join(os.path.dirname(__file__), 'profiles'),
+    'keep': 50,  # most recent profiles kept on disk
+    'top': 30,  # functions listed in a profile summary
+}
 
 # Field name constants
 class Fields:
+    BEACONPORT_REF = "Beaconport Ref"
     VICTIM_AGE = "Victim Age at Time of Offence"
     VICTIM_ETHNICITY = "Victim Ethnicity" 
     VICTIM_POSTCODE = "Victim Home Postcode at Time of Offence"
     DIGITAL_OPPORTUNITIES = "Digital Opportunities Present"
     CRIME_FINALISATION = "Crime Finalisation Code"
+    # Case fields that charts and stats can be filtered on
+    FORCE_CODE = "Force Code"
+    ALLOCATED_TO = "Allocated To"
+    OFFENCE_TYPE = "Offence Type"
+    OFFENCE_DATE = "Offence Date"
 
 # Chart styling
 CHART_STYLE = {
@@ -44,6 +102,23 @@ COLORS = {
 GEO_CONFIG = {
     'user_agent': 'beaconport_app',
     'timeout': 10,
-    'rate_limit_delay': 0.1,
-    'uk_bounds': [-8, 2, 49.5, 59]  # [west, east, south, north]
+    # Nominatim's usage policy allows at most 1 request per second. Every worker
+    # takes its turn from one shared limiter, so max_workers only overlaps the
+    # network latency of requests already spaced rate_limit_delay apart; it never
+    # raises the request rate. Keep this at 1.0 or more for the public service.
+    'rate_limit_delay': 1.0,  # minimum seconds between remote lookups, shared by all workers
+    'max_workers': 4,  # remote lookups allowed in flight at once
+    'uk_bounds': [-8, 2, 49.5, 59],  # [west, east, south, north]
+    'cache_db_path': os.path.join(os.path.dirname(__file__), 'postcode_cache.sqlite3'),
+    'legacy_cache_path': os.path.join(os.path.dirname(__file__), 'postcode_cache.json'),  # migrated once
+    'negative_ttl': 7 * 24 * 3600,  # seconds before a failed postcode is retried
+    # Offline postcode table (CSV with pcds/pcd/postcode and lat/long columns, e.g. ONS NSPL)
+    'lookup_table': os.path.join(os.path.dirname(__file__), 'postcode_lookup.csv'),
+    'remote_backend': 'nominatim',  # or None to never make network calls
+    # Map rendering: 'points', 'hexbin', 'grid', or 'auto' (points until aggregate_threshold)
+    'aggregation': 'auto',
+    'aggregate_threshold': 500,
+    'bin_gridsize': 40,
+    # Pre-rendered basemap for uk_bounds, reused by every map request
+    'basemap_cache': os.path.join(os.path.dirname(__file__), 'uk_basemap.npz')
 }
\ No newline at end of file
@@ -1,68 +1,120 @@
 # database_service.py - Database service for handling data operations
 
-import json
-import os
-from typing import List, Dict, Any
-from tinydb import TinyDB
-from config import DB_PATH, Fields
+from collections.abc import Mapping
+from typing import TYPE_CHECKING, List, Dict, Any, Optional, Tuple
+from config import DB_PATH
+from db_snapshot import get_snapshot
+from aggregates import AggregateTables, load_or_compute
+from case_filters import CaseFilter
+from dataset_metadata import read_metadata
+from metrics import span
+from storage import get_storage
+
+if TYPE_CHECKING:
+    from analytics_engine import AnalyticsEngine
 
 
 class DatabaseService:
-    def get_digital_vs_finalisation_pairs(self) -> list:
+    def get_digital_vs_finalisation_pairs(self) -> List[Tuple[Any, Any]]:
         """Return a list of (digital_opportunities, crime_finalisation) pairs for all cases."""
-        data = self.get_data()
-        pairs = []
-        for case in data.get("cases", {}).values():
-            digital = None
-            case_data_list = case.get("case_data", [])
-            if case_data_list and isinstance(case_data_list[0], dict):
-                digital = case_data_list[0].get(Fields.DIGITAL_OPPORTUNITIES)
-            finalisation = None
-            offence_details_list = case.get("offence_details", [])
-            if offence_details_list and isinstance(offence_details_list[0], dict):
-                finalisation = offence_details_list[0].get(Fields.CRIME_FINALISATION)
-            # Only include pairs where both values exist and are not None
-            if digital is not None and finalisation is not None:
-                pairs.append((digital, finalisation))
-        return pairs
+        # Only includes pairs where both values exist and are not None
+        return list(self.get_engine().digital_vs_finalisation_pairs())
     """Service class for handling database operations"""
     
     def __init__(self, db_path: str = DB_PATH):
         self.db_path = db_path
+        self.storage = get_storage(db_path)
+    
+    def get_data(self) -> Mapping[str, Any]:
+        """Return the shared read-only snapshot of the database file"""
+        return get_snapshot(self.db_path).data
+    
+    def get_data_version(self) -> str:
+        """Get the content hash of the currently loaded database file"""
+        return get_snapshot(self.db_path).version
+    
+    def get_engine(self) -> "AnalyticsEngine":
+        """Get the vectorised analytics engine for the current snapshot (built once per load)"""
+        # pandas/numpy are only loaded once something needs the engine
+        from analytics_engine import AnalyticsEngine
+        return get_snapshot(self.db_path).derived("analytics", span("analytics_build")(AnalyticsEngine.build))
+    
+    def get_aggregates(self) -> AggregateTables:
+        """Get the materialised aggregates for the current snapshot.
+
+        SQLite databases answer with SQL aggregates; JSON ones are aggregated by
+        the analytics engine and persisted next to the DB.
+        """
+        snapshot = get_snapshot(self.db_path)
+
+        @span("aggregates_build")
+        def build(data):
+            if self.storage.supports_queries:
+                return self.storage.aggregates(snapshot.version)
+            return load_or_compute(self.db_path, snapshot.version,
+                                   lambda: AggregateTables.from_engine(snapshot.version, self.get_engine()))
+
+        return snapshot.derived("aggregates", build)
+    
+    def get_filtered_aggregates(self, case_filter: Optional[CaseFilter] = None) -> AggregateTables:
+        """Get the aggregates for the cases matching case_filter (all cases when empty)"""
+        if case_filter is None or case_filter.is_empty():
+            return self.get_aggregates()
+        if self.storage.supports_queries:
+            return self.storage.aggregates(self.get_data_version(), case_filter)
+        engine = self.get_engine()
+        return AggregateTables.from_engine(self.get_data_version(), engine, engine.select(case_filter))
+    
+    def _get_counts(self, table: str, case_filter: Optional[CaseFilter]):
+        """One aggregate table, computed only for the cases matching case_filter"""
+        if case_filter is None or case_filter.is_empty() or self.storage.supports_queries:
+            return getattr(self.get_filtered_aggregates(case_filter), table)
+        engine = self.get_engine()
+        return getattr(engine, table)(engine.select(case_filter))
+    
+    def get_age_counts(self, case_filter: Optional[CaseFilter] = None) -> Dict[int, int]:
+        """Get the number of victims at each age"""
+        return self._get_counts("age_counts", case_filter)
+    
+    def get_ethnicity_counts(self, case_filter: Optional[CaseFilter] = None) -> Dict[str, int]:
+        """Get the number of victims of each ethnicity"""
+        return self._get_counts("ethnicity_counts", case_filter)
+    
+    def get_postcode_counts(self, case_filter: Optional[CaseFilter] = None) -> Dict[str, int]:
+        """Get the number of victims at each home postcode"""
+        return self._get_counts("postcode_counts", case_filter)
+    
+    def get_digital_vs_finalisation_counts(self, case_filter: Optional[CaseFilter] = None) -> List[Tuple[Any, Any, int]]:
+        """Get (digital_opportunities, crime_finalisation, case_count) for each distinct pair"""
+        return self._get_counts("pair_counts", case_filter)
     
-    def get_data(self) -> Dict[str, Any]:
-        """Load data from JSON database file"""
-        try:
-            if not os.path.exists(self.db_path):
-                return {"cases": {}}
-            with open(self.db_path, "r") as f:
-                return json.load(f)
-        except (json.JSONDecodeError, IOError) as e:
-            print(f"Error loading database: {e}")
-            return {"cases": {}}
+    def get_filtered_counts(self, case_filter: CaseFilter) -> Tuple[int, int]:
+        """Get (case_count, victim_count) for the cases matching case_filter"""
+        if self.storage.supports_queries:
+            return self.storage.counts(case_filter)
+        engine = self.get_engine()
+        rows = engine.select(case_filter)
+        return engine.case_count(rows), engine.victim_count(rows)
+    
+    def get_filter_options(self) -> Dict[str, List[str]]:
+        """Get the distinct values of each filterable case field"""
+        return self.get_engine().index.choices
+    
+    def get_snapshot_stats(self) -> Dict[str, Any]:
+        """Get hit/miss/reload counters for the shared database snapshot"""
+        return get_snapshot(self.db_path).stats()
+    
+    def get_dataset_counts(self) -> Dict[str, Any]:
+        """Get the case/victim counts stored with the dataset (read once per load)"""
+        return get_snapshot(self.db_path).derived("metadata", read_metadata)
     
     def get_case_count(self) -> int:
-        """Get count of unique cases in database"""
-        try:
-            db = TinyDB(self.db_path)
-            cases_table = db.table("cases")
-            all_cases = cases_table.all()
-            unique_refs = set()
-            
-            for case in all_cases:
-                if 'main' in case:
-                    main_data = case['main']
-                    # Get first non-empty value as unique identifier
-                    for value in main_data.values():
-                        if value and str(value).strip():
-                            unique_refs.add(str(value).strip())
-                            break
-            
-            db.close()
-            return len(unique_refs)
-        except Exception as e:
-            print(f"Error getting case count: {e}")
-            return 0
+        """Get count of unique cases (Beaconport Refs) in database"""
+        return self.get_dataset_counts()["case_count"]
+    
+    def get_victim_count(self) -> int:
+        """Get count of victim records in database"""
+        return self.get_dataset_counts()["victim_count"]
     
     def get_all_victims(self) -> List[Dict[str, Any]]:
         """Get all victim records from all cases"""
@@ -72,6 +124,7 @@ class DatabaseService:
             victims.extend(case.get("victim_details", []))
         return victims
     
+    @span("field_values")
     def get_field_values(self, field_name: str, data_source: str = "victim_details") -> List[Any]:
         """Extract values for a specific field from specified data source"""
         data = self.get_data()
@@ -81,11 +134,11 @@ class DatabaseService:
             source_data = case.get(data_source, [])
             
             # Handle both list and single item cases
-            if not isinstance(source_data, list):
+            if not isinstance(source_data, (list, tuple)):
                 source_data = [source_data] if source_data else []
             
             for item in source_data:
-                if isinstance(item, dict):
+                if isinstance(item, Mapping):
                     value = item.get(field_name)
                     if value is not None and str(value).strip():
                         values.append(value)
@@ -94,35 +147,15 @@ class DatabaseService:
     
     def get_victim_ages(self) -> List[int]:
         """Get all victim ages, filtered and converted to integers"""
-        ages = self.get_field_values(Fields.VICTIM_AGE)
-        clean_ages = []
-        
-        for age in ages:
-            try:
-                age_int = int(age)
-                if 0 <= age_int <= 120:  # Reasonable age range
-                    clean_ages.append(age_int)
-            except (ValueError, TypeError):
-                continue
-                
-        return clean_ages
+        return self.get_engine().ages.values.tolist()
     
     def get_victim_ethnicities(self) -> List[str]:
         """Get all victim ethnicities, cleaned"""
-        ethnicities = self.get_field_values(Fields.VICTIM_ETHNICITY)
-        return [str(e).strip() for e in ethnicities if str(e).strip()]
+        return self.get_engine().ethnicities.values.tolist()
     
     def get_victim_postcodes(self) -> List[str]:
         """Get all victim postcodes, cleaned"""
-        postcodes = self.get_field_values(Fields.VICTIM_POSTCODE)
-        clean_postcodes = []
-        
-        for pc in postcodes:
-            pc_str = str(pc).strip().upper()
-            if pc_str and len(pc_str) >= 4:  # Basic postcode validation
-                clean_postcodes.append(pc_str)
-        
-        return clean_postcodes
+        return self.get_engine().postcodes.values.tolist()
     
     def get_finalisation_vs_digital_correlation(self) -> Dict[str, Dict[str, int]]:
         """
@@ -130,32 +163,4 @@ class DatabaseService:
         Includes all instances, even if one of the values is missing (None or empty).
         Returns a nested dictionary: {finalisation: {digital_opportunity: count, ...}, ...}
         """
-        data = self.get_data()
-        correlation = {}
-
-        for case in data.get("cases", {}).values():
-            # Get digital opportunities data
-            digital = None
-            case_data_list = case.get("case_data", [])
-            if case_data_list and isinstance(case_data_list[0], dict):
-                digital = case_data_list[0].get(Fields.DIGITAL_OPPORTUNITIES)
-
-            # Get crime finalisation data  
-            finalisation = None
-            offence_details_list = case.get("offence_details", [])
-            if offence_details_list and isinstance(offence_details_list[0], dict):
-                finalisation = offence_details_list[0].get(Fields.CRIME_FINALISATION)
-
-            # Use string representation, even for missing values
-            finalisation_str = str(finalisation).strip() if finalisation is not None else ""
-            digital_str = str(digital).strip() if digital is not None else ""
-
-            if finalisation_str not in correlation:
-                correlation[finalisation_str] = {}
-            if digital_str not in correlation[finalisation_str]:
-                correlation[finalisation_str][digital_str] = 0
-            correlation[finalisation_str][digital_str] += 1
-
-        return correlation
-        
-        return pairs
\ No newline at end of file
+        return self.get_aggregates().correlation
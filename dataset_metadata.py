@@ -0,0 +1,71 @@
+# dataset_metadata.py - Case/victim counts stored alongside the cases in the JSON database
+
+from collections.abc import Mapping
+from typing import Any, Dict, Optional
+
+from case_values import iter_records
+from config import Fields
+
+# Bump when the metadata layout changes so older files are recounted on load
+METADATA_SCHEMA = 2
+# TinyDB-style table and document id the metadata is written under
+METADATA_TABLE = "metadata"
+METADATA_DOC_ID = "1"
+
+
+def case_ref(case: Mapping) -> Optional[str]:
+    """The case's Beaconport Ref, stripped (None when missing or blank)"""
+    main = case.get("main")
+    if not isinstance(main, Mapping):
+        return None
+    ref = main.get(Fields.BEACONPORT_REF)
+    if ref is None or not str(ref).strip():
+        return None
+    return str(ref).strip()
+
+
+def victim_records(case: Mapping) -> int:
+    """Victim records in a case, counted the way the analytics engine and filters count them"""
+    return sum(1 for _ in iter_records(case, "victim_details"))
+
+
+class DatasetCounter:
+    """Accumulates dataset counts one case at a time, e.g. while an import writes the database"""
+
+    def __init__(self):
+        self.refs = set()
+        self.case_documents = 0
+        self.victim_count = 0
+
+    def add(self, case: Mapping, ref: Optional[str] = None) -> None:
+        ref = ref if ref is not None else case_ref(case)
+        if ref is not None:
+            self.refs.add(str(ref).strip())
+        self.case_documents += 1
+        self.victim_count += victim_records(case)
+
+    def to_metadata(self) -> Dict[str, Any]:
+        return {
+            "schema": METADATA_SCHEMA,
+            "ref_field": Fields.BEACONPORT_REF,
+            "case_count": len(self.refs),
+            "case_documents": self.case_documents,
+            "victim_count": self.victim_count,
+        }
+
+
+def count_cases(data: Mapping[str, Any]) -> Dict[str, Any]:
+    """Count unique Beaconport Refs and victims with one pass over the cases"""
+    counter = DatasetCounter()
+    for case in data.get("cases", {}).values():
+        counter.add(case)
+    return counter.to_metadata()
+
+
+def read_metadata(data: Mapping[str, Any]) -> Dict[str, Any]:
+    """Counts stored by the last import, or counted now for databases written without them"""
+    table = data.get(METADATA_TABLE)
+    stored = table.get(METADATA_DOC_ID) if isinstance(table, Mapping) else None
+    if isinstance(stored, Mapping) and stored.get("schema") == METADATA_SCHEMA:
+        return dict(stored)
+    return count_cases(data)
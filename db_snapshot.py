@@ -0,0 +1,224 @@
+# db_snapshot.py - Process-wide, mtime-validated snapshot of the case database
+
+import gc
+import hashlib
+import os
+import threading
+from contextlib import contextmanager
+from types import MappingProxyType
+from typing import Any, Callable, Dict, Mapping, Optional, Tuple
+
+from binary_snapshot import file_signature, load_snapshot, write_snapshot
+from config import BINARY_SNAPSHOT
+from metrics import span
+from storage import get_storage
+
+EMPTY_DATA = MappingProxyType({"cases": MappingProxyType({})})
+
+
+def freeze(value: Any) -> Any:
+    """Recursively convert dicts and lists into read-only mappings and tuples"""
+    if isinstance(value, dict):
+        return MappingProxyType({key: freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+@contextmanager
+def paused_gc():
+    """Suspend the cyclic GC while building a large acyclic structure.
+
+    Decoding and freezing allocate millions of containers, which otherwise
+    trigger repeated collections that find nothing to free.
+    """
+    was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if was_enabled:
+            gc.enable()
+
+
+def read_database(storage) -> Tuple[Mapping[str, Any], str, Tuple[int, int, int]]:
+    """Parse and freeze a database file; returns (data, version, file signature)"""
+    with open(storage.path, "rb") as f:
+        signature = file_signature(os.fstat(f.fileno()))
+        raw = f.read()
+    with paused_gc():
+        data = storage.parse(raw)
+        if not isinstance(data, dict):
+            data = {"cases": {}}
+        data.setdefault("cases", {})
+        frozen = freeze(data)
+    return frozen, hashlib.sha1(raw).hexdigest()[:16], signature
+
+
+def write_binary_snapshot(db_path: str) -> bool:
+    """Parse the database file once and write its binary snapshot (used after imports)"""
+    try:
+        frozen, version, signature = read_database(get_storage(db_path))
+    except (OSError, ValueError) as e:
+        print(f"Could not read {db_path} to build a binary snapshot: {e}")
+        return False
+    return write_snapshot(db_path, frozen, version, signature)
+
+
+class DatabaseSnapshot:
+    """Parsed, read-only copy of a database file shared by every reader in the process.
+
+    The file is only re-parsed when its (mtime, size, inode) signature changes,
+    e.g. after import_excel.py rewrites it. When a binary snapshot matching that
+    signature exists it is loaded instead of parsing the file; otherwise one is
+    written after parsing, so the next cold start is fast.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.storage = get_storage(db_path)
+        self._lock = threading.Lock()
+        # Re-entrant: a builder may itself ask for other derived data
+        self._derived_lock = threading.RLock()
+        self._derived: Dict[str, Any] = {}
+        self._signature: Optional[Tuple[int, int, int]] = None
+        self._data: Mapping[str, Any] = EMPTY_DATA
+        self._version = ""
+        self._mtime: Optional[float] = None
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+        self.binary_loads = 0
+
+    _stat_signature = staticmethod(file_signature)
+
+    def _current_signature(self) -> Optional[Tuple[int, int, int]]:
+        try:
+            return self._stat_signature(os.stat(self.db_path))
+        except OSError:
+            return None
+
+    def _load_binary(self) -> Optional[Tuple[Mapping[str, Any], str, Tuple[int, int, int]]]:
+        """Load the binary snapshot if it was written from the current file"""
+        if not BINARY_SNAPSHOT:
+            return None
+        signature = self._current_signature()
+        if signature is None:
+            return None
+        loaded = load_snapshot(self.db_path, signature)
+        if loaded is None:
+            return None
+        self.binary_loads += 1
+        frozen, version = loaded
+        return frozen, version, signature
+
+    def _load(self) -> None:
+        """Parse the file and swap in the new snapshot (caller holds the lock)"""
+        try:
+            with span("db_load"):
+                with paused_gc():
+                    loaded = self._load_binary()
+                if loaded is not None:
+                    frozen, version, signature = loaded
+                else:
+                    frozen, version, signature = read_database(self.storage)
+                    if BINARY_SNAPSHOT:
+                        write_snapshot(self.db_path, frozen, version, signature)
+        except FileNotFoundError:
+            self._signature = None
+            self._data = EMPTY_DATA
+            self._derived = {}
+            self._version = ""
+            self._mtime = None
+            return
+        except (ValueError, IOError) as e:
+            # Keep serving the previous snapshot; the signature is left alone so
+            # the next read retries (the file may be half-way through a rewrite).
+            print(f"Error loading database: {e}")
+            return
+
+        if self._signature is None and self._version == "":
+            self.misses += 1
+        else:
+            self.reloads += 1
+
+        self._data = frozen
+        self._derived = {}
+        self._version = version
+        self._signature = signature
+        self._mtime = signature[0] / 1e9
+
+    def _refresh(self) -> None:
+        signature = self._current_signature()
+        if signature is not None and signature == self._signature:
+            self.hits += 1
+            return
+        with self._lock:
+            # Another thread may have reloaded while we waited for the lock
+            if signature is not None and signature == self._signature:
+                self.hits += 1
+                return
+            if signature is None and self._signature is None and self._version == "":
+                self.hits += 1
+                return
+            self._load()
+
+    @property
+    def data(self) -> Mapping[str, Any]:
+        """Read-only view of the current database contents"""
+        self._refresh()
+        return self._data
+
+    @property
+    def version(self) -> str:
+        """Content hash of the currently loaded file ('' when there is no database)"""
+        self._refresh()
+        return self._version
+
+    @property
+    def mtime(self) -> Optional[float]:
+        """Modification time of the currently loaded file"""
+        self._refresh()
+        return self._mtime
+
+    def derived(self, name: str, builder: Callable[[Mapping[str, Any]], Any]) -> Any:
+        """Return builder(data), computed once per loaded version of the file"""
+        self._refresh()
+        with self._lock:
+            data, derived = self._data, self._derived
+        if name in derived:
+            return derived[name]
+        with self._derived_lock:
+            if name not in derived:
+                derived[name] = builder(data)
+        return derived[name]
+
+    def invalidate(self) -> None:
+        """Force the next read to re-parse the file"""
+        with self._lock:
+            self._signature = None
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss/reload counters for monitoring"""
+        return {
+            "db_path": self.db_path,
+            "version": self._version,
+            "hits": self.hits,
+            "misses": self.misses,
+            "reloads": self.reloads,
+            "binary_loads": self.binary_loads,
+        }
+
+
+_snapshots: Dict[str, DatabaseSnapshot] = {}
+_snapshots_lock = threading.Lock()
+
+
+def get_snapshot(db_path: str) -> DatabaseSnapshot:
+    """Return the shared snapshot for a database file, creating it on first use"""
+    key = os.path.abspath(db_path)
+    snapshot = _snapshots.get(key)
+    if snapshot is None:
+        with _snapshots_lock:
+            snapshot = _snapshots.setdefault(key, DatabaseSnapshot(key))
+    return snapshot
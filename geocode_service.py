@@ -0,0 +1,389 @@
+# geocode_service.py - Postcode geocoding with pluggable local and remote backends
+
+import csv
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from config import GEO_CONFIG
+from geocode_store import GeocodeStore
+from metrics import metrics, span
+from singleflight import SingleFlight
+
+Coordinate = Tuple[float, float]  # (lon, lat)
+
+# Geocode precision levels, most precise first
+FALLBACK_LEVELS = ("postcode", "sector", "district")
+
+
+def normalise_postcode(postcode) -> str:
+    """Upper-case a postcode and put exactly one space before the inward code"""
+    compact = "".join(str(postcode).split()).upper()
+    if len(compact) >= 5:
+        return f"{compact[:-3]} {compact[-3:]}"
+    return compact
+
+
+def postcode_sector(postcode) -> Optional[str]:
+    """Postcode sector, e.g. "NR2 2" for "NR2 2NN" (None for partial postcodes)"""
+    outward, _, inward = normalise_postcode(postcode).partition(" ")
+    return f"{outward} {inward[0]}" if inward else None
+
+
+def outward_code(postcode) -> str:
+    """Outward code (postcode district), e.g. "NR2" for "NR2 2NN" """
+    return normalise_postcode(postcode).partition(" ")[0]
+
+
+class AreaCentroids:
+    """Mean coordinate of the known postcodes in each sector and each outward code"""
+
+    def __init__(self, points: Iterable[Tuple[str, Coordinate]]):
+        sums: Dict[Tuple[str, str], List[float]] = {}
+        for postcode, (lon, lat) in points:
+            keys = [("district", outward_code(postcode))]
+            sector = postcode_sector(postcode)
+            if sector:
+                keys.append(("sector", sector))
+            for key in keys:
+                total = sums.setdefault(key, [0.0, 0.0, 0])
+                total[0] += lon
+                total[1] += lat
+                total[2] += 1
+        self.sectors: Dict[str, Coordinate] = {}
+        self.districts: Dict[str, Coordinate] = {}
+        for (level, area), (lon_sum, lat_sum, count) in sums.items():
+            table = self.sectors if level == "sector" else self.districts
+            table[area] = (lon_sum / count, lat_sum / count)
+
+    def lookup(self, postcode: str) -> Tuple[Optional[Coordinate], Optional[str]]:
+        """Return (coordinate, level) for the most precise area that is known"""
+        sector = postcode_sector(postcode)
+        if sector and sector in self.sectors:
+            return self.sectors[sector], "sector"
+        district = outward_code(postcode)
+        if district in self.districts:
+            return self.districts[district], "district"
+        return None, None
+
+
+class RateLimiter:
+    """Spaces calls at least min_interval seconds apart across all threads sharing it"""
+
+    def __init__(self, min_interval: float):
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+
+    def wait(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            delay = self._next_slot - now
+            self._next_slot = max(now, self._next_slot) + self.min_interval
+        if delay > 0:
+            time.sleep(delay)
+
+
+class GeocodeBackend:
+    """Base class for geocoding backends"""
+    name = "base"
+    remote = False
+
+    def lookup_many(self, postcodes: List[str]) -> Dict[str, Optional[Coordinate]]:
+        """Resolve normalised postcodes.
+
+        A postcode mapped to None was definitively not found; postcodes left out
+        of the result hit a transient error and may be retried later.
+        """
+        raise NotImplementedError
+
+    def known_points(self) -> Iterable[Tuple[str, Coordinate]]:
+        """Postcodes this backend can resolve offline, used to build area centroids"""
+        return ()
+
+    def points_version(self) -> int:
+        """Counter that changes whenever known_points() would return something different"""
+        return 0
+
+
+class LocalPostcodeTable(GeocodeBackend):
+    """Offline postcode -> (lon, lat) table loaded from a CSV (e.g. an ONS postcode directory extract)"""
+    name = "local"
+
+    POSTCODE_COLUMNS = ("pcds", "pcd", "postcode", "pcd7", "pcd8")
+    LAT_COLUMNS = ("lat", "latitude")
+    LON_COLUMNS = ("long", "lon", "lng", "longitude")
+
+    def __init__(self, csv_path: str):
+        self.csv_path = csv_path
+        self._table: Optional[Dict[str, Coordinate]] = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _find_column(fieldnames: Iterable[str], candidates: Tuple[str, ...]) -> Optional[str]:
+        lookup = {name.strip().lower(): name for name in fieldnames}
+        for candidate in candidates:
+            if candidate in lookup:
+                return lookup[candidate]
+        return None
+
+    def _load(self) -> Dict[str, Coordinate]:
+        table: Dict[str, Coordinate] = {}
+        if not self.csv_path or not os.path.exists(self.csv_path):
+            return table
+        try:
+            with open(self.csv_path, newline="", encoding="utf-8-sig") as f:
+                reader = csv.DictReader(f)
+                fieldnames = reader.fieldnames or []
+                pc_col = self._find_column(fieldnames, self.POSTCODE_COLUMNS)
+                lat_col = self._find_column(fieldnames, self.LAT_COLUMNS)
+                lon_col = self._find_column(fieldnames, self.LON_COLUMNS)
+                if not (pc_col and lat_col and lon_col):
+                    print(f"Postcode lookup table {self.csv_path} has no postcode/lat/long columns")
+                    return table
+                for row in reader:
+                    try:
+                        table[normalise_postcode(row[pc_col])] = (float(row[lon_col]), float(row[lat_col]))
+                    except (TypeError, ValueError):
+                        continue
+        except (IOError, csv.Error) as e:
+            print(f"Failed to load postcode lookup table: {e}")
+        return table
+
+    @property
+    def table(self) -> Dict[str, Coordinate]:
+        if self._table is None:
+            with self._lock:
+                if self._table is None:
+                    self._table = self._load()
+        return self._table
+
+    def lookup_many(self, postcodes: List[str]) -> Dict[str, Optional[Coordinate]]:
+        table = self.table
+        return {pc: table.get(pc) for pc in postcodes}
+
+    def known_points(self) -> Iterable[Tuple[str, Coordinate]]:
+        return self.table.items()
+
+    def points_version(self) -> int:
+        # The table never changes once loaded
+        return 1 if self.table else 0
+
+
+class NominatimBackend(GeocodeBackend):
+    """Remote Nominatim lookups on a bounded thread pool sharing one rate limit"""
+    name = "nominatim"
+    remote = True
+
+    # Shared by every instance so concurrent requests can't exceed the limit together
+    _rate_limiter = RateLimiter(GEO_CONFIG['rate_limit_delay'])
+
+    def __init__(self, max_workers: int = GEO_CONFIG['max_workers']):
+        self.max_workers = max_workers
+        self._geolocator = None
+        self._retryable_errors: Tuple[type, ...] = ()
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        """Create the geopy client on the first cache miss, so geopy is only imported when needed"""
+        if self._geolocator is None:
+            with self._lock:
+                if self._geolocator is None:
+                    from geopy.geocoders import Nominatim
+                    from geopy.exc import GeocoderTimedOut, GeocoderUnavailable
+                    self._retryable_errors = (GeocoderTimedOut, GeocoderUnavailable)
+                    self._geolocator = Nominatim(
+                        user_agent=GEO_CONFIG['user_agent'],
+                        timeout=GEO_CONFIG['timeout']
+                    )
+        return self._geolocator
+
+    def _lookup(self, postcode: str) -> Tuple[bool, Optional[Coordinate]]:
+        """Return (definitive, coordinate) for one postcode"""
+        geolocator = self._connect()
+        self._rate_limiter.wait()
+        try:
+            location = geolocator.geocode(f"{postcode}, UK")
+            if location:
+                return True, (location.longitude, location.latitude)
+            return True, None
+        except self._retryable_errors as e:
+            print(f"Geocoding failed for {postcode}: {e}")
+        except Exception as e:
+            print(f"Unexpected error geocoding {postcode}: {e}")
+        return False, None
+
+    def lookup_many(self, postcodes: List[str]) -> Dict[str, Optional[Coordinate]]:
+        if not postcodes:
+            return {}
+        self._connect()
+        with ThreadPoolExecutor(max_workers=self.max_workers,
+                                thread_name_prefix="geocode") as pool:
+            results = zip(postcodes, pool.map(self._lookup, postcodes))
+            return {pc: coord for pc, (definitive, coord) in results if definitive}
+
+
+class GeocodeService:
+    """Deduplicates postcodes, then resolves them from the cache and each backend in turn"""
+
+    def __init__(self, backends: List[GeocodeBackend], store: GeocodeStore):
+        self.backends = backends
+        self.store = store
+        self._centroids: Optional[AreaCentroids] = None
+        self._centroids_version: Optional[Tuple[int, ...]] = None
+        self._centroids_lock = threading.Lock()
+        # Identical concurrent lookups (e.g. a dozen map requests at once) share one pass
+        self._lookups = SingleFlight()
+
+    @property
+    def coalesced_lookups(self) -> int:
+        """Lookups answered by joining an identical one already in flight"""
+        return self._lookups.coalesced
+
+    def area_centroids(self) -> AreaCentroids:
+        """Sector/outward-code centroids of every cached or locally known postcode"""
+        version = (self.store.points_version(), *(backend.points_version() for backend in self.backends))
+        with self._centroids_lock:
+            # Rebuild only when postcodes have been resolved since the last build
+            if self._centroids is None or version != self._centroids_version:
+                local = [point for backend in self.backends for point in backend.known_points()]
+                self._centroids = AreaCentroids(local + self.store.known_points())
+                self._centroids_version = version
+            return self._centroids
+
+    def resolve(self, postcodes: Iterable[str]) -> Dict[str, Optional[Coordinate]]:
+        """Resolve each distinct normalised postcode once"""
+        unique = list(dict.fromkeys(normalise_postcode(pc) for pc in postcodes))
+        # Cached failures count as resolved (to None) until their TTL expires
+        resolved = self.store.get_many(unique)
+        missing = tuple(pc for pc in unique if pc not in resolved)
+        if missing:
+            resolved.update(self._lookups.do(missing, lambda: self._lookup_backends(missing)))
+        return {pc: resolved.get(pc) for pc in unique}
+
+    def _lookup_backends(self, postcodes: Iterable[str]) -> Dict[str, Optional[Coordinate]]:
+        """Ask each backend in turn for the postcodes the ones before it could not place"""
+        resolved: Dict[str, Optional[Coordinate]] = {}
+        for backend in self.backends:
+            remaining = [pc for pc in postcodes if pc not in resolved]
+            if not remaining:
+                break
+            metrics.inc("geocode_lookups_total", len(remaining), backend=backend.name)
+            results = backend.lookup_many(remaining)
+            if backend.remote:
+                self.store.put_many(results)
+                resolved.update(results)
+            else:
+                resolved.update({pc: coord for pc, coord in results.items() if coord is not None})
+        return resolved
+
+    def geocode(self, postcodes: List[str]) -> Tuple[List[Coordinate], List[str]]:
+        """Geocode postcodes, returning one coordinate per resolved input plus the failures"""
+        resolved = self.resolve(postcodes)
+        coords = []
+        failed_lookups = []
+        for pc in postcodes:
+            coord = resolved.get(normalise_postcode(pc))
+            if coord is None:
+                failed_lookups.append(pc)
+            else:
+                coords.append(coord)
+
+        if failed_lookups:
+            print(f"Failed to geocode {len(failed_lookups)}/{len(postcodes)} postcodes")
+
+        return coords, failed_lookups
+
+    def locate(self, postcodes: Iterable[str]) -> Dict[str, Tuple[Optional[Coordinate], Optional[str]]]:
+        """Place each distinct normalised postcode at the most precise level available.
+
+        Falls back from the full postcode to the sector centroid, then the
+        outward-code centroid; (None, None) means it could not be placed at all.
+        """
+        resolved = self.resolve(postcodes)
+        located = {pc: (coord, "postcode") for pc, coord in resolved.items() if coord is not None}
+        unresolved = [pc for pc, coord in resolved.items() if coord is None]
+        if unresolved:
+            centroids = self.area_centroids()
+            for pc in unresolved:
+                located[pc] = centroids.lookup(pc)
+        return located
+
+    @span("geocode")
+    def locate_counts(self, postcode_counts: Dict[str, int]) -> Tuple[List[Coordinate], List[int], Dict[str, int], int]:
+        """Geocode {postcode: victim count} totals for a map.
+
+        Returns (coords, weights, victims per fallback level, total victims);
+        each distinct postcode is located once and weighted by its victims.
+        """
+        weights: Dict[str, int] = {}
+        for pc, count in postcode_counts.items():
+            key = normalise_postcode(pc)
+            weights[key] = weights.get(key, 0) + count
+        located = self.locate(weights)
+
+        coords = []
+        point_weights = []
+        level_counts = {level: 0 for level in FALLBACK_LEVELS}
+        for pc, count in weights.items():
+            coord, level = located[pc]
+            if coord is not None:
+                coords.append(coord)
+                point_weights.append(count)
+                level_counts[level] += count
+        total = sum(weights.values())
+        mapped = sum(point_weights)
+        if mapped < total:
+            print(f"Failed to geocode {total - mapped}/{total} postcodes at any level")
+        return coords, point_weights, level_counts, total
+
+    @span("geocode")
+    def geocode_with_fallback(self, postcodes: List[str]) -> Tuple[List[Coordinate], List[str], Dict[str, int]]:
+        """Geocode postcodes with the sector/outward-code fallback chain.
+
+        Returns one coordinate per resolved input, the inputs that could not be
+        placed at any level, and the number of inputs resolved at each level.
+        """
+        located = self.locate(postcodes)
+        coords = []
+        failed_lookups = []
+        level_counts = {level: 0 for level in FALLBACK_LEVELS}
+        for pc in postcodes:
+            coord, level = located.get(normalise_postcode(pc), (None, None))
+            if coord is None:
+                failed_lookups.append(pc)
+            else:
+                coords.append(coord)
+                level_counts[level] += 1
+
+        if failed_lookups:
+            print(f"Failed to geocode {len(failed_lookups)}/{len(postcodes)} postcodes at any level")
+
+        return coords, failed_lookups, level_counts
+
+
+def build_backends() -> List[GeocodeBackend]:
+    """Backends in lookup order: the local table first, then the configured remote service"""
+    backends: List[GeocodeBackend] = [LocalPostcodeTable(GEO_CONFIG['lookup_table'])]
+    if GEO_CONFIG['remote_backend'] == 'nominatim':
+        backends.append(NominatimBackend())
+    return backends
+
+
+_service: Optional[GeocodeService] = None
+_service_lock = threading.Lock()
+
+
+def get_geocode_service() -> GeocodeService:
+    """Return the shared geocode service, building it on first use"""
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                store = GeocodeStore(GEO_CONFIG['cache_db_path'],
+                                     GEO_CONFIG['negative_ttl'],
+                                     GEO_CONFIG['legacy_cache_path'])
+                _service = GeocodeService(build_backends(), store)
+    return _service
@@ -0,0 +1,154 @@
+# geocode_store.py - Durable SQLite-backed postcode cache shared by all app processes
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+Coordinate = Tuple[float, float]  # (lon, lat)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS geocodes (
+    postcode   TEXT PRIMARY KEY,
+    lon        REAL,
+    lat        REAL,
+    resolved   INTEGER NOT NULL,
+    updated_at REAL NOT NULL
+)
+"""
+
+
+class GeocodeStore:
+    """Postcode -> coordinate cache in SQLite (WAL mode), mirrored in memory.
+
+    Rows are appended/replaced individually, so a new postcode never rewrites
+    the whole cache and concurrent workers can't clobber each other. Failed
+    lookups are stored too and are treated as cached until negative_ttl expires.
+    """
+
+    def __init__(self, db_path: str, negative_ttl: float, legacy_json_path: Optional[str] = None):
+        self.db_path = db_path
+        self.negative_ttl = negative_ttl
+        self.legacy_json_path = legacy_json_path
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._positive: Dict[str, Coordinate] = {}
+        self._negative: Dict[str, float] = {}  # postcode -> time of the failed lookup
+        self._points_version = 0  # bumped whenever the set of resolved postcodes changes
+        self.hits = 0
+        self.misses = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open the database and load it into memory (caller holds the lock)"""
+        if self._conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(SCHEMA)
+            conn.commit()
+            self._conn = conn
+            self._migrate_legacy_json()
+            for postcode, lon, lat, resolved, updated_at in conn.execute(
+                    "SELECT postcode, lon, lat, resolved, updated_at FROM geocodes"):
+                self._remember(postcode, (lon, lat) if resolved else None, updated_at)
+        return self._conn
+
+    def _migrate_legacy_json(self) -> None:
+        """Import the old postcode_cache.json the first time the store is created"""
+        if not self.legacy_json_path or not os.path.exists(self.legacy_json_path):
+            return
+        if self._conn.execute("SELECT 1 FROM geocodes LIMIT 1").fetchone():
+            return
+        try:
+            with open(self.legacy_json_path, 'r') as f:
+                legacy = json.load(f)
+        except Exception as e:
+            print(f"Failed to read legacy postcode cache: {e}")
+            return
+        now = time.time()
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO geocodes VALUES (?, ?, ?, 1, ?)",
+                [(pc, lon, lat, now) for pc, (lon, lat) in legacy.items()])
+
+    def _remember(self, postcode: str, coord: Optional[Coordinate], updated_at: float) -> None:
+        if coord is None:
+            if self._positive.pop(postcode, None) is not None:
+                self._points_version += 1
+            self._negative[postcode] = updated_at
+        else:
+            self._negative.pop(postcode, None)
+            if self._positive.get(postcode) != coord:
+                self._points_version += 1
+            self._positive[postcode] = coord
+
+    def _lookup_memory(self, postcode: str, now: float) -> Tuple[bool, Optional[Coordinate]]:
+        if postcode in self._positive:
+            return True, self._positive[postcode]
+        failed_at = self._negative.get(postcode)
+        if failed_at is not None and now - failed_at < self.negative_ttl:
+            return True, None
+        return False, None
+
+    def get_many(self, postcodes: Iterable[str]) -> Dict[str, Optional[Coordinate]]:
+        """Return cached entries (None for an unexpired failure); uncached postcodes are omitted"""
+        now = time.time()
+        found: Dict[str, Optional[Coordinate]] = {}
+        with self._lock:
+            conn = self._connect()
+            for pc in postcodes:
+                hit, coord = self._lookup_memory(pc, now)
+                if not hit:
+                    # Another process may have resolved it since we loaded
+                    row = conn.execute(
+                        "SELECT lon, lat, resolved, updated_at FROM geocodes WHERE postcode = ?",
+                        (pc,)).fetchone()
+                    if row is not None:
+                        lon, lat, resolved, updated_at = row
+                        self._remember(pc, (lon, lat) if resolved else None, updated_at)
+                        hit, coord = self._lookup_memory(pc, now)
+                if hit:
+                    self.hits += 1
+                    found[pc] = coord
+                else:
+                    self.misses += 1
+        return found
+
+    def put_many(self, results: Dict[str, Optional[Coordinate]]) -> None:
+        """Store lookup results; None records a failed lookup"""
+        if not results:
+            return
+        now = time.time()
+        rows = [(pc, coord[0] if coord else None, coord[1] if coord else None,
+                 1 if coord else 0, now) for pc, coord in results.items()]
+        with self._lock:
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.executemany("INSERT OR REPLACE INTO geocodes VALUES (?, ?, ?, ?, ?)", rows)
+            except sqlite3.Error as e:
+                print(f"Failed to update postcode cache: {e}")
+            for pc, coord in results.items():
+                self._remember(pc, coord, now)
+
+    def points_version(self) -> int:
+        """Counter that changes whenever known_points() would return something different"""
+        with self._lock:
+            self._connect()
+            return self._points_version
+
+    def known_points(self) -> List[Tuple[str, Coordinate]]:
+        """Every successfully resolved postcode in the store"""
+        with self._lock:
+            self._connect()
+            return list(self._positive.items())
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "resolved": len(self._positive),
+            "failed": len(self._negative),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
@@ -2,9 +2,14 @@
 import sys
 import os
 import json
+import hashlib
+import time
+import openpyxl
 import pandas as pd
 import numpy as np
-from tinydb import TinyDB
+from dataset_metadata import DatasetCounter
+from storage import get_storage
+from db_snapshot import write_binary_snapshot
 
 # function to clean and process data
 def clean_value(val):
@@ -40,9 +45,9 @@ def clean_value(val):
     # fallback to str
     return str(val)
 
-# function to find the reference column in a dataframe
-def find_ref_col(df):
-    cols = list(df.columns)
+# function to find the reference column among a sheet's column names
+def find_ref_col(columns):
+    cols = list(columns)
     # Normalise and search
     for col in cols:
         key = str(col).strip().lower()
@@ -63,66 +68,229 @@ def clean_row(row):
 def normalise_sheet_key(sheet_name):
     return sheet_name.strip().lower().replace(" ", "_")
 
-# main function to import excel data into TinyDB
-def import_excel_to_db(filepath, db_path="beaconport_db.json", truncate=True):
-    if not os.path.exists(filepath):
-        raise FileNotFoundError(f"Excel file not found: {filepath}")
-    # open workbook
-    xls = pd.ExcelFile(filepath)
-    # Read every sheet into a DataFrame
-    sheets = {}
-    for sheet_name in xls.sheet_names:
-        # read with dtype=object to avoid unneeded conversions
-        df = pd.read_excel(filepath, sheet_name=sheet_name, dtype=object)
-        sheets[sheet_name] = df
-    # Initialize TinyDB
-    db = TinyDB(db_path)
-    table = db.table("cases")
-    if truncate:
-        table.truncate()
-    # Build lookups per sheet keyed by case ref
-    lookups = {}
-    for sheet_name, df in sheets.items():
-        ref_col = find_ref_col(df)
-        records = df.to_dict(orient="records")
-        lookup = {}
-        for r in records:
-            ref_val = clean_value(r.get(ref_col))
-            if ref_val is None:
-                # skip rows without a reference
+# Rows between progress callbacks
+PROGRESS_EVERY = 1000
+
+# Strings pandas.read_excel treats as missing by default, so streamed imports match earlier ones
+NA_STRINGS = frozenset([
+    "", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND",
+    "1.#QNAN", "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null",
+])
+
+# function to turn a header row into unique column names (same rules as pandas)
+def column_names(header):
+    header = list(header)
+    # trailing empty header cells are not columns
+    while header and header[-1] is None:
+        header.pop()
+    names = []
+    seen = {}
+    for i, name in enumerate(header):
+        if name is None:
+            name = f"Unnamed: {i}"
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        names.append(name)
+    return names
+
+# function to stream a worksheet as row dictionaries without loading it all
+def iter_sheet_rows(ws):
+    rows = ws.iter_rows(values_only=True)
+    header = next(rows, None)
+    columns = column_names(header or [])
+
+    def generate():
+        width = len(columns)
+        for values in rows:
+            if values is None or all(v is None for v in values):
                 continue
-            lookup.setdefault(ref_val, []).append(clean_row(r))
-        lookups[sheet_name] = {"ref_col": ref_col, "lookup": lookup, "original_count": len(records)}
-    # Determine main sheet: prefer "Beaconport Main" if present, else use first sheet
-    main_sheet_name = "Beaconport Main" if "Beaconport Main" in sheets else list(sheets.keys())[0]
-    main_ref_col = find_ref_col(sheets[main_sheet_name])
-    inserted = 0
-    # Iterate main sheet rows and assemble combined records
-    for r in sheets[main_sheet_name].to_dict(orient="records"):
-        ref = clean_value(r.get(main_ref_col))
+            values = list(values[:width]) + [None] * (width - len(values))
+            yield {col: (None if isinstance(v, str) and v in NA_STRINGS else v)
+                   for col, v in zip(columns, values)}
+
+    return columns, generate()
+
+# function to hash a case's content (main row plus every linked sheet row)
+def case_hash(case):
+    payload = json.dumps(case, sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+# function to index existing cases by (ref, occurrence) -> (doc_id, content hash)
+def index_cases(cases):
+    index = {}
+    occurrences = {}
+    for doc_id in sorted(cases, key=int):
+        main = cases[doc_id].get("main", {})
+        ref = clean_value(main.get(find_ref_col(main.keys())))
         if ref is None:
             continue
-        combined = {}
-        combined["main"] = clean_row(r)
-        # attach all other sheet matches
-        for sheet_name, info in lookups.items():
+        occurrence = occurrences.get(ref, 0)
+        occurrences[ref] = occurrence + 1
+        index[(ref, occurrence)] = (doc_id, case_hash(cases[doc_id]))
+    return index
+
+# main function to import excel data into the case database
+# (the storage backend - TinyDB JSON or SQLite - is chosen by db_path's extension;
+#  incremental=True upserts only cases whose content hash changed and removes vanished refs;
+#  progress, if given, is called as progress(phase, rows_processed) while the import runs;
+#  binary_snapshot=True also writes the fast-loading <db>.snapshot copy after a rewrite)
+def import_excel_to_db(filepath, db_path="beaconport_db.json", truncate=True, incremental=False,
+                       progress=None, binary_snapshot=True):
+    if not os.path.exists(filepath):
+        raise FileNotFoundError(f"Excel file not found: {filepath}")
+    started = time.perf_counter()
+    storage = get_storage(db_path)
+    rows_processed = [0]
+
+    def report(phase, rows=0):
+        rows_processed[0] += rows
+        if progress is not None:
+            progress(phase, rows_processed[0])
+
+    report("opening workbook")
+    # open workbook for streaming, read-only row iteration
+    wb = openpyxl.load_workbook(filepath, read_only=True, data_only=True)
+    try:
+        sheet_names = wb.sheetnames
+        # Determine main sheet: prefer "Beaconport Main" if present, else use first sheet
+        main_sheet_name = "Beaconport Main" if "Beaconport Main" in sheet_names else sheet_names[0]
+        # Build lookups per linked sheet keyed by case ref, in a single pass each
+        lookups = {}
+        sheet_metrics = {}
+        for sheet_name in sheet_names:
             if sheet_name == main_sheet_name:
                 continue
-            matched = info["lookup"].get(ref, [])
-            combined_key = normalise_sheet_key(sheet_name)
-            combined[combined_key] = matched
-        table.insert(combined)
-        inserted += 1
+            sheet_start = time.perf_counter()
+            report(f"reading {sheet_name}")
+            columns, rows = iter_sheet_rows(wb[sheet_name])
+            ref_col = find_ref_col(columns)
+            lookup = {}
+            count = 0
+            for r in rows:
+                count += 1
+                if count % PROGRESS_EVERY == 0:
+                    report(f"reading {sheet_name}", PROGRESS_EVERY)
+                ref_val = clean_value(r.get(ref_col))
+                if ref_val is None:
+                    # skip rows without a reference
+                    continue
+                lookup.setdefault(ref_val, []).append(clean_row(r))
+            lookups[sheet_name] = lookup
+            sheet_metrics[sheet_name] = sheet_timing(ref_col, count, sheet_start)
+            report(f"reading {sheet_name}", count % PROGRESS_EVERY)
+
+        # Stream main sheet rows, attach linked rows and write each case as we go
+        # (the main sheet's timing therefore includes writing the database)
+        existing = storage.load_cases() if incremental or not truncate else {}
+        existing_index = index_cases(existing) if incremental else {}
+        next_id = max((int(k) for k in existing), default=0) + 1
+        main_start = time.perf_counter()
+        report(f"writing cases from {main_sheet_name}")
+        main_columns, main_rows = iter_sheet_rows(wb[main_sheet_name])
+        main_ref_col = find_ref_col(main_columns)
+        counts = {"rows": 0, "inserted": 0}
+        changes = {"added": 0, "updated": 0, "removed": 0, "unchanged": 0}
+        changed_refs = []
+
+        def documents():
+            if not incremental:
+                yield from existing.items()
+            occurrences = {}
+            for r in main_rows:
+                counts["rows"] += 1
+                if counts["rows"] % PROGRESS_EVERY == 0:
+                    report(f"writing cases from {main_sheet_name}", PROGRESS_EVERY)
+                ref = clean_value(r.get(main_ref_col))
+                if ref is None:
+                    continue
+                combined = {}
+                combined["main"] = clean_row(r)
+                # attach all other sheet matches
+                for sheet_name, lookup in lookups.items():
+                    combined[normalise_sheet_key(sheet_name)] = lookup.get(ref, [])
+                if incremental:
+                    occurrence = occurrences.get(ref, 0)
+                    occurrences[ref] = occurrence + 1
+                    previous = existing_index.pop((ref, occurrence), None)
+                    if previous is not None:
+                        doc_id, previous_hash = previous
+                        if previous_hash == case_hash(combined):
+                            changes["unchanged"] += 1
+                            yield doc_id, existing[doc_id]
+                        else:
+                            changes["updated"] += 1
+                            changed_refs.append(ref)
+                            yield doc_id, combined
+                        continue
+                    changes["added"] += 1
+                    changed_refs.append(ref)
+                yield next_id + counts["inserted"], combined
+                counts["inserted"] += 1
+            # refs still left in the index are no longer in the workbook
+            for ref, _ in existing_index:
+                changes["removed"] += 1
+                changed_refs.append(ref)
+
+        def has_changes():
+            return not incremental or changes["added"] + changes["updated"] + changes["removed"] > 0
+
+        # count unique refs and victims as the cases are written, so readers never have to
+        counter = DatasetCounter()
+
+        def counted(docs):
+            for doc_id, doc in docs:
+                counter.add(doc)
+                yield doc_id, doc
+
+        written = storage.write(counted(documents()), keep=has_changes,
+                                metadata=counter.to_metadata)
+    finally:
+        wb.close()
+    if written and binary_snapshot:
+        report("writing binary snapshot")
+        write_binary_snapshot(db_path)
+    report("done", counts["rows"] % PROGRESS_EVERY)
+    sheet_metrics = {main_sheet_name: sheet_timing(main_ref_col, counts["rows"], main_start),
+                     **sheet_metrics}
     # Summary
     summary = {
         "file": filepath,
         "db": db_path,
-        "sheets_read": {name: {"ref_col": info["ref_col"], "rows": info["original_count"]} for name, info in lookups.items()},
-        "cases_inserted": inserted
+        "sheets_read": {name: sheet_metrics[name] for name in sheet_names},
+        "cases_inserted": counts["inserted"],
+        "dataset": counter.to_metadata(),
+        "db_written": written,
+        "total_seconds": round(time.perf_counter() - started, 3),
     }
+    if incremental:
+        summary["changes"] = {**changes, "changed_refs": changed_refs}
     print(json.dumps(summary, indent=2))
     return summary
 
+# function to report rows read and throughput for one sheet
+def sheet_timing(ref_col, rows, start):
+    seconds = time.perf_counter() - start
+    return {
+        "ref_col": ref_col,
+        "rows": rows,
+        "seconds": round(seconds, 3),
+        "rows_per_sec": round(rows / seconds, 1) if seconds > 0 else None,
+    }
+
 if __name__ == "__main__":
-    path = sys.argv[1] if len(sys.argv) > 1 else "Beaconport Capture.xlsx"
-    import_excel_to_db(path)
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    path = args[0] if args else "Beaconport Capture.xlsx"
+    incremental = "--incremental" in sys.argv[1:]
+    if "--profile" in sys.argv[1:]:
+        # Stored with the web app's profiles, so it can be read at /admin/profiles too
+        from profiling import profile_call, profile_store
+        _, record = profile_call("import_excel_to_db", import_excel_to_db, path, detail=path, incremental=incremental)
+        if record is not None:
+            print(profile_store.summary(record.id))
+        else:
+            print("Another profiler is active; the import ran unprofiled")
+    else:
+        import_excel_to_db(path, incremental=incremental)
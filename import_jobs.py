@@ -0,0 +1,105 @@
+# import_jobs.py - In-process background Excel import jobs with progress reporting
+
+import itertools
+import queue
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+# Finished jobs kept around for status polling
+MAX_FINISHED_JOBS = 20
+
+
+class ImportJob:
+    """State of one queued or running Excel import"""
+
+    def __init__(self, job_id: str, excel_file: str, incremental: bool, profile: bool = False):
+        self.id = job_id
+        self.excel_file = excel_file
+        self.incremental = incremental
+        self.profile = profile
+        self.status = 'queued'  # queued -> running -> succeeded | failed
+        self.phase = 'queued'
+        self.rows_processed = 0
+        self.message = ''
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    @property
+    def active(self) -> bool:
+        return self.status in ('queued', 'running')
+
+    def update_progress(self, phase: str, rows_processed: int) -> None:
+        self.phase = phase
+        self.rows_processed = rows_processed
+
+    def to_dict(self) -> Dict[str, Any]:
+        end = self.finished_at or time.time()
+        return {
+            'job_id': self.id,
+            'status': self.status,
+            'phase': self.phase,
+            'rows_processed': self.rows_processed,
+            'incremental': self.incremental,
+            'message': self.message,
+            'elapsed_seconds': round(end - self.started_at, 2) if self.started_at else 0.0,
+        }
+
+
+class ImportJobRunner:
+    """Runs imports one at a time on a background worker thread.
+
+    Only one import may be queued or running at once: submitting while another
+    is active returns the active job instead of starting a second one.
+    """
+
+    def __init__(self, run_import: Callable[..., Tuple[bool, str]]):
+        self._run_import = run_import
+        self._queue: "queue.Queue[ImportJob]" = queue.Queue()
+        self._jobs: "OrderedDict[str, ImportJob]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._worker: Optional[threading.Thread] = None
+
+    def submit(self, excel_file: str, incremental: bool = False, profile: bool = False) -> Tuple[ImportJob, bool]:
+        """Queue an import (run under cProfile if profile); returns (job, created)"""
+        with self._lock:
+            for job in self._jobs.values():
+                if job.active:
+                    return job, False
+            job = ImportJob(f"{int(time.time())}-{next(self._ids)}", excel_file, incremental, profile)
+            self._jobs[job.id] = job
+            self._prune()
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._work, name="excel-import", daemon=True)
+                self._worker.start()
+        self._queue.put(job)
+        return job, True
+
+    def get(self, job_id: str) -> Optional[ImportJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _prune(self) -> None:
+        finished = [job_id for job_id, job in self._jobs.items() if not job.active]
+        for job_id in finished[:-MAX_FINISHED_JOBS]:
+            del self._jobs[job_id]
+
+    def _work(self) -> None:
+        while True:
+            job = self._queue.get()
+            job.status = 'running'
+            job.phase = 'starting'
+            job.started_at = time.time()
+            try:
+                success, message = self._run_import(job.excel_file, incremental=job.incremental,
+                                                    progress=job.update_progress, profile=job.profile)
+            except Exception as e:
+                success, message = False, f"Error running import: {str(e)}"
+            job.message = message
+            job.status = 'succeeded' if success else 'failed'
+            job.phase = 'done'
+            job.finished_at = time.time()
+            self._queue.task_done()
@@ -0,0 +1,218 @@
+# metrics.py - Request latency histograms, hot-path timing spans and Prometheus text output
+
+import bisect
+import contextlib
+import threading
+import time
+from collections import deque
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+from config import METRICS
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+QUANTILES = (0.5, 0.95, 0.99)
+
+Labels = Tuple[Tuple[str, str], ...]
+Span = Tuple[str, float]  # (stage, seconds)
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram that also keeps a window of recent values for quantiles"""
+
+    def __init__(self, buckets: Sequence[float] = METRICS['buckets'],
+                 window: int = METRICS['quantile_window']):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # the last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self.recent: "deque[float]" = deque(maxlen=window)
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+        self.recent.append(value)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """q-quantile of the recent window (nearest rank), None before the first observation"""
+        if not self.recent:
+            return None
+        ordered = sorted(self.recent)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def cumulative(self) -> List[Tuple[str, int]]:
+        """(le, count) pairs in Prometheus bucket order"""
+        total = 0
+        rows = []
+        for bound, count in zip((*map(format_value, self.buckets), "+Inf"), self.counts):
+            total += count
+            rows.append((bound, total))
+        return rows
+
+
+class MetricFamily(NamedTuple):
+    """One metric name with its TYPE/HELP lines and samples as (suffix, labels, value)"""
+    name: str
+    type: str
+    help: str
+    samples: List[Tuple[str, Dict[str, str], float]]
+
+
+def format_value(value: float) -> str:
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def escape_label(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def exposition(families: Iterable[MetricFamily]) -> str:
+    """Prometheus text exposition format for the given metric families"""
+    lines = []
+    for family in families:
+        lines.append(f"# HELP {family.name} {family.help}")
+        lines.append(f"# TYPE {family.name} {family.type}")
+        for suffix, labels, value in family.samples:
+            label_text = ",".join(f'{key}="{escape_label(val)}"' for key, val in labels.items())
+            lines.append(f"{family.name}{suffix}{{{label_text}}} {format_value(value)}" if label_text
+                         else f"{family.name}{suffix} {format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+def histogram_families(name: str, help_text: str, label: str,
+                       histograms: Dict[str, Histogram]) -> List[MetricFamily]:
+    """A histogram family plus a gauge of its recent p50/p95/p99, one series per label value"""
+    buckets: List[Tuple[str, Dict[str, str], float]] = []
+    quantiles: List[Tuple[str, Dict[str, str], float]] = []
+    for key, histogram in sorted(histograms.items()):
+        for bound, count in histogram.cumulative():
+            buckets.append(("_bucket", {label: key, "le": bound}, count))
+        buckets.append(("_sum", {label: key}, round(histogram.sum, 6)))
+        buckets.append(("_count", {label: key}, histogram.count))
+        for q in QUANTILES:
+            value = histogram.quantile(q)
+            if value is not None:
+                quantiles.append(("", {label: key, "quantile": format_value(q)}, round(value, 6)))
+    return [MetricFamily(name, "histogram", help_text, buckets),
+            MetricFamily(f"{name}_recent", "gauge",
+                         f"{help_text} (p50/p95/p99 of the most recent observations)", quantiles)]
+
+
+def cache_families(name: str, help_text: str, hits: int, misses: int) -> List[MetricFamily]:
+    """hits/misses counters and the hit ratio for one cache"""
+    lookups = hits + misses
+    return [MetricFamily(f"{name}_hits_total", "counter", f"{help_text} hits", [("", {}, hits)]),
+            MetricFamily(f"{name}_misses_total", "counter", f"{help_text} misses", [("", {}, misses)]),
+            MetricFamily(f"{name}_hit_ratio", "gauge", f"{help_text} hit ratio",
+                         [("", {}, round(hits / lookups, 4) if lookups else 0)])]
+
+
+# HELP text for the counters MetricsRegistry.inc() is called with
+COUNTER_HELP = {
+    "requests_total": "Requests handled, by route and status",
+    "response_bytes_total": "Response body bytes served, by route",
+    "geocode_lookups_total": "Postcodes sent to a geocoding backend, by backend",
+}
+
+
+class MetricsRegistry:
+    """Per-route request latency, per-stage span latency and labelled counters for this process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests: Dict[str, Histogram] = {}
+        self.spans: Dict[str, Histogram] = {}
+        self.counters: Dict[Tuple[str, Labels], float] = {}
+        self.started = time.time()
+
+    def observe_request(self, route: str, status: int, seconds: float, response_bytes: int) -> None:
+        with self._lock:
+            self.requests.setdefault(route, Histogram()).observe(seconds)
+        self.inc("requests_total", route=route, status=str(status))
+        self.inc("response_bytes_total", response_bytes, route=route)
+
+    def observe_span(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            self.spans.setdefault(stage, Histogram()).observe(seconds)
+
+    def inc(self, name: str, amount: float = 1, **labels: str) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def families(self) -> List[MetricFamily]:
+        with self._lock:
+            requests = {route: self._copy(h) for route, h in self.requests.items()}
+            spans = {stage: self._copy(h) for stage, h in self.spans.items()}
+            counters = dict(self.counters)
+        families = histogram_families("beaconport_request_duration_seconds",
+                                      "Time to handle a request, by route", "route", requests)
+        families += histogram_families("beaconport_stage_duration_seconds",
+                                       "Time spent in a hot-path stage, by stage", "stage", spans)
+        by_name: Dict[str, List[Tuple[str, Dict[str, str], float]]] = {}
+        for (name, labels), value in sorted(counters.items()):
+            by_name.setdefault(name, []).append(("", dict(labels), value))
+        for name, samples in by_name.items():
+            families.append(MetricFamily(f"beaconport_{name}", "counter", COUNTER_HELP.get(name, name), samples))
+        families.append(MetricFamily("beaconport_process_start_time_seconds", "gauge",
+                                     "Unix time the metrics registry was created", [("", {}, round(self.started, 3))]))
+        return families
+
+    @staticmethod
+    def _copy(histogram: Histogram) -> Histogram:
+        """Consistent copy taken under the registry lock, so rendering does not block observers"""
+        copy = Histogram(histogram.buckets, histogram.recent.maxlen or 1)
+        copy.counts = list(histogram.counts)
+        copy.sum, copy.count = histogram.sum, histogram.count
+        copy.recent.extend(histogram.recent)
+        return copy
+
+
+# Shared registry for every route and stage in this process
+metrics = MetricsRegistry()
+
+# Spans recorded while a request (or a worker's render) is being traced, per thread
+_local = threading.local()
+
+
+def record_span(stage: str, seconds: float) -> None:
+    """Add a finished span to the stage histogram and to this thread's trace, if any"""
+    metrics.observe_span(stage, seconds)
+    trace: Optional[List[Span]] = getattr(_local, "trace", None)
+    if trace is not None:
+        trace.append((stage, seconds))
+
+
+@contextlib.contextmanager
+def span(stage: str) -> Iterator[None]:
+    """Time a block (or, used as a decorator, a function) as one hot-path stage"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(stage, time.perf_counter() - start)
+
+
+@contextlib.contextmanager
+def request_trace() -> Iterator[List[Span]]:
+    """Collect the spans recorded on this thread inside the block, in order"""
+    previous = getattr(_local, "trace", None)
+    trace: List[Span] = []
+    _local.trace = trace
+    try:
+        yield trace
+    finally:
+        _local.trace = previous
+
+
+def server_timing(trace: Iterable[Span], total: float) -> str:
+    """Server-Timing header value: milliseconds per stage (repeats summed) plus the total"""
+    stages: Dict[str, List[float]] = {}
+    for stage, seconds in trace:
+        stages.setdefault(stage, []).append(seconds)
+    entries = [f"{stage};dur={sum(times) * 1000:.1f}" + (f';desc="x{len(times)}"' if len(times) > 1 else "")
+               for stage, times in stages.items()]
+    entries.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(entries)
@@ -0,0 +1,191 @@
+# profiling.py - Opt-in cProfile capture of chart renders and imports, kept for /admin/profiles
+
+import cProfile
+import functools
+import hmac
+import io
+import json
+import os
+import pstats
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, List, Mapping, NamedTuple, Optional, Tuple
+
+from config import PROFILING
+
+# Profiling code is only installed when it can ever be used
+PROFILING_AVAILABLE = PROFILING['enabled'] or bool(PROFILING['token'])
+SORT_KEYS = ("cumulative", "tottime", "ncalls")
+LOCAL_ADDRESSES = ("127.0.0.1", "::1")
+PROFILE_ID = re.compile(r"^[0-9]{8}-[0-9]{6}-[0-9]{6}-[a-z0-9_]+$")
+
+
+class ProfileRecord(NamedTuple):
+    """One stored profile: the .prof stats file plus what was profiled and how long it took"""
+    id: str
+    name: str
+    detail: str
+    started_at: float
+    seconds: float
+
+    def to_dict(self) -> Dict[str, Any]:
+        return self._asdict()
+
+
+class ProfileStore:
+    """Profiles saved as <id>.prof (pstats format) with a <id>.json description, newest kept"""
+
+    def __init__(self, directory: str = PROFILING['directory'], keep: int = PROFILING['keep']):
+        self.directory = directory
+        self.keep = keep
+        self._lock = threading.Lock()
+
+    def _path(self, profile_id: str, extension: str) -> str:
+        return os.path.join(self.directory, f"{profile_id}.{extension}")
+
+    def save(self, name: str, profiler: cProfile.Profile, started_at: float, seconds: float,
+             detail: str = "") -> ProfileRecord:
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(started_at))
+        micros = int((started_at % 1) * 1_000_000)
+        slug = re.sub(r"[^a-z0-9_]+", "_", name.lower()).strip("_") or "profile"
+        record = ProfileRecord(f"{stamp}-{micros:06d}-{slug}", name, detail, started_at, round(seconds, 4))
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            profiler.dump_stats(self._path(record.id, "prof"))
+            with open(self._path(record.id, "json"), "w", encoding="utf-8") as f:
+                json.dump(record.to_dict(), f)
+            self._prune()
+        return record
+
+    def _prune(self) -> None:
+        """Remove all but the newest keep profiles (caller holds the lock)"""
+        for record in self.list()[self.keep:]:
+            for extension in ("prof", "json"):
+                try:
+                    os.remove(self._path(record.id, extension))
+                except OSError:
+                    pass
+
+    def list(self) -> List[ProfileRecord]:
+        """Stored profiles, newest first"""
+        records = []
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return records
+        for filename in names:
+            profile_id, extension = os.path.splitext(filename)
+            if extension != ".json" or not PROFILE_ID.match(profile_id):
+                continue
+            record = self.get(profile_id)
+            if record is not None:
+                records.append(record)
+        return sorted(records, key=lambda record: record.started_at, reverse=True)
+
+    def get(self, profile_id: str) -> Optional[ProfileRecord]:
+        if not PROFILE_ID.match(profile_id) or not os.path.exists(self._path(profile_id, "prof")):
+            return None
+        try:
+            with open(self._path(profile_id, "json"), encoding="utf-8") as f:
+                return ProfileRecord(**json.load(f))
+        except (OSError, ValueError, TypeError):
+            return None
+
+    def stats_path(self, profile_id: str) -> Optional[str]:
+        """Path of the raw .prof file (for snakeviz/pstats), or None for an unknown id"""
+        return self._path(profile_id, "prof") if self.get(profile_id) is not None else None
+
+    def summary(self, profile_id: str, sort: str = "cumulative", top: Optional[int] = None) -> Optional[str]:
+        """pstats listing of the top functions by sort, or None for an unknown id"""
+        path = self.stats_path(profile_id)
+        if path is None:
+            return None
+        out = io.StringIO()
+        stats = pstats.Stats(path, stream=out)
+        stats.strip_dirs().sort_stats(sort if sort in SORT_KEYS else "cumulative").print_stats(top or PROFILING['top'])
+        return out.getvalue()
+
+
+# Shared store for every profile taken in this process
+profile_store = ProfileStore()
+
+# The profiler running on this thread, if any
+_local = threading.local()
+
+
+def profiling_active() -> bool:
+    """True while this thread is inside profile_call (renders then stay in-process)"""
+    return getattr(_local, "profiler", None) is not None
+
+
+def profile_call(name: str, fn: Callable, *args, detail: str = "",
+                 **kwargs) -> Tuple[Any, Optional[ProfileRecord]]:
+    """Run fn under cProfile and store the profile.
+
+    Returns (fn's result, the saved record). The record is None when nothing
+    was saved: nested calls join the outer profile, and the call runs
+    unprofiled when another profiler is already active.
+    """
+    if profiling_active():
+        return fn(*args, **kwargs), None
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Python 3.12+ allows one active profiler per process; run this call unprofiled
+        return fn(*args, **kwargs), None
+    _local.profiler = profiler
+    started_at = time.time()
+    start = time.perf_counter()
+    try:
+        result = fn(*args, **kwargs)
+    finally:
+        profiler.disable()
+        _local.profiler = None
+        record = profile_store.save(name, profiler, started_at, time.perf_counter() - start, detail)
+    return result, record
+
+
+def token_matches(given: str, token: str) -> bool:
+    """Constant-time token check; bytes, because compare_digest rejects non-ASCII str"""
+    return hmac.compare_digest(given.encode("utf-8"), token.encode("utf-8"))
+
+
+def profile_requested(args: Mapping[str, str]) -> bool:
+    """Profile everything when enabled, else only requests carrying ?profile=<token>"""
+    if PROFILING['enabled']:
+        return True
+    token = PROFILING['token']
+    return bool(token) and token_matches(args.get("profile", ""), token)
+
+
+def admin_allowed(args: Mapping[str, str], remote_addr: Optional[str]) -> bool:
+    """Profiles are shown with the token, or to local requests when profiling is enabled without one"""
+    if not PROFILING_AVAILABLE:
+        return False
+    if PROFILING['token']:
+        return token_matches(args.get("token", ""), PROFILING['token'])
+    return remote_addr in LOCAL_ADDRESSES
+
+
+def profiled_route(view):
+    """Decorator profiling a Flask route when requested (returned unchanged when profiling is off).
+
+    Profiled responses carry an X-Profile header pointing at the stored profile.
+    """
+    if not PROFILING_AVAILABLE:
+        return view
+
+    from flask import make_response, request, url_for
+
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if not profile_requested(request.args):
+            return view(*args, **kwargs)
+        result, record = profile_call(view.__name__, view, *args, detail=request.full_path, **kwargs)
+        response = make_response(result)
+        if record is not None:
+            response.headers["X-Profile"] = url_for("admin_profile", profile_id=record.id)
+        return response
+    return wrapper
@@ -0,0 +1,211 @@
+# render_pool.py - Pre-warmed worker processes that render ChartService charts to PNG bytes
+
+import atexit
+import io
+import multiprocessing
+import queue
+import threading
+import time
+from typing import Any, Dict, List, Tuple
+
+from config import RENDER_POOL
+from metrics import Span, record_span, request_trace, span
+from profiling import PROFILING_AVAILABLE, profiling_active
+
+
+class RenderError(RuntimeError):
+    """A chart failed to render in a worker process"""
+
+
+class RenderTimeout(RenderError):
+    """A chart took longer than the render timeout; its worker has been killed"""
+
+
+def _worker_main(conn) -> None:
+    """Worker loop: receive (method, args, kwargs), reply with ('ok', (png, spans)) or ('error', message)"""
+    # Imported here so the pool module itself stays cheap to import in the web process
+    from chart_service import ChartService
+    try:
+        ChartService.get_basemap()
+    except Exception as e:
+        print(f"Render worker could not load the basemap: {e}")
+    conn.send(("ready", None))
+    while True:
+        try:
+            method, args, kwargs = conn.recv()
+        except (EOFError, OSError):
+            return
+        try:
+            # The spans travel back with the PNG so the web process can report them
+            with request_trace() as trace, span("chart_render"):
+                buf = getattr(ChartService, method)(*args, **kwargs)
+            conn.send(("ok", (buf.getvalue(), trace)))
+        except Exception as e:
+            conn.send(("error", f"{type(e).__name__}: {e}"))
+
+
+def _context():
+    # A fork server imports matplotlib/cartopy once and forks each worker from it,
+    # so replacing a killed worker is cheap and never forks the threaded web process
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        ctx = multiprocessing.get_context("forkserver")
+        ctx.set_forkserver_preload(["chart_service"])
+        return ctx
+    return multiprocessing.get_context("spawn")
+
+
+class RenderWorker:
+    """One worker process and the pipe used to talk to it"""
+
+    def __init__(self, ctx, name: str):
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=_worker_main, args=(child_conn,), name=name, daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.ready = False
+
+    def wait_ready(self, timeout: float) -> None:
+        if self.ready:
+            return
+        if not self.conn.poll(timeout):
+            raise RenderTimeout(f"{self.process.name} did not start within {timeout}s")
+        self.conn.recv()
+        self.ready = True
+
+    def call(self, method: str, args: tuple, kwargs: Dict[str, Any], timeout: float) -> Tuple[bytes, List[Span]]:
+        self.conn.send((method, args, kwargs))
+        if not self.conn.poll(timeout):
+            raise RenderTimeout(f"{method} did not finish within {timeout}s")
+        status, value = self.conn.recv()
+        if status != "ok":
+            raise RenderError(value)
+        return value
+
+    def kill(self) -> None:
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+
+class RenderPool:
+    """Fixed set of chart worker processes, started on first use.
+
+    Each render checks out an idle worker, so charts render in parallel across
+    cores and outside this process's GIL and pyplot state. A worker that times
+    out or dies is killed and replaced; the caller gets a RenderError.
+    """
+
+    def __init__(self, processes: int = RENDER_POOL['processes'],
+                 timeout: float = RENDER_POOL['timeout'],
+                 startup_timeout: float = RENDER_POOL['startup_timeout']):
+        self.processes = processes
+        self.timeout = timeout
+        self.startup_timeout = startup_timeout
+        self._lock = threading.Lock()
+        self._ctx = None
+        self._workers: List[RenderWorker] = []
+        self._idle: "queue.Queue[RenderWorker]" = queue.Queue()
+        self._spawned = 0
+        self.renders = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.restarts = 0
+        self.render_seconds = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self.processes > 0
+
+    def start(self) -> None:
+        """Start the worker processes (also done lazily by the first render)"""
+        with self._lock:
+            if self._workers or not self.enabled:
+                return
+            self._ctx = _context()
+            for _ in range(self.processes):
+                self._add_worker()
+
+    def _add_worker(self) -> None:
+        """Start a worker and mark it idle (caller holds the lock)"""
+        self._spawned += 1
+        worker = RenderWorker(self._ctx, name=f"chart-render-{self._spawned}")
+        self._workers.append(worker)
+        self._idle.put(worker)
+
+    def _replace(self, worker: RenderWorker) -> None:
+        worker.kill()
+        with self._lock:
+            if worker in self._workers:
+                self._workers.remove(worker)
+                self.restarts += 1
+                self._add_worker()
+
+    def render(self, method: str, *args, **kwargs) -> bytes:
+        """Call ChartService.<method>(*args, **kwargs) in a worker and return the PNG bytes"""
+        # A profiled request renders in-process so its profile includes the drawing
+        if not self.enabled or (PROFILING_AVAILABLE and profiling_active()):
+            from chart_service import ChartService
+            with span("chart_render"):
+                return getattr(ChartService, method)(*args, **kwargs).getvalue()
+        self.start()
+        try:
+            worker = self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            self.timeouts += 1
+            raise RenderTimeout(f"No render worker became free within {self.timeout}s")
+
+        start = time.perf_counter()
+        try:
+            worker.wait_ready(self.startup_timeout)
+            png, spans = worker.call(method, args, kwargs, self.timeout)
+        except RenderTimeout:
+            self.timeouts += 1
+            self._replace(worker)
+            raise
+        except (EOFError, OSError) as e:
+            # The worker died mid-render (e.g. crashed in native code)
+            self.errors += 1
+            self._replace(worker)
+            raise RenderError(f"Render worker exited while rendering {method}: {e}")
+        except RenderError:
+            self.errors += 1
+            self._idle.put(worker)
+            raise
+        self._idle.put(worker)
+        seconds = time.perf_counter() - start
+        self.renders += 1
+        self.render_seconds += seconds
+        for stage, stage_seconds in spans:
+            record_span(stage, stage_seconds)
+        # Round trip including the pipe transfer, on top of the worker's own chart_render
+        record_span("render_pool", seconds)
+        return png
+
+    def shutdown(self) -> None:
+        with self._lock:
+            workers, self._workers = self._workers, []
+            self._idle = queue.Queue()
+        for worker in workers:
+            worker.kill()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "processes": self.processes,
+            "running": sum(worker.process.is_alive() for worker in list(self._workers)),
+            "idle": self._idle.qsize(),
+            "renders": self.renders,
+            "errors": self.errors,
+            "timeouts": self.timeouts,
+            "restarts": self.restarts,
+            "render_seconds": round(self.render_seconds, 3),
+        }
+
+
+def render_chart(method: str, *args, **kwargs) -> io.BytesIO:
+    """Render a ChartService chart on the shared pool, as a PNG buffer for chart routes"""
+    return io.BytesIO(render_pool.render(method, *args, **kwargs))
+
+
+# Shared pool used by all chart routes in this process
+render_pool = RenderPool()
+atexit.register(render_pool.shutdown)
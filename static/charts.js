@@ -0,0 +1,20 @@
+// charts.js - Draws charts in the browser from /api/charts/<kind>?spec=1 (client render mode)
+
+document.querySelectorAll("[data-chart-src]").forEach(async (element) => {
+  try {
+    const response = await fetch(element.dataset.chartSrc);
+    const payload = await response.json();
+    if (!response.ok) {
+      throw new Error(payload.error || response.statusText);
+    }
+    if (payload.series.length === 0) {
+      element.textContent = "No data available";
+      return;
+    }
+    // The spec's "series" data source is filled from the payload rather than repeated in it
+    const spec = { ...payload.spec, data: { values: payload.series } };
+    await vegaEmbed(element, spec, { actions: { export: true, source: false, compiled: false, editor: false } });
+  } catch (error) {
+    element.textContent = `Error loading chart: ${error.message}`;
+  }
+});
@@ -0,0 +1,411 @@
+# storage.py - Case database storage backends (TinyDB-layout JSON file or normalised SQLite)
+
+import json
+import os
+import sqlite3
+import sys
+from collections.abc import Mapping
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from aggregates import AggregateTables
+from case_values import (MIN_POSTCODE_LENGTH, clean_age_value, clean_text_value,
+                         first_record, is_mapping, iter_records, label_value)
+from case_filters import CaseFilter, filter_key
+from config import Fields
+from dataset_metadata import METADATA_DOC_ID, METADATA_TABLE, case_ref
+
+# Cases are inserted in batches of this many within the single write transaction
+INSERT_BATCH = 1000
+
+# Linked sheets with their own normalised table: case key -> (table, [(column, field)])
+LINKED_TABLES = {
+    "victim_details": ("victims", []),
+    "offence_details": ("offences", [("offence_type", Fields.OFFENCE_TYPE),
+                                     ("offence_date", Fields.OFFENCE_DATE),
+                                     ("crime_finalisation", Fields.CRIME_FINALISATION)]),
+    "case_data": ("case_data", [("digital_opportunities", Fields.DIGITAL_OPPORTUNITIES)]),
+}
+
+SQLITE_SCHEMA = """
+-- Raw field values are declared without a type so SQLite keeps each value's own type
+CREATE TABLE cases (
+    doc_id             INTEGER PRIMARY KEY,
+    ref                TEXT,
+    main               TEXT NOT NULL,
+    sheet_keys         TEXT NOT NULL,
+    force_code_key     TEXT,
+    allocated_to_key   TEXT,
+    offence_type_key   TEXT,
+    offence_day        TEXT,
+    digital,
+    finalisation,
+    digital_label      TEXT NOT NULL,
+    finalisation_label TEXT NOT NULL
+);
+CREATE TABLE victims (
+    doc_id    INTEGER NOT NULL REFERENCES cases(doc_id),
+    position  INTEGER NOT NULL,
+    ref       TEXT,
+    age       INTEGER,
+    ethnicity TEXT,
+    postcode  TEXT,
+    record    TEXT NOT NULL
+);
+CREATE TABLE offences (
+    doc_id             INTEGER NOT NULL REFERENCES cases(doc_id),
+    position           INTEGER NOT NULL,
+    ref                TEXT,
+    offence_type,
+    offence_date,
+    crime_finalisation,
+    record             TEXT NOT NULL
+);
+CREATE TABLE case_data (
+    doc_id                INTEGER NOT NULL REFERENCES cases(doc_id),
+    position              INTEGER NOT NULL,
+    ref                   TEXT,
+    digital_opportunities,
+    record                TEXT NOT NULL
+);
+CREATE TABLE other_records (
+    doc_id   INTEGER NOT NULL REFERENCES cases(doc_id),
+    sheet    TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    ref      TEXT,
+    record   TEXT NOT NULL
+);
+CREATE TABLE metadata (
+    doc_id TEXT PRIMARY KEY,
+    value  TEXT NOT NULL
+);
+"""
+
+# Built after the bulk insert, which is faster than maintaining them row by row
+SQLITE_INDEXES = """
+CREATE INDEX cases_ref ON cases(ref);
+CREATE INDEX cases_force_code ON cases(force_code_key);
+CREATE INDEX cases_allocated_to ON cases(allocated_to_key);
+CREATE INDEX cases_offence_type ON cases(offence_type_key);
+CREATE INDEX cases_offence_day ON cases(offence_day);
+CREATE INDEX victims_case ON victims(doc_id, position);
+CREATE INDEX victims_ref ON victims(ref);
+CREATE INDEX victims_age ON victims(age);
+CREATE INDEX victims_ethnicity ON victims(ethnicity);
+CREATE INDEX victims_postcode ON victims(postcode);
+CREATE INDEX offences_case ON offences(doc_id, position);
+CREATE INDEX offences_ref ON offences(ref);
+CREATE INDEX offences_type ON offences(offence_type);
+CREATE INDEX offences_finalisation ON offences(crime_finalisation);
+CREATE INDEX case_data_case ON case_data(doc_id, position);
+CREATE INDEX case_data_ref ON case_data(ref);
+CREATE INDEX case_data_digital ON case_data(digital_opportunities);
+CREATE INDEX other_records_case ON other_records(doc_id, sheet, position);
+"""
+
+
+def offence_day(value: Any) -> Optional[str]:
+    """Offence date as YYYY-MM-DD text (None when it can't be parsed)"""
+    if value is None:
+        return None
+    # Only the SQLite writer needs this; pandas is loaded on first use
+    import pandas as pd
+    day = pd.to_datetime(value, errors="coerce")
+    return None if pd.isna(day) else day.date().isoformat()
+
+
+def temp_path(path: str) -> str:
+    return f"{path}.tmp-{os.getpid()}"
+
+
+class CaseStorage:
+    """Base class for case database backends.
+
+    Every backend reads and writes the same document layout the app has always
+    used: {"cases": {doc_id: {"main": {...}, sheet_key: [records]}}, "metadata": {...}}.
+    """
+    name = "base"
+    # Whether chart aggregates can be computed by the backend itself
+    supports_queries = False
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def parse(self, raw: bytes) -> Dict[str, Any]:
+        """Decode the raw file contents; raises ValueError if they are corrupt"""
+        raise NotImplementedError
+
+    def read(self) -> Dict[str, Any]:
+        """Read the whole database (an empty one if the file doesn't exist)"""
+        if not os.path.exists(self.path):
+            return {"cases": {}}
+        with open(self.path, "rb") as f:
+            return self.parse(f.read())
+
+    def load_cases(self) -> Dict[str, Any]:
+        """Existing cases keyed by doc_id, used when appending or updating"""
+        return self.read().get("cases", {})
+
+    def write(self, documents: Iterable[Tuple[Any, Mapping]], keep: Callable[[], bool] = lambda: True,
+              metadata: Optional[Callable[[], Dict[str, Any]]] = None) -> bool:
+        """Write every (doc_id, case) to a temp file, then swap it in atomically.
+
+        keep is checked once every document is written (returning False discards
+        the new file); metadata, if given, is called after the cases are written.
+        Returns whether the database was replaced.
+        """
+        tmp_path = temp_path(self.path)
+        try:
+            self._write_file(tmp_path, documents, metadata)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        if keep():
+            os.replace(tmp_path, self.path)
+            return True
+        os.remove(tmp_path)
+        return False
+
+    def _write_file(self, path: str, documents: Iterable[Tuple[Any, Mapping]],
+                    metadata: Optional[Callable[[], Dict[str, Any]]]) -> None:
+        raise NotImplementedError
+
+
+class JsonStorage(CaseStorage):
+    """The TinyDB JSON file: one document per case, re-written in full on each import"""
+    name = "json"
+
+    def parse(self, raw: bytes) -> Dict[str, Any]:
+        data = json.loads(raw)
+        return data if isinstance(data, dict) else {"cases": {}}
+
+    def _write_file(self, path, documents, metadata) -> None:
+        with open(path, "w") as f:
+            f.write('{"cases": {')
+            for i, (doc_id, doc) in enumerate(documents):
+                if i:
+                    f.write(", ")
+                f.write(json.dumps(str(doc_id)))
+                f.write(": ")
+                f.write(json.dumps(doc))
+            f.write("}")
+            if metadata is not None:
+                f.write(f', {json.dumps(METADATA_TABLE)}: {{{json.dumps(METADATA_DOC_ID)}: ')
+                f.write(json.dumps(metadata()))
+                f.write("}")
+            f.write("}")
+
+
+class SqliteStorage(CaseStorage):
+    """Normalised SQLite database with cases, victims, offences and case_data tables.
+
+    Each linked record is also kept as JSON so the original documents can be
+    rebuilt exactly. Columns used by the charts are stored cleaned and indexed,
+    so chart aggregates (optionally filtered) run as SQL queries.
+    """
+    name = "sqlite"
+    supports_queries = True
+
+    def parse(self, raw: bytes) -> Dict[str, Any]:
+        conn = sqlite3.connect(":memory:")
+        try:
+            conn.deserialize(raw)
+            return self._read_documents(conn)
+        except sqlite3.DatabaseError as e:
+            raise ValueError(f"Invalid SQLite case database: {e}") from e
+        finally:
+            conn.close()
+
+    def _connect_readonly(self) -> sqlite3.Connection:
+        return sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+
+    @staticmethod
+    def _read_documents(conn: sqlite3.Connection) -> Dict[str, Any]:
+        cases: Dict[str, Dict[str, Any]] = {}
+        sheet_keys: Dict[int, List[str]] = {}
+        for doc_id, main, keys in conn.execute(
+                "SELECT doc_id, main, sheet_keys FROM cases ORDER BY rowid"):
+            cases[str(doc_id)] = {"main": json.loads(main)}
+            sheet_keys[doc_id] = json.loads(keys)
+        records: Dict[Tuple[int, str], List[Any]] = {}
+        queries = [f"SELECT doc_id, '{key}', record FROM {table} ORDER BY doc_id, position"
+                   for key, (table, _) in LINKED_TABLES.items()]
+        queries.append("SELECT doc_id, sheet, record FROM other_records ORDER BY doc_id, sheet, position")
+        for query in queries:
+            for doc_id, sheet, record in conn.execute(query):
+                records.setdefault((doc_id, sheet), []).append(json.loads(record))
+        # Restore each case's linked sheets in their original order, including empty ones
+        for doc_id, keys in sheet_keys.items():
+            case = cases[str(doc_id)]
+            for key in keys:
+                case[key] = records.get((doc_id, key), [])
+
+        data: Dict[str, Any] = {"cases": cases}
+        metadata = conn.execute("SELECT doc_id, value FROM metadata").fetchall()
+        if metadata:
+            data[METADATA_TABLE] = {doc_id: json.loads(value) for doc_id, value in metadata}
+        return data
+
+    @staticmethod
+    def _case_rows(doc_id: int, case: Mapping) -> Dict[str, List[tuple]]:
+        """Rows for every table describing one case"""
+        ref = case_ref(case)
+        main = case.get("main") if is_mapping(case.get("main")) else {}
+        offence = first_record(case, "offence_details")
+        case_data = first_record(case, "case_data")
+        digital = case_data.get(Fields.DIGITAL_OPPORTUNITIES) if case_data else None
+        finalisation = offence.get(Fields.CRIME_FINALISATION) if offence else None
+        sheet_keys = [key for key in case if key != "main"]
+        rows: Dict[str, List[tuple]] = {"cases": [(
+            doc_id, ref, json.dumps(main), json.dumps(sheet_keys),
+            filter_key(main.get(Fields.FORCE_CODE)) or None,
+            filter_key(main.get(Fields.ALLOCATED_TO)) or None,
+            (filter_key(offence.get(Fields.OFFENCE_TYPE)) or None) if offence else None,
+            offence_day(offence.get(Fields.OFFENCE_DATE)) if offence else None,
+            digital, finalisation, label_value(digital), label_value(finalisation),
+        )]}
+        for key in sheet_keys:
+            # A sheet saved as a single record is stored (and read back) as a one-record list
+            records = list(iter_records(case, key))
+            if key == "victim_details":
+                rows.setdefault("victims", []).extend(
+                    (doc_id, position, ref,
+                     clean_age_value(victim.get(Fields.VICTIM_AGE)),
+                     clean_text_value(victim.get(Fields.VICTIM_ETHNICITY)),
+                     clean_text_value(victim.get(Fields.VICTIM_POSTCODE), upper=True,
+                                      min_length=MIN_POSTCODE_LENGTH),
+                     json.dumps(victim))
+                    for position, victim in enumerate(records))
+            elif key in LINKED_TABLES:
+                table, columns = LINKED_TABLES[key]
+                rows.setdefault(table, []).extend(
+                    (doc_id, position, ref, *(record.get(field) for _, field in columns), json.dumps(record))
+                    for position, record in enumerate(records))
+            else:
+                rows.setdefault("other_records", []).extend(
+                    (doc_id, key, position, ref, json.dumps(record))
+                    for position, record in enumerate(records))
+        return rows
+
+    @staticmethod
+    def _insert(conn: sqlite3.Connection, batch: Dict[str, List[tuple]]) -> None:
+        for table, rows in batch.items():
+            if rows:
+                placeholders = ", ".join("?" * len(rows[0]))
+                conn.executemany(f"INSERT INTO {table} VALUES ({placeholders})", rows)
+            rows.clear()
+
+    def _write_file(self, path, documents, metadata) -> None:
+        if os.path.exists(path):
+            os.remove(path)
+        conn = sqlite3.connect(path)
+        try:
+            # A brand-new file that is swapped in afterwards needs no journal
+            conn.execute("PRAGMA journal_mode=OFF")
+            conn.execute("PRAGMA synchronous=OFF")
+            conn.executescript(SQLITE_SCHEMA)
+            with conn:  # one transaction for the whole import
+                batch: Dict[str, List[tuple]] = {}
+                for i, (doc_id, doc) in enumerate(documents, start=1):
+                    for table, rows in self._case_rows(int(doc_id), doc).items():
+                        batch.setdefault(table, []).extend(rows)
+                    if i % INSERT_BATCH == 0:
+                        self._insert(conn, batch)
+                self._insert(conn, batch)
+                if metadata is not None:
+                    conn.execute("INSERT INTO metadata VALUES (?, ?)",
+                                 (METADATA_DOC_ID, json.dumps(metadata())))
+            conn.executescript(SQLITE_INDEXES)
+            conn.execute("ANALYZE")
+            conn.commit()
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _where(case_filter: Optional[CaseFilter]) -> Tuple[str, List[Any]]:
+        """SQL condition on the cases table (alias c) for a case filter"""
+        clauses, params = [], []
+        if case_filter is not None:
+            for name, key in case_filter.exact_matches().items():
+                clauses.append(f"c.{name}_key = ?")
+                params.append(key)
+            if case_filter.date_from:
+                clauses.append("c.offence_day >= ?")
+                params.append(case_filter.date_from.isoformat())
+            if case_filter.date_to:
+                clauses.append("c.offence_day <= ?")
+                params.append(case_filter.date_to.isoformat())
+        return " AND ".join(clauses) or "1", params
+
+    def aggregates(self, version: str, case_filter: Optional[CaseFilter] = None) -> AggregateTables:
+        """Chart aggregates computed by SQL (first-seen ordering matches the analytics engine)"""
+        where, params = self._where(case_filter)
+        victims = f"FROM victims v JOIN cases c ON c.doc_id = v.doc_id WHERE {where}"
+        conn = self._connect_readonly()
+        try:
+            def query(sql: str) -> List[tuple]:
+                return conn.execute(sql, params).fetchall()
+
+            age_counts = query(f"SELECT v.age, COUNT(*) {victims} AND v.age IS NOT NULL "
+                               "GROUP BY v.age ORDER BY v.age")
+            ethnicity_counts = query(f"SELECT v.ethnicity, COUNT(*) {victims} AND v.ethnicity IS NOT NULL "
+                                     "GROUP BY v.ethnicity ORDER BY MIN(v.rowid)")
+            postcode_counts = query(f"SELECT v.postcode, COUNT(*) {victims} AND v.postcode IS NOT NULL "
+                                    "GROUP BY v.postcode ORDER BY MIN(v.rowid)")
+            pair_counts = query("SELECT c.digital, c.finalisation, COUNT(*) FROM cases c "
+                                f"WHERE {where} AND c.digital IS NOT NULL AND c.finalisation IS NOT NULL "
+                                "GROUP BY c.digital, c.finalisation ORDER BY MIN(c.rowid)")
+            correlation: Dict[str, Dict[str, int]] = {}
+            for finalisation, digital, count in query(
+                    "SELECT c.finalisation_label, c.digital_label, COUNT(*) FROM cases c "
+                    f"WHERE {where} GROUP BY c.finalisation_label, c.digital_label ORDER BY MIN(c.rowid)"):
+                correlation.setdefault(finalisation, {})[digital] = count
+        finally:
+            conn.close()
+        return AggregateTables(version=version,
+                               age_counts=dict(age_counts),
+                               ethnicity_counts=dict(ethnicity_counts),
+                               postcode_counts=dict(postcode_counts),
+                               pair_counts=pair_counts,
+                               correlation=correlation)
+
+    def counts(self, case_filter: Optional[CaseFilter] = None) -> Tuple[int, int]:
+        """(case_count, victim_count) for the cases matching case_filter"""
+        where, params = self._where(case_filter)
+        conn = self._connect_readonly()
+        try:
+            # Distinct refs, like the unfiltered count: a repeated ref is stored as several documents
+            cases = conn.execute(f"SELECT COUNT(DISTINCT c.ref) FROM cases c WHERE {where}", params).fetchone()[0]
+            victims = conn.execute("SELECT COUNT(*) FROM victims v JOIN cases c ON c.doc_id = v.doc_id "
+                                   f"WHERE {where}", params).fetchone()[0]
+        finally:
+            conn.close()
+        return cases, victims
+
+
+# Backends by name, and by database file extension
+BACKENDS = {"json": JsonStorage, "sqlite": SqliteStorage}
+BACKEND_SUFFIXES = {".json": "json", ".sqlite": "sqlite", ".sqlite3": "sqlite", ".db": "sqlite"}
+
+
+def get_storage(path: str) -> CaseStorage:
+    """Return the backend for a database file, chosen by its extension"""
+    suffix = os.path.splitext(path)[1].lower()
+    return BACKENDS[BACKEND_SUFFIXES.get(suffix, "json")](path)
+
+
+def migrate(source_path: str, target_path: str) -> int:
+    """Copy every case (and the metadata) from one database file to another; returns the case count"""
+    data = get_storage(source_path).read()
+    cases = data.get("cases", {})
+    stored = data.get(METADATA_TABLE, {}).get(METADATA_DOC_ID)
+    get_storage(target_path).write(cases.items(), metadata=(lambda: stored) if stored else None)
+    return len(cases)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("Usage: python storage.py <source db> <target db>  (e.g. beaconport_db.json beaconport_db.sqlite3)")
+        sys.exit(1)
+    count = migrate(sys.argv[1], sys.argv[2])
+    print(f"Migrated {count} cases from {sys.argv[1]} to {sys.argv[2]}")
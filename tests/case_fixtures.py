@@ -0,0 +1,71 @@
+# tests/case_fixtures.py - Small case databases holding the awkward values real captures contain
+
+import os
+import tempfile
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from config import Fields
+from storage import get_storage
+
+Victim = Tuple[Any, Any, Any]  # (age, ethnicity, postcode)
+
+MISSING = object()  # leave the field out of the record entirely
+
+
+def record(ref: Optional[str], **fields: Any) -> Dict[str, Any]:
+    """A linked-sheet record for ref, dropping fields given as MISSING"""
+    return {Fields.BEACONPORT_REF: ref, **{name: value for name, value in fields.items() if value is not MISSING}}
+
+
+def make_case(ref: Optional[str], victims: Iterable[Victim] = (), force_code: Any = 36,
+              allocated_to: Any = "Jack Bauer", offence_type: Any = "Rape",
+              offence_date: Any = "2014-05-02 00:00:00", finalisation: Any = 14,
+              digital: Any = 0) -> Dict[str, Any]:
+    """One case document in the importer's layout"""
+    main = {Fields.BEACONPORT_REF: ref, Fields.ALLOCATED_TO: allocated_to, Fields.FORCE_CODE: force_code}
+    return {
+        "main": {name: value for name, value in main.items() if value is not MISSING},
+        "offence_details": [record(ref, **{Fields.OFFENCE_TYPE: offence_type, Fields.OFFENCE_DATE: offence_date,
+                                           Fields.CRIME_FINALISATION: finalisation})],
+        "case_data": [record(ref, **{Fields.DIGITAL_OPPORTUNITIES: digital})],
+        "victim_details": [record(ref, **{Fields.VICTIM_AGE: age, Fields.VICTIM_ETHNICITY: ethnicity,
+                                          Fields.VICTIM_POSTCODE: postcode})
+                           for age, ethnicity, postcode in victims],
+    }
+
+
+def awkward_cases() -> Dict[str, Dict[str, Any]]:
+    """Cases keyed by doc_id covering blanks, "N/A", out-of-range ages, odd types and a repeated ref"""
+    cases = [
+        make_case("BPORT/001/2025", [(15, "W1", "NR2 2NN"), ("15", " W1 ", "nr2 2nn "), (15.0, "B2", "NR3 1AB")]),
+        # The same ref imported twice (a second occurrence in the workbook)
+        make_case("BPORT/001/2025", [(16, "W1", "NR2 2NN")], offence_date="2014-05-09 00:00:00"),
+        make_case("BPORT/002/2025", [(None, None, None), ("", "", ""), ("   ", "  ", "  "),
+                                     ("N/A", "N/A", "N/A"), (MISSING, MISSING, MISSING)],
+                  force_code="36", allocated_to=" jack bauer ", offence_type="rape",
+                  offence_date="2019-11-30 00:00:00", finalisation="14", digital=1),
+        make_case("BPORT/003/2025", [(-1, "A1", "IP1"), (0, "A1", "IP1 1AA"), (120, "a1", "IP1 1AA"),
+                                     (121, "M9", "IP11AA"), (200, "M9", "CB1 2AB"), ("15.5", "W1", "CB1 2AB"),
+                                     (15.5, "W1", "cb1 2ab"), (" 42 ", "Other", "PE1 1AA"), (True, "W1", 123456)],
+                  force_code=37, allocated_to="Chloe O'Brian", offence_type="Burglary",
+                  offence_date="not a date", finalisation=None, digital=None),
+        make_case("BPORT/004/2025", [(30, "W1", "NR2 2NN")], force_code=36.0, allocated_to=None,
+                  offence_type=MISSING, offence_date=None, finalisation=14.0, digital="N/A"),
+        make_case("BPORT/005/2025", [], force_code=MISSING, offence_type="Rape",
+                  offence_date="2021-01-01 00:00:00", finalisation="N/A", digital=True),
+        make_case(None, [(50, "W2", "NR1 1AA")], offence_date="2021-01-01 12:30:00", finalisation=3, digital=0),
+    ]
+    documents = {str(doc_id): case for doc_id, case in enumerate(cases, start=1)}
+    # A victim sheet saved as a single record rather than a list
+    documents["8"] = make_case("BPORT/006/2025", force_code=38, offence_date="2015-06-01 00:00:00",
+                               finalisation=14, digital=1)
+    documents["8"]["victim_details"] = record("BPORT/006/2025", **{
+        Fields.VICTIM_AGE: 22, Fields.VICTIM_ETHNICITY: "B2", Fields.VICTIM_POSTCODE: "NR4 7TJ"})
+    return documents
+
+
+def write_database(cases: Dict[str, Dict[str, Any]], filename: str = "beaconport_db.json") -> str:
+    """Write cases to a new database file (backend chosen by extension) and return its path"""
+    path = os.path.join(tempfile.mkdtemp(), filename)
+    get_storage(path).write(cases.items())
+    return path
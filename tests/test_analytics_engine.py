@@ -0,0 +1,150 @@
+# tests/test_analytics_engine.py - The vectorised getters agree with the original list-based ones
+
+import unittest
+from collections import Counter
+from typing import Any, Dict, List
+
+from case_fixtures import awkward_cases, make_case, write_database
+from config import Fields
+from database_service import DatabaseService
+
+
+# The list-based DatabaseService getters the analytics engine replaced, kept as the reference
+
+def field_values(data: Dict[str, Any], field_name: str, data_source: str = "victim_details") -> List[Any]:
+    values = []
+    for case in data.get("cases", {}).values():
+        source_data = case.get(data_source, [])
+        if not isinstance(source_data, list):
+            source_data = [source_data] if source_data else []
+        for item in source_data:
+            if isinstance(item, dict):
+                value = item.get(field_name)
+                if value is not None and str(value).strip():
+                    values.append(value)
+    return values
+
+
+def victim_ages(data: Dict[str, Any]) -> List[int]:
+    clean_ages = []
+    for age in field_values(data, Fields.VICTIM_AGE):
+        try:
+            age_int = int(age)
+            if 0 <= age_int <= 120:
+                clean_ages.append(age_int)
+        except (ValueError, TypeError):
+            continue
+    return clean_ages
+
+
+def victim_ethnicities(data: Dict[str, Any]) -> List[str]:
+    return [str(e).strip() for e in field_values(data, Fields.VICTIM_ETHNICITY) if str(e).strip()]
+
+
+def victim_postcodes(data: Dict[str, Any]) -> List[str]:
+    clean_postcodes = []
+    for pc in field_values(data, Fields.VICTIM_POSTCODE):
+        pc_str = str(pc).strip().upper()
+        if pc_str and len(pc_str) >= 4:
+            clean_postcodes.append(pc_str)
+    return clean_postcodes
+
+
+def digital_vs_finalisation_pairs(data: Dict[str, Any]) -> list:
+    pairs = []
+    for case in data.get("cases", {}).values():
+        digital = None
+        case_data_list = case.get("case_data", [])
+        if case_data_list and isinstance(case_data_list[0], dict):
+            digital = case_data_list[0].get(Fields.DIGITAL_OPPORTUNITIES)
+        finalisation = None
+        offence_details_list = case.get("offence_details", [])
+        if offence_details_list and isinstance(offence_details_list[0], dict):
+            finalisation = offence_details_list[0].get(Fields.CRIME_FINALISATION)
+        if digital is not None and finalisation is not None:
+            pairs.append((digital, finalisation))
+    return pairs
+
+
+def finalisation_vs_digital_correlation(data: Dict[str, Any]) -> Dict[str, Dict[str, int]]:
+    correlation: Dict[str, Dict[str, int]] = {}
+    for case in data.get("cases", {}).values():
+        digital = None
+        case_data_list = case.get("case_data", [])
+        if case_data_list and isinstance(case_data_list[0], dict):
+            digital = case_data_list[0].get(Fields.DIGITAL_OPPORTUNITIES)
+        finalisation = None
+        offence_details_list = case.get("offence_details", [])
+        if offence_details_list and isinstance(offence_details_list[0], dict):
+            finalisation = offence_details_list[0].get(Fields.CRIME_FINALISATION)
+        finalisation_str = str(finalisation).strip() if finalisation is not None else ""
+        digital_str = str(digital).strip() if digital is not None else ""
+        correlation.setdefault(finalisation_str, {}).setdefault(digital_str, 0)
+        correlation[finalisation_str][digital_str] += 1
+    return correlation
+
+
+class EngineParityMixin:
+    cases: Dict[str, Dict[str, Any]]
+
+    @classmethod
+    def setUpClass(cls):
+        cls.db_service = DatabaseService(write_database(cls.cases))
+        cls.data = {"cases": cls.cases}
+
+    def test_value_lists(self):
+        self.assertEqual(self.db_service.get_victim_ages(), victim_ages(self.data))
+        self.assertEqual(self.db_service.get_victim_ethnicities(), victim_ethnicities(self.data))
+        self.assertEqual(self.db_service.get_victim_postcodes(), victim_postcodes(self.data))
+        self.assertEqual(self.db_service.get_digital_vs_finalisation_pairs(), digital_vs_finalisation_pairs(self.data))
+
+    def test_value_lists_hold_python_scalars(self):
+        for values in (self.db_service.get_victim_ages(), self.db_service.get_victim_ethnicities(),
+                       self.db_service.get_victim_postcodes()):
+            self.assertIsInstance(values, list)
+            self.assertTrue(all(type(value) in (int, str) for value in values))
+
+    def test_age_counts(self):
+        expected = Counter(victim_ages(self.data))
+        counts = self.db_service.get_age_counts()
+        self.assertEqual(counts, dict(expected))
+        self.assertEqual(list(counts), sorted(expected))
+
+    def test_ethnicity_and_postcode_counts(self):
+        # Same totals, listed in the order each value first appears
+        self.assertEqual(list(self.db_service.get_ethnicity_counts().items()),
+                         list(Counter(victim_ethnicities(self.data)).items()))
+        self.assertEqual(list(self.db_service.get_postcode_counts().items()),
+                         list(Counter(victim_postcodes(self.data)).items()))
+
+    def test_pair_counts(self):
+        counts = self.db_service.get_digital_vs_finalisation_counts()
+        self.assertEqual([(digital, finalisation) for digital, finalisation, _ in counts],
+                         list(Counter(digital_vs_finalisation_pairs(self.data))))
+        self.assertEqual({(digital, finalisation): count for digital, finalisation, count in counts},
+                         dict(Counter(digital_vs_finalisation_pairs(self.data))))
+
+    def test_correlation(self):
+        self.assertEqual(self.db_service.get_finalisation_vs_digital_correlation(),
+                         finalisation_vs_digital_correlation(self.data))
+
+
+class AwkwardValueParityTests(EngineParityMixin, unittest.TestCase):
+    cases = awkward_cases()
+
+
+class RepeatedRefParityTests(EngineParityMixin, unittest.TestCase):
+    """Several documents per ref, some without victims, in an order unlike the ref order"""
+    cases = {str(doc_id): make_case(f"BPORT/{doc_id % 3:03d}/2025",
+                                    [(doc_id % 130 - 5, f"W{doc_id % 4}", f"NR{doc_id % 7} {doc_id % 9}AA")]
+                                    * (doc_id % 3),
+                                    finalisation=doc_id % 5, digital=doc_id % 2)
+             for doc_id in range(40, 0, -1)}
+
+
+class EmptyDatabaseParityTests(EngineParityMixin, unittest.TestCase):
+    cases: Dict[str, Dict[str, Any]] = {}
+
+
+if __name__ == "__main__":
+    unittest.main()
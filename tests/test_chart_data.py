@@ -0,0 +1,31 @@
+# tests/test_chart_data.py - Client-side chart series match what the PNG charts draw
+
+import unittest
+
+import numpy as np
+
+from chart_data import histogram_series, vega_lite_spec
+
+
+class HistogramSeriesTests(unittest.TestCase):
+    def test_bins_match_the_png_histogram(self):
+        age_counts = {9: 1, 10: 2, 12: 2, 14: 1, 15: 2, 16: 1}
+        # The PNG draws ax.hist with one bin per integer in range(min, max + 2)
+        counts, edges = np.histogram(list(age_counts), bins=range(9, 18), weights=list(age_counts.values()))
+        series = histogram_series(age_counts)
+        self.assertEqual([point["value"] for point in series], edges[:-1].tolist())
+        self.assertEqual([point["count"] for point in series], counts.astype(int).tolist())
+        self.assertEqual(series[2], {"value": 11, "count": 0})
+
+    def test_single_and_empty(self):
+        self.assertEqual(histogram_series({30: 4}), [{"value": 30, "count": 4}])
+        self.assertEqual(histogram_series({}), [])
+
+    def test_spec_reads_every_bin(self):
+        encoding = vega_lite_spec("histogram", "Victim ages", "Age", "Victims")["encoding"]
+        self.assertEqual(encoding["x"]["field"], "value")
+        self.assertEqual(encoding["y"]["field"], "count")
+
+
+if __name__ == "__main__":
+    unittest.main()
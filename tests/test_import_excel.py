@@ -0,0 +1,116 @@
+# tests/test_import_excel.py - Incremental re-imports update only the cases that changed
+
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+from typing import Any, Dict, List, Sequence
+
+import openpyxl
+
+from config import Fields
+from import_excel import import_excel_to_db
+from storage import get_storage
+
+MAIN_HEADERS = [Fields.BEACONPORT_REF, Fields.ALLOCATED_TO, Fields.FORCE_CODE]
+VICTIM_HEADERS = [Fields.BEACONPORT_REF, Fields.VICTIM_AGE, Fields.VICTIM_ETHNICITY]
+
+# BPORT/002 appears twice in the main sheet, so its cases are matched by (ref, occurrence)
+FIRST_MAIN = [["BPORT/001", "Jack Bauer", 36], ["BPORT/002", "Chloe O'Brian", 36],
+              ["BPORT/002", "Chloe O'Brian", 37], ["BPORT/003", "Tony Almeida", 38]]
+FIRST_VICTIMS = [["BPORT/001", 15, "W1"], ["BPORT/002", 30, "B2"], ["BPORT/003", 44, "A1"]]
+
+# BPORT/001 changes in a linked sheet, BPORT/003 is removed and BPORT/004 is added
+SECOND_MAIN = [["BPORT/001", "Jack Bauer", 36], ["BPORT/002", "Chloe O'Brian", 36],
+               ["BPORT/002", "Chloe O'Brian", 37], ["BPORT/004", "Kim Bauer", 36]]
+SECOND_VICTIMS = [["BPORT/001", 16, "W1"], ["BPORT/002", 30, "B2"], ["BPORT/004", 21, "W2"]]
+
+
+def write_workbook(path: str, main: Sequence[Sequence[Any]], victims: Sequence[Sequence[Any]]) -> str:
+    wb = openpyxl.Workbook()
+    sheet = wb.active
+    sheet.title = "Beaconport Main"
+    for row in [MAIN_HEADERS, *main]:
+        sheet.append(row)
+    sheet = wb.create_sheet("Victim Details")
+    for row in [VICTIM_HEADERS, *victims]:
+        sheet.append(row)
+    wb.save(path)
+    return path
+
+
+class IncrementalImportMixin:
+    filename: str
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.directory, self.filename)
+        self.first = write_workbook(os.path.join(self.directory, "first.xlsx"), FIRST_MAIN, FIRST_VICTIMS)
+        self.second = write_workbook(os.path.join(self.directory, "second.xlsx"), SECOND_MAIN, SECOND_VICTIMS)
+
+    def run_import(self, path: str, incremental: bool) -> Dict[str, Any]:
+        with contextlib.redirect_stdout(io.StringIO()):
+            return import_excel_to_db(path, self.db_path, incremental=incremental, binary_snapshot=False)
+
+    def cases(self) -> Dict[str, Dict[str, Any]]:
+        return get_storage(self.db_path).load_cases()
+
+    @staticmethod
+    def summarise(cases: Dict[str, Dict[str, Any]]) -> List[tuple]:
+        """(doc_id, ref, force code, victim ages) per case, in doc_id order"""
+        return [(doc_id, case["main"][Fields.BEACONPORT_REF], case["main"][Fields.FORCE_CODE],
+                 [victim[Fields.VICTIM_AGE] for victim in case["victim_details"]])
+                for doc_id, case in sorted(cases.items(), key=lambda item: int(item[0]))]
+
+    def test_reimport_with_changed_added_and_removed_cases(self):
+        summary = self.run_import(self.first, incremental=False)
+        self.assertEqual(summary["cases_inserted"], 4)
+        before = self.cases()
+        self.assertEqual(self.summarise(before), [("1", "BPORT/001", 36, [15]), ("2", "BPORT/002", 36, [30]),
+                                                  ("3", "BPORT/002", 37, [30]), ("4", "BPORT/003", 38, [44])])
+
+        summary = self.run_import(self.second, incremental=True)
+        self.assertTrue(summary["db_written"])
+        self.assertEqual(summary["cases_inserted"], 1)
+        self.assertEqual(summary["changes"], {"added": 1, "updated": 1, "removed": 1, "unchanged": 2,
+                                              "changed_refs": ["BPORT/001", "BPORT/004", "BPORT/003"]})
+        self.assertEqual(summary["dataset"]["case_count"], 3)
+        self.assertEqual(summary["dataset"]["victim_count"], 4)
+
+        after = self.cases()
+        # Updated and unchanged cases keep their doc_id; the new case gets the next free one
+        self.assertEqual(self.summarise(after), [("1", "BPORT/001", 36, [16]), ("2", "BPORT/002", 36, [30]),
+                                                 ("3", "BPORT/002", 37, [30]), ("5", "BPORT/004", 36, [21])])
+        self.assertEqual(after["2"], before["2"])
+        self.assertEqual(after["3"], before["3"])
+
+    def test_unchanged_reimport_leaves_the_database_alone(self):
+        self.run_import(self.first, incremental=False)
+        modified = os.path.getmtime(self.db_path)
+        before = self.cases()
+        summary = self.run_import(self.first, incremental=True)
+        self.assertFalse(summary["db_written"])
+        self.assertEqual(summary["changes"], {"added": 0, "updated": 0, "removed": 0, "unchanged": 4,
+                                              "changed_refs": []})
+        self.assertEqual(os.path.getmtime(self.db_path), modified)
+        self.assertEqual(self.cases(), before)
+
+    def test_full_reimport_replaces_every_case(self):
+        self.run_import(self.first, incremental=False)
+        summary = self.run_import(self.second, incremental=False)
+        self.assertNotIn("changes", summary)
+        self.assertEqual([(ref, ages) for _, ref, _, ages in self.summarise(self.cases())],
+                         [("BPORT/001", [16]), ("BPORT/002", [30]), ("BPORT/002", [30]), ("BPORT/004", [21])])
+
+
+class JsonIncrementalImportTests(IncrementalImportMixin, unittest.TestCase):
+    filename = "beaconport_db.json"
+
+
+class SqliteIncrementalImportTests(IncrementalImportMixin, unittest.TestCase):
+    filename = "beaconport_db.sqlite3"
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+# tests/test_profiling.py - Token checks guarding chart profiling and /admin/profiles
+
+import cProfile
+import tempfile
+import unittest
+from unittest import mock
+
+from flask import Flask
+
+import profiling
+
+TOKEN = "s3cret"
+
+
+class TokenCheckTests(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch.dict(profiling.PROFILING, {"enabled": False, "token": TOKEN})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_matching_token_is_accepted(self):
+        self.assertTrue(profiling.profile_requested({"profile": TOKEN}))
+
+    def test_non_ascii_profile_value_is_rejected(self):
+        self.assertFalse(profiling.profile_requested({"profile": "s3crét"}))
+        self.assertFalse(profiling.profile_requested({"profile": "☃"}))
+
+    def test_non_ascii_configured_token(self):
+        with mock.patch.dict(profiling.PROFILING, {"token": "clé"}):
+            self.assertTrue(profiling.profile_requested({"profile": "clé"}))
+            self.assertFalse(profiling.profile_requested({"profile": "cle"}))
+
+    def test_non_ascii_admin_token_is_rejected(self):
+        with mock.patch.object(profiling, "PROFILING_AVAILABLE", True):
+            self.assertFalse(profiling.admin_allowed({"token": "s3crét"}, "127.0.0.1"))
+            self.assertTrue(profiling.admin_allowed({"token": TOKEN}, "203.0.113.5"))
+
+    def test_profiled_route_serves_non_ascii_token_unprofiled(self):
+        app = Flask(__name__)
+        with mock.patch.object(profiling, "PROFILING_AVAILABLE", True):
+            app.add_url_rule("/chart", "chart", profiling.profiled_route(lambda: "ok"))
+        response = app.test_client().get("/chart", query_string={"profile": "s3crét"})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("X-Profile", response.headers)
+
+
+class ProfiledRouteTests(unittest.TestCase):
+    def setUp(self):
+        patchers = [mock.patch.dict(profiling.PROFILING, {"enabled": False, "token": TOKEN}),
+                    mock.patch.object(profiling, "PROFILING_AVAILABLE", True),
+                    mock.patch.object(profiling.profile_store, "directory", tempfile.mkdtemp())]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.app = Flask(__name__)
+        self.app.add_url_rule("/chart", "chart", profiling.profiled_route(lambda: "ok"))
+        self.app.add_url_rule("/admin/profiles/<profile_id>", "admin_profile", lambda profile_id: profile_id)
+        self.client = self.app.test_client()
+
+    def test_profiled_request_links_its_profile(self):
+        response = self.client.get("/chart", query_string={"profile": TOKEN})
+        self.assertEqual(response.status_code, 200)
+        profile_id = response.headers["X-Profile"].rsplit("/", 1)[-1]
+        self.assertEqual(profiling.profile_store.list()[0].id, profile_id)
+
+    def test_busy_profiler_serves_the_view_unprofiled(self):
+        # An earlier profile on this thread must not be linked from the unprofiled response
+        self.client.get("/chart", query_string={"profile": TOKEN})
+        with mock.patch.object(cProfile.Profile, "enable", side_effect=ValueError("profiler active")):
+            response = self.client.get("/chart", query_string={"profile": TOKEN})
+            result, record = profiling.profile_call("busy", lambda: 42)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_data(as_text=True), "ok")
+        self.assertNotIn("X-Profile", response.headers)
+        self.assertEqual((result, record), (42, None))
+        self.assertEqual(len(profiling.profile_store.list()), 1)
+
+    def test_nested_call_joins_the_outer_profile(self):
+        result, record = profiling.profile_call("outer", lambda: profiling.profile_call("inner", lambda: 7))
+        self.assertEqual(result, (7, None))
+        self.assertEqual(record.name, "outer")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,139 @@
+# tests/test_singleflight.py - Coalescing of concurrent identical chart renders and geocode lookups
+
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from chart_cache import ChartCache
+from geocode_service import GeocodeBackend, GeocodeService
+from geocode_store import GeocodeStore
+from singleflight import SingleFlight
+
+THREADS = 8
+TIMEOUT = 5
+
+
+def wait_until(condition) -> None:
+    deadline = time.monotonic() + TIMEOUT
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("timed out waiting for the other callers to join the flight")
+        time.sleep(0.001)
+
+
+def run_concurrently(target, count: int = THREADS) -> None:
+    threads = [threading.Thread(target=target) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(TIMEOUT)
+
+
+class SingleFlightTests(unittest.TestCase):
+    def test_concurrent_callers_share_one_call(self):
+        flight = SingleFlight()
+        calls = []
+        results = []
+
+        def fn():
+            calls.append(1)
+            # Hold the flight open until every other caller is waiting on it
+            wait_until(lambda: flight.coalesced == THREADS - 1)
+            return object()
+
+        run_concurrently(lambda: results.append(flight.do("key", fn)))
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(len(results), THREADS)
+        self.assertTrue(all(result is results[0] for result in results))
+        self.assertEqual(flight.stats(), {"calls": 1, "coalesced": THREADS - 1, "in_flight": 0})
+
+    def test_leader_error_reaches_every_waiter(self):
+        flight = SingleFlight()
+        error = ValueError("render failed")
+        caught = []
+
+        def fn():
+            wait_until(lambda: flight.coalesced == THREADS - 1)
+            raise error
+
+        def call():
+            try:
+                flight.do("key", fn)
+            except ValueError as e:
+                caught.append(e)
+
+        run_concurrently(call)
+        self.assertEqual(len(caught), THREADS)
+        self.assertTrue(all(e is error for e in caught))
+
+    def test_finished_flight_is_forgotten(self):
+        flight = SingleFlight()
+        self.assertEqual(flight.do("key", lambda: 1), 1)
+        self.assertEqual(flight.in_flight(), 0)
+        self.assertEqual(flight.do("key", lambda: 2), 2)
+        with self.assertRaises(KeyError):
+            flight.do("key", lambda: {}["missing"])
+        self.assertEqual(flight.do("key", lambda: 3), 3)
+        self.assertEqual(flight.stats(), {"calls": 4, "coalesced": 0, "in_flight": 0})
+
+
+class ChartCacheCoalescingTests(unittest.TestCase):
+    def test_concurrent_misses_render_once(self):
+        cache = ChartCache()
+        renders = []
+        entries = []
+
+        def render():
+            renders.append(1)
+            wait_until(lambda: cache.stats()["coalesced"] == THREADS - 1)
+            return b"png"
+
+        run_concurrently(lambda: entries.append(cache.get_or_render("key", render)))
+        self.assertEqual(len(renders), 1)
+        self.assertEqual(len(entries), THREADS)
+        self.assertTrue(all(entry is entries[0] for entry in entries))
+        stats = cache.stats()
+        self.assertEqual((stats["coalesced"], stats["misses"], stats["entries"]), (THREADS - 1, THREADS, 1))
+        self.assertIs(cache.get_or_render("key", render), entries[0])
+        self.assertEqual(len(renders), 1)
+
+    def test_entry_stored_after_the_miss_is_not_rendered_again(self):
+        cache = ChartCache()
+        stored = cache.put("key", b"png")
+        render = mock.Mock(return_value=b"other")
+        # get() missed just before another render stored the entry
+        with mock.patch.object(cache, "get", return_value=None):
+            entry = cache.get_or_render("key", render)
+        self.assertIs(entry, stored)
+        render.assert_not_called()
+        self.assertEqual((cache.hits, cache.misses), (0, 0))
+
+
+class GeocodeCoalescingTests(unittest.TestCase):
+    def test_concurrent_identical_lookups_reach_the_backend_once(self):
+        service = None
+        lookups = []
+
+        class SlowBackend(GeocodeBackend):
+            name = "slow"
+            remote = True
+
+            def lookup_many(self, postcodes):
+                lookups.append(list(postcodes))
+                wait_until(lambda: service.coalesced_lookups == THREADS - 1)
+                return {pc: (1.0, 52.0) for pc in postcodes}
+
+        directory = tempfile.mkdtemp()
+        store = GeocodeStore(os.path.join(directory, "cache.sqlite3"), negative_ttl=3600)
+        service = GeocodeService([SlowBackend()], store)
+        results = []
+        run_concurrently(lambda: results.append(service.resolve(["nr2 2nn", "IP1 1AA"])))
+        self.assertEqual(lookups, [["NR2 2NN", "IP1 1AA"]])
+        self.assertEqual(results, [{"NR2 2NN": (1.0, 52.0), "IP1 1AA": (1.0, 52.0)}] * THREADS)
+
+
+if __name__ == "__main__":
+    unittest.main()
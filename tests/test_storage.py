@@ -0,0 +1,112 @@
+# tests/test_storage.py - The SQLite backend answers every filter exactly like the JSON one
+
+import os
+import unittest
+from collections.abc import Mapping
+from datetime import date
+from typing import Any, Dict, List
+
+from case_filters import EXACT_FILTERS, CaseFilter
+from case_fixtures import awkward_cases, make_case, write_database
+from database_service import DatabaseService
+from storage import SqliteStorage, migrate
+
+FORCE_CODES = [36, "36", 37, 38.0, " 39 "]
+OFFENCE_TYPES = ["Rape", "rape ", "Burglary", "Robbery", None]
+OFFICERS = ["Jack Bauer", "Chloe O'Brian", "JACK BAUER", "Tony Almeida"]
+DATE_RANGES = [
+    ("2014-05-02", "2014-05-02"),  # a single day, inclusive at both ends
+    ("2014-05-03", None),
+    (None, "2015-06-01"),
+    ("2015-01-01", "2019-12-31"),
+    ("2021-01-01", "2021-01-01"),  # includes an offence timed 12:30 that day
+    ("2030-01-01", None),  # matches nothing
+]
+
+
+def fixture_cases() -> Dict[str, Dict[str, Any]]:
+    """The awkward cases plus a spread of forces, offence types, officers and dates"""
+    cases = awkward_cases()
+    for n in range(1, 41):
+        cases[str(100 + n)] = make_case(
+            f"BPORT/{100 + n % 25:03d}/2025",
+            [(n % 90, f"W{n % 3}", f"NR{n % 6} {n % 4}AB")] * (n % 4),
+            force_code=FORCE_CODES[n % len(FORCE_CODES)],
+            allocated_to=OFFICERS[n % len(OFFICERS)],
+            offence_type=OFFENCE_TYPES[n % len(OFFENCE_TYPES)],
+            offence_date=f"{2010 + n % 12}-{n % 12 + 1:02d}-{n % 27 + 1:02d} 00:00:00",
+            finalisation=n % 6, digital=n % 3)
+    return cases
+
+
+def thaw(value: Any) -> Any:
+    """Plain dicts and lists from a read-only snapshot"""
+    if isinstance(value, Mapping):
+        return {key: thaw(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [thaw(item) for item in value]
+    return value
+
+
+def comparable(db_service: DatabaseService, case_filter: CaseFilter) -> Dict[str, Any]:
+    """Filtered aggregates and counts, without the backend-specific data version"""
+    tables = db_service.get_filtered_aggregates(case_filter).to_json()
+    del tables["version"]
+    return {**tables, "counts": db_service.get_filtered_counts(case_filter)}
+
+
+class BackendParityTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        json_path = write_database(fixture_cases())
+        sqlite_path = os.path.join(os.path.dirname(json_path), "beaconport_db.sqlite3")
+        cls.migrated = migrate(json_path, sqlite_path)
+        cls.json_service = DatabaseService(json_path)
+        cls.sqlite_service = DatabaseService(sqlite_path)
+
+    def assert_same(self, case_filter: CaseFilter) -> None:
+        with self.subTest(case_filter=case_filter.to_params()):
+            self.assertEqual(comparable(self.sqlite_service, case_filter),
+                             comparable(self.json_service, case_filter))
+
+    def filters(self) -> List[CaseFilter]:
+        filters = [CaseFilter()]
+        options = self.json_service.get_filter_options()
+        for name in EXACT_FILTERS:
+            values = options[name] + [f"  {value.upper()} " for value in options[name]] + ["no such value"]
+            filters += [CaseFilter(**{name: value}) for value in values]
+        for date_from, date_to in DATE_RANGES:
+            filters.append(CaseFilter.from_args({"date_from": date_from or "", "date_to": date_to or ""}))
+        filters.append(CaseFilter(force_code="36", offence_type="rape", date_to=date(2016, 1, 1)))
+        filters.append(CaseFilter(allocated_to="jack bauer", date_from=date(2014, 5, 2)))
+        return filters
+
+    def test_backends(self):
+        self.assertIsInstance(self.sqlite_service.storage, SqliteStorage)
+        self.assertTrue(self.sqlite_service.storage.supports_queries)
+        self.assertFalse(self.json_service.storage.supports_queries)
+        self.assertEqual(self.migrated, len(fixture_cases()))
+
+    def test_every_filter_matches(self):
+        filters = self.filters()
+        self.assertGreater(len(filters), 20)
+        for case_filter in filters:
+            self.assert_same(case_filter)
+
+    def test_filters_select_cases(self):
+        # Guard against both backends agreeing on nothing
+        counts = {self.json_service.get_filtered_counts(case_filter)[0] for case_filter in self.filters()[1:]}
+        self.assertIn(0, counts)
+        self.assertGreater(len(counts), 3)
+
+    def test_migrated_documents_round_trip(self):
+        expected = {doc_id: {key: [value] if key != "main" and isinstance(value, dict) else value
+                             for key, value in case.items()}
+                    for doc_id, case in thaw(self.json_service.get_data()["cases"]).items()}
+        self.assertIsInstance(expected["8"]["victim_details"], list)  # a single-record sheet comes back as a list
+        self.assertEqual(thaw(self.sqlite_service.get_data()["cases"]), expected)
+        self.assertEqual(self.sqlite_service.get_dataset_counts(), self.json_service.get_dataset_counts())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,12 +1,46 @@
 # utils.py - Utility functions and decorators
 
 import functools
+import importlib
+import io
 import os
-import sys
-import subprocess
-from flask import send_file
-from chart_service import ChartService
-from config import EXCEL_FILE
+import time
+from typing import Dict, Optional
+from flask import make_response, request, send_file
+from case_filters import CaseFilter
+from chart_cache import CHART_REGISTRY, ChartRegistration, chart_cache
+from chart_warmup import chart_warmup
+from chart_figures import output_profile
+from config import BINARY_SNAPSHOT, DB_PATH, EXCEL_FILE, METRICS
+from database_service import DatabaseService
+from db_snapshot import get_snapshot
+from geocode_service import get_geocode_service
+from import_jobs import ImportJobRunner
+from metrics import MetricFamily, cache_families, exposition, metrics, request_trace, server_timing
+from profiling import PROFILING_AVAILABLE, profile_call, profiling_active
+from render_pool import render_pool
+
+def instrumented_route(view):
+    """Decorator recording a route's latency, status and response size in the metrics registry.
+
+    Spans recorded while the view runs are added as a Server-Timing header when
+    METRICS['server_timing'] is on or the request asks for it with ?timing=1.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        with request_trace() as trace:
+            try:
+                response = make_response(view(*args, **kwargs))
+            except Exception:
+                metrics.observe_request(view.__name__, 500, time.perf_counter() - start, 0)
+                raise
+        seconds = time.perf_counter() - start
+        metrics.observe_request(view.__name__, response.status_code, seconds, response.content_length or 0)
+        if METRICS['server_timing'] or request.args.get("timing") == "1":
+            response.headers["Server-Timing"] = server_timing(trace, seconds)
+        return response
+    return wrapper
 
 
 def safe_chart_route(chart_function):
@@ -17,11 +51,79 @@ def safe_chart_route(chart_function):
             return chart_function(*args, **kwargs)
         except Exception as e:
             print(f"Chart generation error in {chart_function.__name__}: {e}")
+            from chart_service import ChartService
             error_chart = ChartService.create_error_chart(str(e))
             return send_file(error_chart, mimetype='image/png')
     return wrapper
 
 
+def cached_chart(kind: str, profile: str = 'chart', **chart_params):
+    """Decorator serving a chart route from the rendered-PNG cache.
+
+    profile names the CHART_PROFILES entry the chart is rendered with. The cache
+    key covers the database version, chart kind, output profile, chart_params and
+    the case filter from the query string. chart_params, case_filter and the
+    OutputProfile are passed to the wrapped function, which returns a PNG buffer. Responses carry
+    ETag/Last-Modified so repeat views can be answered with 304.
+    """
+    def decorator(chart_function):
+        registration = ChartRegistration(kind, chart_function, output_profile(profile), chart_params)
+        CHART_REGISTRY[kind] = registration
+
+        @functools.wraps(chart_function)
+        def wrapper(**kwargs):
+            snapshot = get_snapshot(DB_PATH)
+            case_filter = CaseFilter.from_args(request.args)
+            key = registration.cache_key(snapshot.version, case_filter.to_params())
+
+            # A profiled request always renders, so the profile shows the work being measured
+            if PROFILING_AVAILABLE and profiling_active():
+                entry = chart_cache.put(key, registration.render_png(case_filter=case_filter, **kwargs))
+            # The ETag is the cache key, so a matching client needs no render at all
+            elif request.if_none_match.contains(key):
+                response = make_response('', 304)
+                response.set_etag(key)
+                return response
+            else:
+                entry = chart_cache.get_or_render(
+                    key, lambda: registration.render_png(case_filter=case_filter, **kwargs))
+            return send_file(io.BytesIO(entry.png), mimetype='image/png',
+                             etag=entry.etag, last_modified=snapshot.mtime,
+                             conditional=True)
+        return wrapper
+    return decorator
+
+
+def warm_up(db_service) -> Dict[str, float]:
+    """Load the heavy libraries and data ahead of the first chart request.
+
+    Charts otherwise pay for pandas, the analytics engine, the aggregates and
+    the matplotlib/cartopy render workers on first use. Returns seconds per step.
+    """
+    def load_charts():
+        if render_pool.enabled:
+            render_pool.start()
+        else:
+            importlib.import_module('chart_service')
+
+    steps = [
+        ('analytics', db_service.get_engine),
+        ('aggregates', db_service.get_aggregates),
+        ('geocoding', get_geocode_service),
+        ('charts', load_charts),
+    ]
+    timings = {}
+    for name, step in steps:
+        start = time.perf_counter()
+        try:
+            step()
+        except Exception as e:
+            print(f"Warm-up step {name} failed: {e}")
+        timings[name] = round(time.perf_counter() - start, 3)
+    print(f"Warm-up finished: {timings}")
+    return timings
+
+
 def validate_excel_file(filename: str = EXCEL_FILE) -> tuple[bool, str]:
     """Validate that the Excel file exists and is readable"""
     if not os.path.exists(filename):
@@ -41,37 +143,50 @@ def validate_excel_file(filename: str = EXCEL_FILE) -> tuple[bool, str]:
         return False, f"Error validating file: {str(e)}"
 
 
-def run_excel_import(excel_file: str = EXCEL_FILE) -> tuple[bool, str]:
-    """Run the Excel import script with proper error handling"""
+def run_excel_import(excel_file: str = EXCEL_FILE, incremental: bool = False,
+                     progress=None, profile: bool = False) -> tuple[bool, str]:
+    """Run the Excel import in-process with proper error handling (under cProfile if profile)"""
     # Validate file first
     is_valid, validation_msg = validate_excel_file(excel_file)
     if not is_valid:
         return False, validation_msg
     
     try:
-        # Check if import script exists
-        import_script = "import_excel.py"
-        if not os.path.exists(import_script):
-            return False, f"Import script '{import_script}' not found"
-        
-        # Run the import
-        result = subprocess.run(
-            [sys.executable, import_script, excel_file],
-            capture_output=True,
-            text=True,
-            timeout=300  # 5 minute timeout
-        )
-        
-        if result.returncode == 0:
-            return True, "Excel data successfully imported!"
+        # openpyxl and pandas are only needed once an import actually runs
+        from import_excel import import_excel_to_db
+        import_kwargs = dict(db_path=DB_PATH, incremental=incremental, progress=progress,
+                             binary_snapshot=BINARY_SNAPSHOT)
+        if profile:
+            summary, _ = profile_call("import_excel_to_db", import_excel_to_db, excel_file,
+                                      detail=excel_file, **import_kwargs)
         else:
-            error_msg = result.stderr if result.stderr else "Unknown error occurred"
-            return False, f"Import failed: {error_msg}"
-            
-    except subprocess.TimeoutExpired:
-        return False, "Import timed out after 5 minutes"
+            summary = import_excel_to_db(excel_file, **import_kwargs)
     except Exception as e:
-        return False, f"Error running import: {str(e)}"
+        return False, f"Import failed: {str(e)}"
+    
+    if summary.get("db_written", True):
+        # Rendered charts belong to the old data version
+        get_snapshot(DB_PATH).invalidate()
+        chart_cache.clear()
+        # Materialise the aggregate tables once, before any chart asks for them
+        DatabaseService(DB_PATH).get_aggregates()
+        # Pre-render every chart so the first page view is served warm
+        chart_warmup.start()
+    return True, describe_import(summary)
+
+
+def describe_import(summary: dict) -> str:
+    """Build the success message for an import summary"""
+    changes = summary.get("changes")
+    if not changes:
+        return "Excel data successfully imported!"
+    return (f"Excel data successfully imported! {changes['added']} added, "
+            f"{changes['updated']} updated, {changes['removed']} removed, "
+            f"{changes['unchanged']} unchanged.")
+
+
+# Background runner for imports started from the web UI
+import_runner = ImportJobRunner(run_excel_import)
 
 
 def format_flash_message(success: bool, message: str) -> str:
@@ -97,11 +212,14 @@ def clean_string(value) -> str:
     return str(value).strip()
 
 
-def get_app_stats(db_service) -> dict:
-    """Get application statistics for display"""
+def get_app_stats(db_service, case_filter: Optional[CaseFilter] = None) -> dict:
+    """Get application statistics for display (for the filtered cases, if a filter is given)"""
     try:
-        case_count = db_service.get_case_count()
-        victim_count = len(db_service.get_all_victims())
+        if case_filter is not None and not case_filter.is_empty():
+            case_count, victim_count = db_service.get_filtered_counts(case_filter)
+        else:
+            case_count = db_service.get_case_count()
+            victim_count = db_service.get_victim_count()
         
         return {
             'case_count': case_count,
@@ -114,4 +232,29 @@ def get_app_stats(db_service) -> dict:
             'case_count': 0,
             'victim_count': 0,
             'has_data': False
-        }
\ No newline at end of file
+        }
+
+def get_metrics_text(db_service) -> str:
+    """Prometheus text for the request/stage metrics plus the cache and render-pool counters"""
+    snapshot = get_snapshot(db_service.db_path).stats()
+    cache = chart_cache.stats()
+    geocode_service = get_geocode_service()
+    geocode = geocode_service.store.stats()
+    pool = render_pool.stats()
+    families = metrics.families()
+    families += cache_families("beaconport_chart_cache", "Rendered chart cache", cache['hits'], cache['misses'])
+    families += cache_families("beaconport_db_snapshot", "Database snapshot", snapshot['hits'],
+                               snapshot['misses'] + snapshot['reloads'])
+    families += cache_families("beaconport_geocode_cache", "Postcode geocode cache",
+                               geocode['hits'], geocode['misses'])
+    families.append(MetricFamily("beaconport_chart_cache_bytes", "gauge", "PNG bytes held in the chart cache",
+                                 [("", {}, cache['bytes'])]))
+    families.append(MetricFamily("beaconport_coalesced_total", "counter",
+                                 "Requests that shared an identical in-flight computation, by kind",
+                                 [("", {"kind": "chart_render"}, cache['coalesced']),
+                                  ("", {"kind": "geocode"}, geocode_service.coalesced_lookups)]))
+    families.append(MetricFamily("beaconport_render_pool_renders_total", "counter",
+                                 "Charts rendered by the render pool, by outcome",
+                                 [("", {"outcome": outcome}, pool[key]) for outcome, key in
+                                  (("ok", "renders"), ("error", "errors"), ("timeout", "timeouts"))]))
+    return exposition(families)